@@ -3,12 +3,46 @@
 
 import os
 import json
+import time
 import logging
 import requests
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Product details are cached across invocations of a warm Lambda container since
+# product documents rarely change. Products that could not be found are cached too.
+PRODUCT_CACHE_TTL = int(os.environ.get('product_cache_ttl', 300))
+PRODUCT_CACHE_MAX_SIZE = int(os.environ.get('product_cache_max_size', 5000))
+
+product_cache = {}
+
+def get_product(products_service_host, item_id):
+    ''' Returns product details for an item ID (or None if not found), reading through product_cache '''
+    now = time.time()
+    entry = product_cache.get(item_id)
+    if entry and entry[1] > now:
+        return entry[0]
+
+    url = f'http://{products_service_host}/products/id/{item_id}?fullyQualifyImageUrls=1'
+    response = requests.get(url)
+
+    if response.ok:
+        product = response.json()
+    elif response.status_code == 404:
+        product = None
+    else:
+        logger.error(response)
+        return None
+
+    if len(product_cache) >= PRODUCT_CACHE_MAX_SIZE:
+        # Drop the oldest entry (dicts preserve insertion order).
+        product_cache.pop(next(iter(product_cache)))
+    product_cache.pop(item_id, None)
+    product_cache[item_id] = (product, now + PRODUCT_CACHE_TTL)
+
+    return product
+
 def lambda_handler(event, context):
     ''' Called by Amazon Pinpoint recommender to customize/enrich recommendations
 
@@ -52,11 +86,9 @@ def lambda_handler(event, context):
                 for idx, item_id in enumerate(recommended_items):
                     logger.debug('Looking up product information for product ' + item_id)
                     
-                    url = f'http://{products_service_host}/products/id/{item_id}?fullyQualifyImageUrls=1'
-                    response = requests.get(url)
-                    
-                    if response.ok:
-                        product = response.json()
+                    product = get_product(products_service_host, item_id)
+
+                    if product:
                         logger.debug(product)
                         
                         recommendations['Name'][idx] = product['name']
@@ -67,7 +99,7 @@ def lambda_handler(event, context):
                         recommendations['Price'][idx] = '$ {}'.format(product['price'])
                         recommendations['ImageURL'][idx] = product['image']
                     else:
-                        logger.error(response)
+                        logger.error('Product information not available for product ' + item_id)
                         
                 endpoint['Recommendations'] = recommendations
                 new_endpoints[key] = endpoint
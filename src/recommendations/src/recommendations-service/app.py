@@ -4,10 +4,21 @@
 from flask import Flask, jsonify, Response
 from flask import request
 from flask_cors import CORS
+from experimentation import catalog, experiment_optimizely, tracking
+from experimentation.cache import LRUCache, NOT_FOUND
+from experimentation.concurrency import batch_fan_out
+from experimentation.counters import counter_aggregator
+from experimentation.discovery import service_discovery
 from experimentation.experiment_manager import ExperimentManager
-from experimentation.resolvers import DefaultProductResolver, PersonalizeRecommendationsResolver, PersonalizeRankingResolver, RankingProductsNoOpResolver
+from experimentation.http_client import http_client
+from experimentation.personalize_cache import personalize_cache
+from experimentation.parameters import parameter_store, DEFAULT_PARAMETER_NAMES
+from experimentation.resolvers import ResolverFactory, EnsembleResolver, FallbackChainResolver, BATCH_CONCURRENCY
+from experimentation.resolvers import PersonalizeRecommendationsResolver, PersonalizeRankingResolver
+from experimentation.products import product_cache, product_cache_key, product_hydrator
 from experimentation.utils import CompatEncoder
 
+import functools
 import json
 import os, sys
 import pprint
@@ -15,18 +26,29 @@ import boto3
 import logging
 import requests
 
-servicediscovery = boto3.client('servicediscovery')
 personalize = boto3.client('personalize')
-ssm = boto3.client('ssm')
 
 # SSM parameter name for the Personalize filter for purchased items
 filter_purchased_param_name = 'retaildemostore-personalize-filter-purchased-arn'
 
+# Recipe ARNs by campaign ARN. A campaign's recipe only changes when the campaign is
+# redeployed so these are cached for a long time (see invalidate_recipes).
+recipe_cache = LRUCache(
+    max_size = 256,
+    ttl = float(os.environ.get('RECIPE_CACHE_TTL', 3600)),
+    negative_ttl = 300
+)
+
 # -- Shared Functions
 
 def get_recipe(campaign_arn):
     """ Returns the Amazon Personalize recipe ARN for the specified campaign ARN """
-    recipe = None
+    recipe = recipe_cache.get(campaign_arn)
+    if recipe is NOT_FOUND:
+        return None
+    if recipe is not None:
+        return recipe
+
     response = personalize.describe_campaign(campaignArn = campaign_arn)
 
     if response.get('campaign'):
@@ -34,34 +56,78 @@ def get_recipe(campaign_arn):
         if response.get('solutionVersion'):
             recipe = response['solutionVersion']['recipeArn']
 
+    if recipe:
+        recipe_cache.put(campaign_arn, recipe)
+    else:
+        recipe_cache.put_missing(campaign_arn)
+
     return recipe
 
+def invalidate_recipes(campaign_arn = None):
+    """ Removes the cached recipe for a campaign (or all campaigns), e.g. after a campaign is redeployed """
+    if campaign_arn:
+        recipe_cache.invalidate(campaign_arn)
+    else:
+        recipe_cache.clear()
+
 def get_parameter_values(names):
     """ Returns values for SSM parameters or None for params that don't exist or that have value equal 'NONE' """
     if isinstance(names, str):
         names = [ names ]
 
-    response = ssm.get_parameters(Names = names)
+    # Parameters are served from memory by the parameter store and refreshed in the background.
+    values = parameter_store.get_values(names)
 
-    values = []
+    assert len(values) == len(names), 'mismatch in number of values returned for names'
 
-    for name in names:
-        found = False
-        for param in response['Parameters']:
-            if param['Name'] == name:
-                found = True
-                if param['Value'] != 'NONE':
-                    values.append(param['Value'])
-                else:
-                    values.append(None)
-                break
+    return values
 
-        if not found:
-            values.append(None)
+# Seconds get_products waits for Personalize before falling back to the Product service; 0 waits for Personalize
+PERSONALIZE_LATENCY_BUDGET = float(os.environ.get('PERSONALIZE_LATENCY_BUDGET', 0))
 
-    assert len(values) == len(names), 'mismatch in number of values returned for names'
+def get_products_service():
+    """ Returns the (host, port) of the Products service used to hydrate recommendations """
+    # Check environment for host and port first in case we're running in a local Docker container (dev mode)
+    products_service_host = os.environ.get('PRODUCT_SERVICE_HOST')
+    products_service_port = os.environ.get('PRODUCT_SERVICE_PORT', 80)
 
-    return values
+    if not products_service_host:
+        # Get product service instance. We'll need it rehydrate product info for recommendations.
+        products_service_host = service_discovery.get_host('products')
+
+    return products_service_host, products_service_port
+
+def get_personalize_fallback_resolver(campaign_arn, filter_arn, products_service_host, products_service_port):
+    """ Returns a resolver that falls back to the Product service if Personalize does not answer within PERSONALIZE_LATENCY_BUDGET """
+    return ResolverFactory.get(ResolverFactory.TYPE_FALLBACK, name = 'personalize', budget = PERSONALIZE_LATENCY_BUDGET, resolvers = [
+        { 'type': ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS, 'name': 'personalize', 'campaign_arn': campaign_arn, 'filter_arn': filter_arn },
+        { 'type': ResolverFactory.TYPE_PRODUCT, 'name': 'product', 'products_service_host': products_service_host, 'products_service_port': products_service_port }
+    ])
+
+def format_items(items):
+    """ Prepares hydrated items for the response (in place)
+
+    The experiment correlation ID is appended to the product URL of items
+    recommended by an experiment so it gets tracked if used by the client.
+    """
+    for item in items:
+        product = item.get('product')
+
+        if product and 'experiment' in item and 'url' in product:
+            # Append the experiment correlation ID to the product URL so it gets tracked if used by client.
+            product_url = product.get('url')
+            if '?' in product_url:
+                product_url += '&'
+            else:
+                product_url += '?'
+
+            product_url += 'exp=' + item['experiment']['correlationId']
+
+            product['url'] = product_url
+
+        item.pop('itemId')
+
+    return items
 
 def get_products(feature, user_id, current_item_id, num_results, campaign_arn_param_name, user_reqd_for_campaign = False, fully_qualify_image_urls = False):
     """ Returns products given a UI feature, user, item/product.
@@ -73,20 +139,7 @@ def get_products(feature, user_id, current_item_id, num_results, campaign_arn_pa
     from the same category as the current product.
     """
 
-    # Check environment for host and port first in case we're running in a local Docker container (dev mode)
-    products_service_host = os.environ.get('PRODUCT_SERVICE_HOST')
-    products_service_port = os.environ.get('PRODUCT_SERVICE_PORT', 80)
-
-    if not products_service_host:
-        # Get product service instance. We'll need it rehydrate product info for recommendations.
-        response = servicediscovery.discover_instances(
-            NamespaceName='retaildemostore.local',
-            ServiceName='products',
-            MaxResults=1,
-            HealthStatus='HEALTHY'
-        )
-
-        products_service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4']
+    products_service_host, products_service_port = get_products_service()
 
     items = []
     resp_headers = {}
@@ -119,8 +172,20 @@ def get_products(feature, user_id, current_item_id, num_results, campaign_arn_pa
         campaign_arn = values[0]
         filter_arn = values[1]
 
-        if campaign_arn and (user_id or not user_reqd_for_campaign):
-            resolver = PersonalizeRecommendationsResolver(campaign_arn = campaign_arn, filter_arn = filter_arn)
+        if campaign_arn and (user_id or not user_reqd_for_campaign) and PERSONALIZE_LATENCY_BUDGET > 0:
+            # Fall back to the Product service if Personalize does not answer within the budget
+            resolver = get_personalize_fallback_resolver(campaign_arn, filter_arn, products_service_host, products_service_port)
+
+            items, answered_by = resolver.resolve(
+                user_id = user_id, 
+                product_id = current_item_id, 
+                num_results = num_results
+            )
+
+            if answered_by == 'personalize':
+                resp_headers['X-Personalize-Recipe'] = get_recipe(campaign_arn)
+        elif campaign_arn and (user_id or not user_reqd_for_campaign):
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS, campaign_arn = campaign_arn, filter_arn = filter_arn)
 
             items = resolver.get_items(
                 user_id = user_id, 
@@ -130,38 +195,193 @@ def get_products(feature, user_id, current_item_id, num_results, campaign_arn_pa
 
             resp_headers['X-Personalize-Recipe'] = get_recipe(campaign_arn)
         else:
-            resolver = DefaultProductResolver(products_service_host = products_service_host, products_service_port = products_service_port)
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = products_service_host, products_service_port = products_service_port)
 
             items = resolver.get_items(product_id = current_item_id, num_results = num_results)
 
-    for item in items:
-        itemId = item['itemId']
-        url = f'http://{products_service_host}:{products_service_port}/products/id/{itemId}?fullyQualifyImageUrls={fully_qualify_image_urls}'
-        response = requests.get(url)
-
-        if response.ok:
-            product = response.json()
-
-            if 'experiment' in item and 'url' in product:
-                # Append the experiment correlation ID to the product URL so it gets tracked if used by client.
-                product_url = product.get('url')
-                if '?' in product_url:
-                    product_url += '&'
-                else:
-                    product_url += '?'
+    # Fetch product details for all items concurrently (order of items is preserved).
+    failures = product_hydrator.hydrate(items, products_service_host, products_service_port, fully_qualify_image_urls)
+    if failures:
+        app.logger.warning(f'Unable to retrieve product details for {len(failures)} of {len(items)} items: {failures}')
+        resp_headers['X-Hydration-Failures'] = str(len(failures))
 
-                product_url += 'exp=' + item['experiment']['correlationId']
+    format_items(items)
 
-                product['url'] = product_url
+    resp = Response(json.dumps(items, cls=CompatEncoder), content_type = 'application/json', headers = resp_headers)
+    return resp
 
-            item.update({ 
-                'product': product
-            })
+def get_products_batch(feature, users, num_results, campaign_arn_param_name, fully_qualify_image_urls = False):
+    """ Returns products for a batch of users as a streamed response with a line of JSON per user
+
+    Arguments:
+        feature - UI feature used to look up an active experiment (optional)
+        users - list of (user_id, current_item_id) tuples
+        num_results - number of products to return for each user
+        campaign_arn_param_name - SSM parameter name of the Personalize campaign used when there is no experiment
+        fully_qualify_image_urls - whether image URLs should be fully qualified
+
+    Users are resolved through the same experiment or campaign logic as get_products,
+    but with one get_items_batch call so parameters and the experiment are looked
+    up once and resolvers with a bulk API resolve all users together. The union of
+    the recommended products is hydrated once. A user whose recommendations fail
+    gets an error line without failing the other users.
+    """
+    products_service_host, products_service_port = get_products_service()
 
-        item.pop('itemId')
+    resp_headers = {}
+    experiment = None
 
-    resp = Response(json.dumps(items, cls=CompatEncoder), content_type = 'application/json', headers = resp_headers)
-    return resp
+    if feature:
+        exp_manager = ExperimentManager()
+        experiment = exp_manager.get_active(feature)
+
+    if experiment:
+        tracker = exp_manager.default_tracker()
+
+        results, errors = experiment.get_items_batch([ {
+            'user_id': user_id,
+            'current_item_id': current_item_id,
+            'num_results': num_results
+        } for user_id, current_item_id in users ], tracker = tracker)
+
+        resp_headers['X-Experiment-Name'] = experiment.name
+        resp_headers['X-Experiment-Type'] = experiment.type
+        resp_headers['X-Experiment-Id'] = experiment.id
+    else:
+        values = get_parameter_values([ campaign_arn_param_name, filter_purchased_param_name ])
+
+        campaign_arn = values[0]
+        filter_arn = values[1]
+
+        resolve_requests = [ { 'user_id': user_id, 'product_id': current_item_id, 'num_results': num_results } for user_id, current_item_id in users ]
+
+        if campaign_arn and PERSONALIZE_LATENCY_BUDGET > 0:
+            resolver = get_personalize_fallback_resolver(campaign_arn, filter_arn, products_service_host, products_service_port)
+
+            # Resolved one user at a time to know which resolver answered each of them
+            answers, errors = batch_fan_out.run_limited([ functools.partial(resolver.resolve, **request) for request in resolve_requests ], BATCH_CONCURRENCY)
+            results = [ answer[0] if answer else None for answer in answers ]
+
+            if any(answer and answer[1] == 'personalize' for answer in answers):
+                resp_headers['X-Personalize-Recipe'] = get_recipe(campaign_arn)
+        elif campaign_arn:
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS, campaign_arn = campaign_arn, filter_arn = filter_arn)
+            results, errors = resolver.get_items_batch(resolve_requests)
+
+            resp_headers['X-Personalize-Recipe'] = get_recipe(campaign_arn)
+        else:
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = products_service_host, products_service_port = products_service_port)
+            results, errors = resolver.get_items_batch(resolve_requests)
+
+    # Fetch product details once for every distinct item recommended to any of the users.
+    products = {}
+    for items in results:
+        for item in items or []:
+            products.setdefault(item['itemId'], { 'itemId': item['itemId'] })
+
+    failures = product_hydrator.hydrate(list(products.values()), products_service_host, products_service_port, fully_qualify_image_urls)
+    if failures:
+        app.logger.warning(f'Unable to retrieve product details for {len(failures)} of {len(products)} items: {failures}')
+        resp_headers['X-Hydration-Failures'] = str(len(failures))
+
+    for i, error in errors.items():
+        app.logger.warning(f'Unable to get recommendations for user {users[i][0]}: {error}')
+
+    def generate():
+        for i, (user_id, current_item_id) in enumerate(users):
+            line = { 'userID': user_id }
+            if current_item_id:
+                line['currentItemID'] = current_item_id
+
+            if i in errors:
+                line.update({ 'status': 'error', 'message': 'Unhandled error' })
+            else:
+                # The response has already started so a user that cannot be formatted gets an error line.
+                try:
+                    items = results[i] or []
+                    for item in items:
+                        product = products[item['itemId']].get('product')
+                        if product is not None:
+                            # Each user gets their own copy since product URLs are tagged per user
+                            item['product'] = dict(product)
+
+                    line.update({ 'status': 'ok', 'items': format_items(items) })
+                except Exception as e:
+                    app.logger.warning(f'Unable to format recommendations for user {user_id}: {e}')
+                    line.update({ 'status': 'error', 'message': 'Unhandled error' })
+
+            yield json.dumps(line, cls=CompatEncoder) + '\n'
+
+    return Response(generate(), content_type = 'application/x-ndjson', headers = resp_headers)
+
+# Features whose active experiments are loaded by warm_up
+WARM_UP_FEATURES = [ feature.strip() for feature in os.environ.get('WARM_UP_FEATURES', 'home_product_recs,product_detail_related,search_results').split(',') if feature.strip() ]
+
+def warm_up():
+    """ Loads shared state that would otherwise be loaded by the first requests
+
+    SSM parameters, campaign recipes, the active experiments of WARM_UP_FEATURES and
+    the product catalog (into the product cache) are loaded. The production entry
+    point (wsgi.py) calls this in the server's master process so that forked workers
+    start with it in memory. A step that fails is logged and its state is left to
+    be loaded on demand.
+    """
+    try:
+        values = get_parameter_values(DEFAULT_PARAMETER_NAMES)
+        app.logger.info(f'Warm up - loaded {sum(1 for value in values if value)} of {len(values)} parameters')
+
+        for campaign_arn in values[:3]:
+            if campaign_arn:
+                get_recipe(campaign_arn)
+    except Exception as e:
+        app.logger.warning(f'Warm up - unable to load parameters and recipes: {e}')
+
+    try:
+        exp_manager = ExperimentManager()
+        if exp_manager.is_configured():
+            experiments = [ exp_manager.get_active(feature) for feature in WARM_UP_FEATURES ]
+            app.logger.info(f'Warm up - loaded {sum(1 for experiment in experiments if experiment)} active experiments')
+    except Exception as e:
+        app.logger.warning(f'Warm up - unable to load experiments: {e}')
+
+    try:
+        products_service_host, products_service_port = get_products_service()
+        response = http_client.get(f'http://{products_service_host}:{products_service_port}/products/all')
+        if not response.ok:
+            raise Exception(f'Error calling products service: {response.status_code}: {response.reason}')
+
+        products = (response.json() or [])[:product_cache.max_size]
+        for product in products:
+            product_cache.put(product_cache_key(product['id']), product)
+        app.logger.info(f'Warm up - cached {len(products)} products')
+    except Exception as e:
+        app.logger.warning(f'Warm up - unable to load products: {e}')
+
+def after_fork():
+    """ Resets shared state that is not valid in a forked worker process
+
+    State loaded by warm_up() in the master is kept. boto3 clients are not
+    fork-safe (their connection pools and locks would be shared with the master
+    and the other workers) so they are recreated, background refreshes that were
+    in progress at fork time are forgotten, and events and counts buffered in the
+    master are left for the master to send. Thread pools and HTTP sessions are
+    already created per process. gunicorn.conf.py calls this in each worker when
+    the app is preloaded.
+    """
+    global personalize
+    personalize = boto3.client('personalize')
+
+    tracking.after_fork()
+    PersonalizeRecommendationsResolver.after_fork()
+    PersonalizeRankingResolver.after_fork()
+    experiment_optimizely.after_fork()
+
+    parameter_store.after_fork()
+    service_discovery.after_fork()
+    catalog.after_fork()
+    personalize_cache.after_fork()
+    counter_aggregator.after_fork()
+    ExperimentManager().after_fork()
 
 # -- Logging
 class LoggingMiddleware(object):
@@ -199,7 +419,7 @@ class BadRequest(Exception):
 # -- Handlers
 
 app = Flask(__name__)
-corps = CORS(app, expose_headers=['X-Experiment-Name', 'X-Experiment-Type', 'X-Experiment-Id', 'X-Personalize-Recipe'])
+corps = CORS(app, expose_headers=['X-Experiment-Name', 'X-Experiment-Type', 'X-Experiment-Id', 'X-Personalize-Recipe', 'X-Hydration-Failures'])
 
 @app.errorhandler(BadRequest)
 def handle_bad_request(error):
@@ -215,6 +435,44 @@ def index():
 def health():
     return 'OK'
 
+@app.route('/metrics/http')
+def http_metrics():
+    """ Returns request counts, errors and latency percentiles by host for HTTP services called by resolvers """
+    return jsonify(http_client.metrics())
+
+@app.route('/metrics/resolvers')
+def resolver_metrics():
+    """ Returns per-child metrics of ensemble and fallback chain resolvers """
+    return jsonify(dict(EnsembleResolver.all_metrics(), **FallbackChainResolver.all_metrics()))
+
+@app.route('/recipes/invalidate', methods=['POST'])
+def recipes_invalidate():
+    """ Invalidates cached campaign recipes so they are looked up again on next use
+
+    An optional 'campaignArn' can be provided to only invalidate a single campaign.
+    """
+    content = request.get_json(silent = True) or {}
+    campaign_arn = content.get('campaignArn') or request.args.get('campaignArn')
+
+    invalidate_recipes(campaign_arn)
+
+    return jsonify(success=True)
+
+@app.route('/recommendations/invalidate', methods=['POST'])
+def recommendations_invalidate():
+    """ Invalidates cached Personalize results for a user, e.g. after they make a purchase
+
+    Requires a 'userId' in the JSON body or query string.
+    """
+    content = request.get_json(silent = True) or {}
+    user_id = content.get('userId') or request.args.get('userId')
+    if not user_id:
+        raise BadRequest('userId is required')
+
+    personalize_cache.invalidate_user(user_id)
+
+    return jsonify(success=True)
+
 @app.route('/related', methods=['GET'])
 def related():
     """ Returns related products given an item/product.
@@ -299,6 +557,65 @@ def recommendations():
         app.logger.exception('Unexpected error generating recommendations', e)
         raise BadRequest(message = 'Unhandled error', status_code = 500)
 
+# Maximum number of users accepted by /recommendations/batch
+MAX_BATCH_USERS = 1000
+
+@app.route('/recommendations/batch', methods=['POST'])
+def recommendations_batch():
+    """ Returns item/product recommendations for a batch of users, e.g. for email or push campaigns
+
+    Accepts a JSON body with a 'users' array where each user is a user ID or an
+    object with a 'userID' and optional 'currentItemID', and optional 'numResults',
+    'feature' and 'fullyQualifyImageUrls' (as for /recommendations). The response
+    is newline-delimited JSON with a line per user, in request order, with the
+    user's 'items' or an error 'status'.
+    """
+    content = request.get_json(silent = True)
+    if not isinstance(content, dict):
+        raise BadRequest('A JSON object body is required')
+
+    users = content.get('users')
+    if not isinstance(users, list) or not users:
+        raise BadRequest('users is required and must be a non-empty array')
+    if len(users) > MAX_BATCH_USERS:
+        raise BadRequest(f'A maximum of {MAX_BATCH_USERS} users are accepted per request')
+
+    user_requests = []
+    for user in users:
+        if isinstance(user, dict):
+            user_id = user.get('userID')
+            current_item_id = user.get('currentItemID')
+        else:
+            user_id = user
+            current_item_id = None
+        if not user_id or not isinstance(user_id, (str, int)):
+            raise BadRequest('userID is required for each user')
+        user_requests.append((str(user_id), str(current_item_id) if current_item_id else None))
+
+    try:
+        num_results = int(content.get('numResults', 25))
+    except (TypeError, ValueError):
+        raise BadRequest('numResults must be a number')
+    if num_results < 1:
+        raise BadRequest('numResults must be greater than zero')
+    if num_results > 100:
+        raise BadRequest('numResults must be less than 100')
+
+    fully_qualify_image_urls = str(content.get('fullyQualifyImageUrls', '0')).lower() in [ 'true', 't', '1']
+
+    try:
+        return get_products_batch(
+            feature = content.get('feature'),
+            users = user_requests,
+            num_results = num_results,
+            campaign_arn_param_name = 'retaildemostore-product-recommendation-campaign-arn',
+            fully_qualify_image_urls = fully_qualify_image_urls
+        )
+
+    except Exception as e:
+        app.logger.exception('Unexpected error generating batch recommendations', e)
+        raise BadRequest(message = 'Unhandled error', status_code = 500)
+
 @app.route('/rerank', methods=['GET', 'POST'])
 def rerank():
     """ Re-ranks a list of items using personalized reranking """
@@ -365,10 +682,10 @@ def rerank():
                 filter_arn = values[1]
 
                 if campaign_arn:
-                    resolver = PersonalizeRankingResolver(campaign_arn = campaign_arn, filter_arn = filter_arn)
+                    resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RANKING, campaign_arn = campaign_arn, filter_arn = filter_arn)
                     resp_headers['X-Personalize-Recipe'] = get_recipe(campaign_arn)
                 else:
-                    resolver = RankingProductsNoOpResolver()
+                    resolver = ResolverFactory.get(ResolverFactory.TYPE_RANKING_NO_OP)
 
                 ranked_items = resolver.get_items(
                     user_id = user_id, 
@@ -435,14 +752,99 @@ def experiment_outcome():
         result_rank = int(correlation_bits[3])
         experiment.track_conversion(user_id = user_id, variation_index = variation_index, result_rank = result_rank)
 
+        # The user's history changed so their cached recommendations are out of date
+        personalize_cache.invalidate_user(user_id)
+
         return jsonify(success=True)
 
     except Exception as e:
         app.logger.exception('Unexpected error logging outcome', e)
         raise BadRequest(message = 'Unhandled error', status_code = 500)
 
+# Maximum number of correlation IDs accepted by /experiment/outcomes
+MAX_OUTCOMES_PER_REQUEST = 1000
+
+def parse_correlation_id(correlation_id):
+    """ Returns (experiment_id, user_id, variation_index, result_rank) for a correlation ID or raises ValueError """
+    if not isinstance(correlation_id, str):
+        raise ValueError('correlationId must be a string')
+
+    correlation_bits = correlation_id.split('-')
+    if len(correlation_bits) != 4:
+        raise ValueError('correlationId is invalid')
+
+    try:
+        return correlation_bits[0], correlation_bits[1], int(correlation_bits[2]), int(correlation_bits[3])
+    except ValueError:
+        raise ValueError('correlationId is invalid')
+
+@app.route('/experiment/outcomes', methods=['POST'])
+def experiment_outcomes():
+    """ Tracks outcomes/conversions for a batch of correlation IDs
+
+    Accepts a JSON body with a 'correlationIds' array (or just the array). Outcomes
+    are grouped by experiment so each experiment is loaded once, its conversion
+    counts are updated together, and its outcome events are tracked as a batch.
+    The response includes a status for each correlation ID, in request order.
+    """
+    content = request.get_json(silent = True)
+    correlation_ids = content.get('correlationIds') if isinstance(content, dict) else content
+
+    if not isinstance(correlation_ids, list) or not correlation_ids:
+        raise BadRequest('correlationIds is required and must be a non-empty array')
+    if len(correlation_ids) > MAX_OUTCOMES_PER_REQUEST:
+        raise BadRequest(f'A maximum of {MAX_OUTCOMES_PER_REQUEST} correlationIds are accepted per request')
+
+    exp_manager = ExperimentManager()
+    if not exp_manager.is_configured():
+        raise BadRequest('Experiments have not been configured')
+
+    results = [ { 'correlationId': correlation_id, 'status': 'ok' } for correlation_id in correlation_ids ]
+
+    # Validate all correlation IDs and group them by experiment
+    outcomes_by_experiment = {}
+    for i, correlation_id in enumerate(correlation_ids):
+        try:
+            experiment_id, user_id, variation_index, result_rank = parse_correlation_id(correlation_id)
+            outcomes_by_experiment.setdefault(experiment_id, []).append((i, (user_id, variation_index, result_rank)))
+        except ValueError as e:
+            results[i].update({ 'status': 'invalid', 'message': str(e) })
+
+    tracker = exp_manager.default_tracker() if outcomes_by_experiment else None
+
+    for experiment_id, outcomes in outcomes_by_experiment.items():
+        try:
+            experiment = exp_manager.get_by_id(experiment_id)
+            if not experiment:
+                for i, conversion in outcomes:
+                    results[i].update({ 'status': 'not_found', 'message': 'Experiment not found' })
+                continue
+
+            conversions = []
+            for i, conversion in outcomes:
+                if 0 <= conversion[1] < len(experiment.variations):
+                    conversions.append(conversion)
+                else:
+                    results[i].update({ 'status': 'invalid', 'message': 'variation_index is out of bounds' })
+
+            if conversions:
+                experiment.track_conversions(conversions, tracker = tracker)
+                for user_id in set(conversion[0] for conversion in conversions):
+                    personalize_cache.invalidate_user(user_id)
+
+        except Exception as e:
+            app.logger.exception(f'Unexpected error logging outcomes for experiment {experiment_id}')
+            for i, conversion in outcomes:
+                if results[i]['status'] == 'ok':
+                    results[i].update({ 'status': 'error', 'message': 'Unhandled error' })
+
+    return jsonify({
+        'tracked': sum(1 for result in results if result['status'] == 'ok'),
+        'results': results
+    })
+
 if __name__ == '__main__':
     logging.getLogger('exerimentation').setLevel(level = logging.DEBUG)
     app.wsgi_app = LoggingMiddleware(app.wsgi_app)
 
-    app.run(debug=True,host='0.0.0.0', port=80)
\ No newline at end of file
+    app.run(debug=True,host='0.0.0.0', port=int(os.environ.get('PORT', 80)))
\ No newline at end of file
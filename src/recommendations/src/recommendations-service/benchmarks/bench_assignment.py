@@ -0,0 +1,67 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks A/B experiment variation assignment
+
+Compares the original per-user calculation (hashing the full key and parsing
+15 hex digits) with the bulk assignment API, streaming a file of user IDs
+through the command line tool, and the cached online path for repeat users.
+
+python -m benchmarks.bench_assignment [--users 1000000]
+"""
+
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from experimentation.experiment_ab import assign_variation_indexes, _cached_variation_index
+
+def legacy_variation_index(feature, name, variation_count, user_id):
+    """ Mirrors the original ABExperiment.calculate_variation_index """
+    hash_str = f'experiments.{feature}.{name}.{user_id}'.encode('ascii')
+    hash_int = int(hashlib.sha1(hash_str).hexdigest()[:15], 16)
+    return hash_int % variation_count
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type = int, default = 1000000)
+    args = parser.parse_args()
+
+    feature, name, variation_count = 'home_product_recs', 'bench', 3
+    user_ids = [ str(i) for i in range(args.users) ]
+
+    legacy, legacy_time = timed(lambda: [ legacy_variation_index(feature, name, variation_count, u) for u in user_ids ])
+    bulk, bulk_time = timed(lambda: assign_variation_indexes(feature, name, variation_count, user_ids))
+    assert bulk.tolist() == legacy
+
+    print(f'{"method":>28} {"users/s":>12}')
+    print(f'{"original per-user":>28} {args.users / legacy_time:>12,.0f}')
+    print(f'{"bulk":>28} {args.users / bulk_time:>12,.0f}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, 'users.txt')
+        output_file = os.path.join(tmp, 'assignments.csv')
+        with open(input_file, 'w') as f:
+            f.writelines(f'{u}\n' for u in user_ids)
+
+        _, file_time = timed(lambda: subprocess.run([ sys.executable, '-m', 'experimentation.experiment_ab',
+            feature, name, str(variation_count), input_file, output_file ], check = True))
+        print(f'{"file (incl. process start)":>28} {args.users / file_time:>12,.0f}')
+
+    repeat_users = user_ids[:10000]
+    for u in repeat_users:
+        _cached_variation_index(feature, name, variation_count, u)
+    _, cached_time = timed(lambda: [ _cached_variation_index(feature, name, variation_count, u) for r in range(10) for u in repeat_users ])
+    print(f'{"online, repeat users":>28} {len(repeat_users) * 10 / cached_time:>12,.0f}')
+
+if __name__ == '__main__':
+    main()
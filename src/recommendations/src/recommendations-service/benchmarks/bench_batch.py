@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks resolving batches of users with Resolver.get_items_batch
+
+An HTTP resolver calls a local stub recommender service that takes latency
+seconds per request. A batch of users is resolved by calling get_items for one
+user at a time, with the default concurrency-limited get_items_batch, and with
+the bulk endpoint of the stub (batch_url). The same comparison is made for an
+A/B experiment with two HTTP variations, looping over get_items against one
+get_items_batch call (exposure counts are not written to DynamoDB).
+
+python -m benchmarks.bench_batch [--users 1000] [--latency 0.005] [--concurrency 8] [--batch-size 100]
+"""
+
+import argparse
+import time
+
+from unittest.mock import patch
+
+from benchmarks.stubs import StubRecommenderService
+from experimentation.experiment_ab import ABExperiment
+from experimentation.resolvers import ResolverFactory
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type = int, default = 1000)
+    parser.add_argument('--latency', type = float, default = 0.005)
+    parser.add_argument('--concurrency', type = int, default = 8)
+    parser.add_argument('--batch-size', type = int, default = 100)
+    args = parser.parse_args()
+
+    requests = [ { 'user_id': str(i), 'num_results': 10 } for i in range(args.users) ]
+    rows = []
+
+    with StubRecommenderService(latency = args.latency) as service:
+        base_url = f'http://{service.host}:{service.port}/recommendations'
+        batch_url = f'http://{service.host}:{service.port}/recommendations/batch'
+
+        single = ResolverFactory.create(ResolverFactory.TYPE_HTTP, base_url = base_url)
+        bulk = ResolverFactory.create(ResolverFactory.TYPE_HTTP, base_url = base_url, batch_url = batch_url, batch_size = args.batch_size)
+
+        expected = [ single.get_items(**request) for request in requests[:10] ]
+        assert bulk.get_items_batch(requests[:10])[0] == expected
+
+        rows.append(('http, get_items per user', timed(lambda: [ single.get_items(**request) for request in requests ])))
+        rows.append((f'http, get_items_batch (concurrency {args.concurrency})',
+            timed(lambda: single.get_items_batch(requests, max_concurrency = args.concurrency))))
+        rows.append((f'http, get_items_batch (bulk endpoint, {args.batch_size} per call)',
+            timed(lambda: bulk.get_items_batch(requests, max_concurrency = args.concurrency))))
+
+        experiment = ABExperiment('bench', **{
+            'id': 'bench',
+            'feature': 'home_product_recs',
+            'name': 'bench-batch',
+            'type': 'ab',
+            'status': 'ACTIVE',
+            'variations': [
+                { 'type': ResolverFactory.TYPE_HTTP, 'base_url': base_url, 'batch_url': batch_url, 'batch_size': args.batch_size },
+                { 'type': ResolverFactory.TYPE_HTTP, 'base_url': base_url + '?variation=1', 'batch_url': batch_url, 'batch_size': args.batch_size }
+            ]
+        })
+
+        with patch('experimentation.experiment.counter_aggregator'):
+            rows.append(('A/B experiment, get_items per user', timed(lambda: [ experiment.get_items(**request) for request in requests ])))
+            rows.append(('A/B experiment, get_items_batch', timed(lambda: experiment.get_items_batch(requests, max_concurrency = args.concurrency))))
+
+        calls = service.request_count
+
+    print(f'{args.users} users, stub service latency {args.latency * 1000:.0f} ms, {calls} stub requests in total')
+    print()
+    print('| path | seconds | users/s |')
+    print('| ---- | ------- | ------- |')
+    for name, elapsed in rows:
+        print(f'| {name} | {elapsed:.2f} | {args.users / elapsed:,.0f} |')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks POST /recommendations/batch against one GET /recommendations per user
+
+The service runs in-process on the Werkzeug server with parameters from a
+snapshot file, a stub Personalize runtime that recommends a random selection
+of products per user, and a local stub Products service for hydration. N users
+are resolved with sequential single calls, with single calls from a pool of
+client threads, and with one batch call whose streamed lines are read as they
+arrive. The Personalize cache is cleared before each run. Each path is run with
+an empty product cache and with the product cache warmed by the previous run,
+as it would be in steady state.
+
+python -m benchmarks.bench_batch_endpoint [--users 500] [--products 2000] [--personalize-latency 0.01] [--products-latency 0.002]
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from werkzeug.serving import make_server
+
+from benchmarks.stubs import StubProductsService, StubPersonalizeRuntime, generate_catalog
+
+CAMPAIGN_ARN = 'arn:aws:personalize:us-east-1:123456789012:campaign/bench'
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type = int, default = 500)
+    parser.add_argument('--products', type = int, default = 2000)
+    parser.add_argument('--num-results', type = int, default = 10)
+    parser.add_argument('--personalize-latency', type = float, default = 0.01)
+    parser.add_argument('--products-latency', type = float, default = 0.002)
+    parser.add_argument('--clients', type = int, default = 8)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix = '.json', delete = False) as f:
+        json.dump({
+            'retaildemostore-product-recommendation-campaign-arn': CAMPAIGN_ARN,
+            'retaildemostore-personalize-filter-purchased-arn': 'NONE'
+        }, f)
+
+    with StubProductsService(latency = args.products_latency, catalog = generate_catalog(args.products)) as products_service:
+        os.environ.update({
+            'PARAMETER_SNAPSHOT_FILE': f.name,
+            'PARAMETER_REFRESH_INTERVAL': '0',
+            'PRODUCT_SERVICE_HOST': products_service.host,
+            'PRODUCT_SERVICE_PORT': str(products_service.port)
+        })
+
+        # Imported once the environment is set up since the service reads it on import
+        import app
+        from experimentation.personalize_cache import personalize_cache
+        from experimentation.products import product_cache
+        from experimentation.resolvers import PersonalizeRecommendationsResolver
+
+        app.recipe_cache.put(CAMPAIGN_ARN, 'arn:aws:personalize:::recipe/aws-user-personalization')
+        runtime = StubPersonalizeRuntime(latency = args.personalize_latency, catalog_size = args.products)
+
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app.app, threaded = True)
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        user_ids = [ f'user-{i}' for i in range(args.users) ]
+        session = requests.Session()
+
+        def single(user_id):
+            response = session.get(f'{base_url}/recommendations', params = { 'userID': user_id, 'numResults': args.num_results })
+            response.raise_for_status()
+            return response.json()
+
+        def single_sequential():
+            return [ single(user_id) for user_id in user_ids ]
+
+        def single_concurrent():
+            with ThreadPoolExecutor(max_workers = args.clients) as executor:
+                return list(executor.map(single, user_ids))
+
+        def batch():
+            response = session.post(f'{base_url}/recommendations/batch', json = { 'users': user_ids, 'numResults': args.num_results }, stream = True)
+            response.raise_for_status()
+            return [ json.loads(line)['items'] for line in response.iter_lines() if line ]
+
+        rows = []
+        with patch.object(PersonalizeRecommendationsResolver, '_PersonalizeRecommendationsResolver__personalize_runtime', runtime):
+            for name, run in [ ('GET /recommendations per user', single_sequential),
+                               (f'GET /recommendations per user, {args.clients} client threads', single_concurrent),
+                               ('POST /recommendations/batch', batch) ]:
+                product_cache.clear()
+                for cache in [ 'empty', 'warm' ]:
+                    personalize_cache.clear()
+                    products_requests = products_service.request_count
+                    personalize_calls = runtime.calls
+
+                    start = time.perf_counter()
+                    results = run()
+                    elapsed = time.perf_counter() - start
+
+                    assert len(results) == args.users and all(len(items) == args.num_results for items in results)
+                    rows.append((name, cache, elapsed, runtime.calls - personalize_calls, products_service.request_count - products_requests))
+
+        server.shutdown()
+
+    os.remove(f.name)
+
+    print(f'{args.users} users, {args.num_results} results each from {args.products} products, '
+        f'Personalize latency {args.personalize_latency * 1000:.0f} ms, Products service latency {args.products_latency * 1000:.0f} ms')
+    print()
+    print('| path | product cache | seconds | users/s | Personalize calls | Products service requests |')
+    print('| ---- | ------------- | ------- | ------- | ----------------- | ------------------------- |')
+    for name, cache, elapsed, personalize_calls, products_requests in rows:
+        print(f'| {name} | {cache} | {elapsed:.2f} | {args.users / elapsed:,.0f} | {personalize_calls:,} | {products_requests:,} |')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks related product lookups with DefaultProductResolver and CatalogProductResolver
+
+Both resolvers use a local stub Products service with a synthetic catalog. The
+product resolver is measured with an empty product cache (two sequential HTTP
+calls per request) and with a warm cache; the catalog resolver loads a snapshot
+of the stub service once and then answers from memory. Results of both
+resolvers are compared for every product first.
+
+python -m benchmarks.bench_catalog [--products 2000] [--requests 2000] [--latency 0.002]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.stubs import StubProductsService, generate_catalog
+from experimentation.products import product_cache
+from experimentation.resolvers import ResolverFactory
+
+def measure(resolver, product_ids, clear_cache = False):
+    start = time.perf_counter()
+    for product_id in product_ids:
+        if clear_cache:
+            product_cache.clear()
+        resolver.get_items(product_id = product_id, num_results = 10)
+    return len(product_ids) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type = int, default = 2000)
+    parser.add_argument('--requests', type = int, default = 2000)
+    parser.add_argument('--latency', type = float, default = 0.002)
+    args = parser.parse_args()
+
+    catalog = generate_catalog(args.products)
+    rng = random.Random(3)
+    product_ids = [ rng.choice(catalog)['id'] for i in range(args.requests) ]
+
+    with StubProductsService(latency = args.latency, catalog = catalog) as service:
+        product_resolver = ResolverFactory.create(ResolverFactory.TYPE_PRODUCT, products_service_host = service.host, products_service_port = service.port)
+        catalog_resolver = ResolverFactory.create(ResolverFactory.TYPE_CATALOG, products_service_host = service.host, products_service_port = service.port)
+
+        start = time.perf_counter()
+        catalog_resolver.store.get()
+        load_ms = (time.perf_counter() - start) * 1000
+
+        mismatches = sum(1 for product in catalog
+            if catalog_resolver.get_items(product_id = product['id'], num_results = 10) != product_resolver.get_items(product_id = product['id'], num_results = 10))
+
+        cold = measure(product_resolver, product_ids, clear_cache = True)
+        measure(product_resolver, product_ids)
+        warm = measure(product_resolver, product_ids)
+        in_memory = measure(catalog_resolver, product_ids)
+
+    print(f'{args.products} products, {args.requests} requests, stub service latency {args.latency * 1000:.0f} ms')
+    print(f'catalog snapshot loaded in {load_ms:.0f} ms, {mismatches} mismatched results')
+    print()
+    print('| resolver | requests/s |')
+    print('| -------- | ---------- |')
+    print(f'| product, empty cache | {cold:,.0f} |')
+    print(f'| product, warm cache | {warm:,.0f} |')
+    print(f'| catalog | {in_memory:,.0f} |')
+
+if __name__ == '__main__':
+    main()
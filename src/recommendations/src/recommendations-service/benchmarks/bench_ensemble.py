@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks EnsembleResolver latency against calling its children one after another
+
+Children are in-process stub resolvers with different latencies standing in for
+Personalize, similar items and a category fallback. The serial baseline calls
+each child in turn and fuses the lists the same way. The last row makes one
+child slower than its deadline to show the ensemble answering with the rest.
+
+python -m benchmarks.bench_ensemble [--rounds 20]
+"""
+
+import argparse
+import statistics
+import time
+
+from benchmarks.stubs import StubResolver
+from experimentation.resolvers import ResolverFactory
+
+ResolverFactory.register_resolver('bench-stub', lambda **params: StubResolver(params['latency'], prefix = params['prefix']))
+
+# (name, latency in seconds) of each child
+CHILDREN = [ ('personalize', 0.040), ('similar', 0.025), ('category', 0.010) ]
+
+def make_ensemble(children, timeout):
+    return ResolverFactory.create(ResolverFactory.TYPE_ENSEMBLE, name = 'bench', timeout = timeout, resolvers = [
+        { 'type': 'bench-stub', 'name': name, 'latency': latency, 'prefix': 'item' } for name, latency in children
+    ])
+
+def serial_get_items(ensemble, num_results):
+    ranked_lists = [ (child, child['resolver'].get_items(num_results = num_results)) for child in ensemble.children ]
+    return [ item for item, contributors in ensemble._fuse(ranked_lists, num_results) ]
+
+def measure(fn, rounds):
+    timings = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type = int, default = 20)
+    args = parser.parse_args()
+
+    ensemble = make_ensemble(CHILDREN, timeout = 0.2)
+    ensemble.get_items(num_results = 25)
+
+    slow = make_ensemble(CHILDREN[:-1] + [ ('category', 0.5) ], timeout = 0.1)
+
+    print('| children | serial ms | ensemble ms |')
+    print('| -------- | --------- | ----------- |')
+    print(f"| {', '.join(f'{name} {latency * 1000:.0f} ms' for name, latency in CHILDREN)} | "
+          f"{measure(lambda: serial_get_items(ensemble, 25), args.rounds):.1f} | {measure(lambda: ensemble.get_items(num_results = 25), args.rounds):.1f} |")
+    print(f"| category 500 ms, 100 ms deadline | "
+          f"{measure(lambda: serial_get_items(slow, 25), min(args.rounds, 5)):.1f} | {measure(lambda: slow.get_items(num_results = 25), args.rounds):.1f} |")
+    print()
+    print(slow.metrics())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks a latency-budgeted fallback chain against waiting on a slow primary
+
+The primary is a stub resolver with a heavy-tailed latency standing in for
+Personalize (mostly around 30 ms, but --slow-share of calls take 800 ms). The
+fallback is a fast stub standing in for the Product service. Requests are sent
+one at a time directly to the primary and through a fallback chain with a
+latency budget that hedges to the fallback at the primary's p95 latency.
+
+python -m benchmarks.bench_fallback [--requests 500] [--slow-share 0.05] [--budget 0.2]
+"""
+
+import argparse
+import random
+import time
+import numpy as np
+
+from benchmarks.stubs import StubResolver
+from experimentation.resolvers import ResolverFactory
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type = int, default = 500)
+    parser.add_argument('--slow-share', type = float, default = 0.05)
+    parser.add_argument('--budget', type = float, default = 0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    primary = StubResolver(lambda: 0.8 if rng.random() < args.slow_share else rng.uniform(0.02, 0.04), prefix = 'personalize')
+    fallback = StubResolver(0.01, prefix = 'product')
+
+    ResolverFactory.register_resolver('bench-primary', lambda **params: primary)
+    ResolverFactory.register_resolver('bench-fallback', lambda **params: fallback)
+    chain = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, name = 'bench', budget = args.budget, hedge_percentile = 0.95, resolvers = [
+        { 'type': 'bench-primary', 'name': 'primary' },
+        { 'type': 'bench-fallback', 'name': 'fallback' }
+    ])
+
+    print(f'{args.requests} requests, {args.slow_share:.0%} of primary calls take 800 ms, budget {args.budget * 1000:.0f} ms')
+    print()
+    print('| path | p50 ms | p99 ms | max ms | answered by fallback |')
+    print('| ---- | ------ | ------ | ------ | -------------------- |')
+
+    for name, resolve in [ ('primary only', lambda: (primary.get_items(num_results = 10), 'primary')),
+                           ('fallback chain', lambda: chain.resolve(num_results = 10)) ]:
+        latencies = []
+        fallbacks = 0
+        for i in range(args.requests):
+            start = time.perf_counter()
+            items, answered_by = resolve()
+            latencies.append((time.perf_counter() - start) * 1000)
+            fallbacks += answered_by == 'fallback'
+        print(f'| {name} | {np.percentile(latencies, 50):.1f} | {np.percentile(latencies, 99):.1f} | {max(latencies):.1f} | {fallbacks / args.requests:.1%} |')
+
+    print()
+    print(chain.metrics())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks InterleavingExperiment latency with 2-5 variations
+
+Compares retrieving items for each variation one after another (the previous
+behavior) with the concurrent fan-out, using in-process stub resolvers with
+different latencies. The last row adds a variation that is slower than the
+resolver timeout to show the experiment degrading to the remaining variations.
+
+python -m benchmarks.bench_fan_out [--rounds 10]
+"""
+
+import argparse
+import statistics
+import time
+
+from unittest.mock import patch
+from benchmarks.stubs import StubResolver
+from experimentation.experiment_interleaving import InterleavingExperiment
+
+# Latency in seconds of the stub resolver for each variation
+LATENCIES = [ 0.080, 0.030, 0.050, 0.020, 0.060 ]
+
+def make_experiment(latencies, timeout):
+    experiment = InterleavingExperiment('ExperimentStrategy', **{
+        'id': 'bench',
+        'feature': 'bench',
+        'name': 'bench',
+        'type': 'interleaving',
+        'status': 'ACTIVE',
+        'resolver_timeout': timeout,
+        'variations': [ { 'type': 'product', 'products_service_host': '127.0.0.1' } for latency in latencies ]
+    })
+    for i, latency in enumerate(latencies):
+        experiment.variations[i].resolver = StubResolver(latency, prefix = f'v{i}')
+    return experiment
+
+def sequential_get_items(experiment, user_id, num_results):
+    """ Mirrors the original loop over variations in InterleavingExperiment.get_items """
+    variations_data = [ v.resolver.get_items(user_id = user_id, num_results = num_results * 3) for v in experiment.variations ]
+    return experiment._interleave_balanced(user_id, variations_data, num_results)
+
+def measure(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type = int, default = 10)
+    parser.add_argument('--timeout', type = float, default = 0.2, help = 'resolver timeout in seconds')
+    args = parser.parse_args()
+
+    print(f'{"variations":>10} {"latencies (ms)":>24} {"sequential p50":>15} {"concurrent p50":>15} {"speedup":>8}')
+
+    cases = [ LATENCIES[:n] for n in range(2, 6) ] + [ LATENCIES[:2] + [ 0.5 ] ]
+    for latencies in cases:
+        experiment = make_experiment(latencies, args.timeout)
+        with patch.object(experiment, '_increment_exposure_count'):
+            seq_p50 = measure(lambda: sequential_get_items(experiment, '1', 10), args.rounds)
+            con_p50 = measure(lambda: experiment.get_items('1', num_results = 10), args.rounds)
+
+        label = '/'.join(f'{latency * 1000:.0f}' for latency in latencies)
+        print(f'{len(latencies):>10} {label:>24} {seq_p50:>12.1f} ms {con_p50:>12.1f} ms {seq_p50 / con_p50:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Load test of HttpResolver calls when one backend becomes slow
+
+A pool of request threads (standing in for the web server's workers) serves
+requests that each call one of two local stub recommenders: a fast one and a
+slow one that takes --slow-latency seconds to respond. The test is run with the
+original resolver HTTP calls (requests.get without a timeout) and with the
+shared HttpClient (read timeout, bounded retries and a per-host in-flight
+limit), reporting throughput and the latency of requests to the fast backend,
+including time spent waiting for a free request thread.
+
+python -m benchmarks.bench_http_client [--requests 400] [--workers 16] [--slow-share 0.2] [--slow-latency 2]
+"""
+
+import argparse
+import random
+import statistics
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from benchmarks.stubs import StubRecommenderService
+from experimentation.http_client import HttpClient
+from experimentation.resolvers import ResolverFactory
+
+class LegacyClient:
+    """ Mirrors the original resolver calls: a new connection per request and no timeout """
+    def get(self, url, **kwargs):
+        return requests.get(url)
+
+def run(client, fast, slow, requests_count, workers, slow_share, read_timeout):
+    fast_resolver = ResolverFactory.create(ResolverFactory.TYPE_HTTP, base_url = f'http://{fast.host}:{fast.port}/recommend', read_timeout = read_timeout)
+    slow_resolver = ResolverFactory.create(ResolverFactory.TYPE_HTTP, base_url = f'http://{slow.host}:{slow.port}/recommend', read_timeout = read_timeout)
+
+    rng = random.Random(7)
+    targets = [ slow_resolver if rng.random() < slow_share else fast_resolver for i in range(requests_count) ]
+
+    fast_latencies = []
+    errors = [ 0 ]
+
+    def serve(resolver, submitted):
+        try:
+            resolver.get_items(user_id = '1', num_results = 10)
+        except Exception:
+            errors[0] += 1
+        if resolver is fast_resolver:
+            fast_latencies.append(time.perf_counter() - submitted)
+
+    with patch('experimentation.resolvers.http_client', client):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            for resolver in targets:
+                pool.submit(serve, resolver, time.perf_counter())
+        elapsed = time.perf_counter() - start
+
+    fast_latencies.sort()
+    return {
+        'rps': requests_count / elapsed,
+        'p50': statistics.median(fast_latencies) * 1000,
+        'p99': fast_latencies[int(len(fast_latencies) * 0.99)] * 1000,
+        'errors': errors[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type = int, default = 400)
+    parser.add_argument('--workers', type = int, default = 16)
+    parser.add_argument('--slow-share', type = float, default = 0.2)
+    parser.add_argument('--slow-latency', type = float, default = 2.0)
+    parser.add_argument('--read-timeout', type = float, default = 0.25)
+    parser.add_argument('--max-in-flight', type = int, default = 8)
+    args = parser.parse_args()
+
+    clients = [
+        ('original (no timeout)', LegacyClient()),
+        (f'HttpClient (read timeout {args.read_timeout}s, 1 retry)', HttpClient(retries = 1, pool_maxsize = args.workers, max_in_flight = 0)),
+        (f'HttpClient + {args.max_in_flight} in flight per host', HttpClient(retries = 1, pool_maxsize = args.workers, max_in_flight = args.max_in_flight))
+    ]
+
+    print(f'{args.requests} requests on {args.workers} threads, {args.slow_share:.0%} to a backend that takes {args.slow_latency}s')
+    print()
+    print('| client | requests/s | fast backend p50 ms | fast backend p99 ms | failed requests |')
+    print('| ------ | ---------- | ------------------- | ------------------- | --------------- |')
+
+    with StubRecommenderService(latency = 0.005) as fast, StubRecommenderService(latency = args.slow_latency) as slow:
+        for name, client in clients:
+            result = run(client, fast, slow, args.requests, args.workers, args.slow_share, args.read_timeout)
+            print(f"| {name} | {result['rps']:,.1f} | {result['p50']:.1f} | {result['p99']:.1f} | {result['errors']} |")
+
+        # Last client's per-host metrics
+        for host, metrics in clients[-1][1].metrics().items():
+            print(f'{host}: {metrics}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks product hydration latency vs. number of results
+
+Compares the previous approach of one sequential request per item against
+the concurrent ProductHydrator (without a cache and with a warm product cache),
+using a local stub Products service that adds a fixed latency to every request.
+
+python -m benchmarks.bench_hydration [--latency 0.005] [--rounds 5]
+"""
+
+import argparse
+import statistics
+import time
+import requests
+
+from benchmarks.stubs import StubProductsService
+from experimentation.cache import LRUCache
+from experimentation.products import ProductHydrator
+
+def sequential_hydrate(items, host, port):
+    """ Mirrors the original hydration loop from get_products """
+    for item in items:
+        response = requests.get(f'http://{host}:{port}/products/id/{item["itemId"]}?fullyQualifyImageUrls=False')
+        if response.ok:
+            item['product'] = response.json()
+
+def measure(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type = float, default = 0.005, help = 'stub latency per request in seconds')
+    parser.add_argument('--rounds', type = int, default = 5)
+    parser.add_argument('--workers', type = int, default = 16)
+    args = parser.parse_args()
+
+    hydrator = ProductHydrator(max_workers = args.workers, cache = None)
+    cached_hydrator = ProductHydrator(max_workers = args.workers, cache = LRUCache(max_size = 1000))
+
+    with StubProductsService(latency = args.latency) as stub:
+        print(f'Stub latency: {args.latency * 1000:.1f} ms, hydrator workers: {args.workers}')
+        print(f'{"numResults":>10} {"sequential p50":>15} {"concurrent p50":>15} {"concurrent max":>15} {"speedup":>8} {"warm cache p50":>15}')
+
+        for num_results in [ 1, 5, 10, 25, 50, 100 ]:
+            make_items = lambda: [ { 'itemId': str(i) } for i in range(1, num_results + 1) ]
+
+            seq_p50, _ = measure(lambda: sequential_hydrate(make_items(), stub.host, stub.port), args.rounds)
+            con_p50, con_max = measure(lambda: hydrator.hydrate(make_items(), stub.host, stub.port), args.rounds)
+
+            cached_hydrator.hydrate(make_items(), stub.host, stub.port)
+            cached_p50, _ = measure(lambda: cached_hydrator.hydrate(make_items(), stub.host, stub.port), args.rounds)
+
+            print(f'{num_results:>10} {seq_p50:>12.1f} ms {con_p50:>12.1f} ms {con_max:>12.1f} ms {seq_p50 / con_p50:>7.1f}x {cached_p50:>12.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Micro-benchmarks of the interleaving methods
+
+Measures the per-call cost of each method in experimentation.interleaving for
+ranking lengths of 10 to 1000 items and 2 to 8 rankers, next to the original
+balanced and team-draft loops (copied below as legacy_balanced and
+legacy_team_draft) which checked for duplicates with a scan of the result.
+Rankings overlap by about half so deduplication is exercised.
+
+python -m benchmarks.bench_interleaving [--repeat 5]
+"""
+
+import argparse
+import random
+import timeit
+
+from experimentation import interleaving
+
+def legacy_balanced(rankings, count, rng = random):
+    """ Original InterleavingExperiment._interleave_balanced selection loop """
+    selection_order = list(range(len(rankings)))
+    rng.shuffle(selection_order)
+    offsets = [0] * len(rankings)
+
+    result = []
+    picks = []
+    while len(result) < count:
+        next_idx = 0
+        for i in range(len(offsets)):
+            if (offsets[i] < offsets[next_idx] and 
+                    offsets[i] < len(rankings[selection_order[i]])):
+                next_idx = i
+
+        if offsets[next_idx] >= len(rankings[selection_order[next_idx]]):
+            break
+
+        item = rankings[selection_order[next_idx]][offsets[next_idx]]
+        if not any(i['itemId'] == item['itemId'] for i in result):
+            result.append(item)
+            picks.append((selection_order[next_idx], item))
+
+        offsets[next_idx] = offsets[next_idx] + 1
+
+    return picks
+
+def legacy_team_draft(rankings, count, rng = random):
+    """ Original InterleavingExperiment._interleave_team_draft selection loop """
+    teams = [[] for x in range(len(rankings))]
+    offsets = [0] * len(rankings)
+
+    result = []
+    picks = []
+    while len(result) < count:
+        size_teams = {}
+        for i in range(len(teams)):
+            team_size = len(teams[i])
+            teams_at_size = size_teams.get(team_size, [])
+            teams_at_size.append(i)
+            size_teams[team_size] = teams_at_size
+
+        ordered_keys = sorted(size_teams.keys())
+        smallest_teams = size_teams.get(ordered_keys[0])
+        team_index = rng.choice(smallest_teams)
+
+        next_offset = offsets[team_index]
+        items = rankings[team_index]
+
+        while next_offset < len(items):
+            offsets[team_index] = next_offset + 1
+
+            item = items[next_offset]
+            if not any(i['itemId'] == item['itemId'] for i in result):
+                result.append(item)
+                picks.append((team_index, item))
+                teams[team_index].append(item)
+                break
+
+            next_offset += 1
+
+        if next_offset >= len(items):
+            break
+
+    return picks
+
+def make_rankings(rankers, length, rng):
+    """ Returns rankings drawn from a shared pool so about half of the items overlap """
+    pool = [ str(i) for i in range(length * 2) ]
+    return [ [ { 'itemId': item_id } for item_id in rng.sample(pool, length) ] for r in range(rankers) ]
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    methods = [
+        ('legacy balanced', legacy_balanced),
+        ('balanced', interleaving.balanced),
+        ('legacy team-draft', legacy_team_draft),
+        ('team-draft', interleaving.team_draft),
+        ('multileave', interleaving.multileave),
+        ('probabilistic', interleaving.probabilistic)
+    ]
+
+    rng = random.Random(42)
+    print(f'{"length":>6} {"rankers":>7} ' + ' '.join(f'{name:>17}' for name, method in methods) + '   (us per call, count = length)')
+
+    for length in [ 10, 100, 1000 ]:
+        for rankers in [ 2, 4, 8 ]:
+            rankings = make_rankings(rankers, length, rng)
+            timings = []
+            for name, method in methods:
+                number = max(1, 2000 // length)
+                best = min(timeit.repeat(lambda: method(rankings, length, rng), number = number, repeat = args.repeat)) / number
+                timings.append(best * 1e6)
+            print(f'{length:>6} {rankers:>7} ' + ' '.join(f'{t:>17.1f}' for t in timings))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks PersonalizeRecommendationsResolver with and without the result cache
+
+Simulates a browsing session mix where user popularity follows a Zipf
+distribution (a few users make many requests, e.g. paging back to the home
+page) against a stub Personalize runtime with a fixed latency. Reports the
+number of Personalize calls and request latency percentiles. A share of
+requests are purchases that invalidate the user's cached results.
+
+python -m benchmarks.bench_personalize_cache [--requests 5000] [--users 1000] [--latency 0.02]
+"""
+
+import argparse
+import time
+import numpy as np
+
+from unittest.mock import patch
+from benchmarks.stubs import StubPersonalizeRuntime
+from experimentation.personalize_cache import PersonalizeResultCache
+from experimentation.resolvers import PersonalizeRecommendationsResolver
+
+def run(cache, user_ids, purchases, latency):
+    runtime = StubPersonalizeRuntime(latency)
+    resolver = PersonalizeRecommendationsResolver(campaign_arn = 'arn:bench')
+    latencies = []
+
+    with patch.object(PersonalizeRecommendationsResolver, '_PersonalizeRecommendationsResolver__personalize_runtime', runtime), \
+            patch('experimentation.resolvers.personalize_cache', cache):
+        for user_id, purchase in zip(user_ids, purchases):
+            start = time.perf_counter()
+            resolver.get_items(user_id = user_id, num_results = 25)
+            latencies.append(time.perf_counter() - start)
+            if purchase:
+                cache.invalidate_user(user_id)
+
+    latencies = np.array(latencies) * 1000
+    return runtime.calls, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type = int, default = 5000)
+    parser.add_argument('--users', type = int, default = 1000)
+    parser.add_argument('--latency', type = float, default = 0.02)
+    parser.add_argument('--purchase-rate', type = float, default = 0.02)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    user_ids = [ str(u) for u in (rng.zipf(1.3, size = args.requests) % args.users) ]
+    purchases = rng.random(args.requests) < args.purchase_rate
+
+    print(f'{args.requests} requests from {len(set(user_ids))} users, Personalize latency {args.latency * 1000:.0f} ms, {args.purchase_rate:.0%} purchases')
+    print()
+    print('| cache | Personalize calls | p50 ms | p99 ms |')
+    print('| ----- | ----------------- | ------ | ------ |')
+
+    for name, cache in [ ('none', PersonalizeResultCache(ttl = 0)),
+                         ('30s TTL, 300s stale', PersonalizeResultCache(ttl = 30, stale_ttl = 300)) ]:
+        calls, p50, p99 = run(cache, user_ids, purchases, args.latency)
+        print(f'| {name} | {calls:,} | {p50:.2f} | {p99:.2f} |')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks requests per second of the development server against gunicorn
+
+The service is started as a separate process, either as before with
+"python app.py" (Werkzeug development server in debug mode with the request
+logging middleware) or with "gunicorn --config gunicorn.conf.py wsgi:app".
+Parameters come from a snapshot file (no campaigns, so the Product service
+resolver is used) and products from a local stub Products service. Both
+servers are warmed up, so requests are answered from the product cache, and
+then loaded by client threads for a fixed duration.
+
+python -m benchmarks.bench_server [--duration 5] [--clients 1,16] [--workers N] [--threads 8]
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+
+from benchmarks.stubs import StubProductsService, generate_catalog
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start(command, env, port):
+    process = subprocess.Popen(command, cwd = SERVICE_DIR, env = env, start_new_session = True,
+        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/health', timeout = 1).ok:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    stop(process)
+    raise Exception(f'{command} did not start')
+
+def stop(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait(30)
+
+def load(url, clients, duration):
+    """ Returns (requests/s, p50 ms, p99 ms) of client threads calling url for duration seconds """
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout = 10)
+                response.raise_for_status()
+            except Exception as e:
+                errors.append(e)
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [ threading.Thread(target = client) for i in range(clients) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise Exception(f'{len(errors)} requests failed: {errors[0]}')
+
+    latencies.sort()
+    return len(latencies) / duration, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type = float, default = 5)
+    parser.add_argument('--clients', default = '1,16')
+    parser.add_argument('--workers', type = int, default = os.cpu_count())
+    parser.add_argument('--threads', type = int, default = 8)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix = '.json', delete = False) as f:
+        json.dump({ 'retaildemostore-experiment-strategy-table-name': 'NONE' }, f)
+
+    catalog = generate_catalog(500)
+    rows = []
+
+    with StubProductsService(catalog = catalog) as products_service:
+        servers = [
+            ('dev server (python app.py)', [ sys.executable, 'app.py' ]),
+            (f'gunicorn, {args.workers} workers x {args.threads} threads', [ sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'wsgi:app' ])
+        ]
+
+        for name, command in servers:
+            port = free_port()
+            env = dict(os.environ,
+                PORT = str(port),
+                PARAMETER_SNAPSHOT_FILE = f.name,
+                PARAMETER_REFRESH_INTERVAL = '0',
+                PRODUCT_SERVICE_HOST = products_service.host,
+                PRODUCT_SERVICE_PORT = str(products_service.port),
+                GUNICORN_WORKERS = str(args.workers),
+                GUNICORN_THREADS = str(args.threads),
+                GUNICORN_ACCESS_LOG = '')
+
+            process = start(command, env, port)
+            try:
+                endpoints = [
+                    ('/health', f'http://127.0.0.1:{port}/health'),
+                    ('/recommendations', f'http://127.0.0.1:{port}/recommendations?userID=1&currentItemID=10&numResults=10')
+                ]
+                for endpoint, url in endpoints:
+                    # Warm up every worker's caches
+                    load(url, 4, 1)
+                    for clients in [ int(c) for c in args.clients.split(',') ]:
+                        rps, p50, p99 = load(url, clients, args.duration)
+                        rows.append((name, endpoint, clients, rps, p50, p99))
+            finally:
+                stop(process)
+
+    os.remove(f.name)
+
+    print(f'{os.cpu_count()} CPUs, {args.duration:.0f} s per measurement, client threads in the benchmark process')
+    print()
+    print('| server | endpoint | clients | requests/s | p50 ms | p99 ms |')
+    print('| ------ | -------- | ------- | ---------- | ------ | ------ |')
+    for name, endpoint, clients, rps, p50, p99 in rows:
+        print(f'| {name} | {endpoint} | {clients} | {rps:,.0f} | {p50:.1f} | {p99:.1f} |')
+
+if __name__ == '__main__':
+    main()
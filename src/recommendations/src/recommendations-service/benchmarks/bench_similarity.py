@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks precomputed similar products against per-request more-like-this queries
+
+Builds the similarity table for a synthetic catalog with varied product text,
+then compares the 'similar' resolver calling a stub Search service (which scores
+an approximation of the more_like_this query per request and adds a fixed
+latency for the Elasticsearch round trip) with the 'similar-precomputed'
+resolver reading the memory-mapped table. Finally reports how much the two
+agree on the top 10 similar products.
+
+python -m benchmarks.bench_similarity [--products 5000] [--requests 2000] [--latency 0.005]
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+from benchmarks.stubs import StubSearchService, CATEGORIES
+from experimentation.resolvers import ResolverFactory
+from experimentation.similarity import SimilarityTable, overlap, sparse
+
+STYLES = [ 'classic', 'modern', 'vintage', 'sport', 'casual', 'formal', 'outdoor', 'travel' ]
+
+def generate_text_catalog(count, seed = 5):
+    """ Returns a catalog whose names and descriptions draw on per-category and shared vocabularies """
+    rng = random.Random(seed)
+    shared = [ f'word{i}' for i in range(400) ]
+    vocabularies = { category: [ f'{category}{i}' for i in range(150) ] for category in CATEGORIES }
+
+    products = []
+    for i in range(1, count + 1):
+        category = rng.choice(CATEGORIES)
+        vocabulary = vocabularies[category]
+        products.append({
+            'id': str(i),
+            'name': ' '.join(rng.choice(vocabulary) for w in range(3)),
+            'category': category,
+            'style': rng.choice(STYLES),
+            'description': ' '.join(rng.choice(vocabulary if rng.random() < 0.5 else shared) for w in range(20))
+        })
+    return products
+
+def measure(resolver, product_ids):
+    start = time.perf_counter()
+    for product_id in product_ids:
+        resolver.get_items(product_id = product_id, num_results = 10)
+    return len(product_ids) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type = int, default = 5000)
+    parser.add_argument('--requests', type = int, default = 2000)
+    parser.add_argument('--latency', type = float, default = 0.005)
+    parser.add_argument('--k', type = int, default = 25)
+    args = parser.parse_args()
+
+    catalog = generate_text_catalog(args.products)
+    rng = random.Random(9)
+    product_ids = [ rng.choice(catalog)['id'] for i in range(args.requests) ]
+
+    start = time.perf_counter()
+    table = SimilarityTable.build(catalog, args.k)
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory, StubSearchService(latency = args.latency, catalog = catalog) as search:
+        table.save(directory)
+
+        search_resolver = ResolverFactory.create(ResolverFactory.TYPE_SIMILAR, search_service_host = search.host, search_service_port = search.port)
+        table_resolver = ResolverFactory.create(ResolverFactory.TYPE_SIMILAR_PRECOMPUTED, table_path = directory)
+        table_resolver.get_items(product_id = product_ids[0])
+
+        search_rps = measure(search_resolver, product_ids)
+        table_rps = measure(table_resolver, product_ids)
+
+        reference = { product['id']: [ item['itemId'] for item in search.similar(product['id']) ] for product in catalog }
+        report = overlap(table, reference, k = 10)
+
+    print(f"{args.products} products, top {args.k} built in {build_seconds:.2f}s ({'SciPy sparse' if sparse is not None else 'NumPy dense'})")
+    print()
+    print('| resolver | requests/s |')
+    print('| -------- | ---------- |')
+    print(f'| similar (stub search service, {args.latency * 1000:.0f} ms) | {search_rps:,.0f} |')
+    print(f'| similar-precomputed | {table_rps:,.0f} |')
+    print()
+    print(f"Overlap with more-like-this top 10 over {report['products']} products: mean {report['meanOverlap']:.1%}, same most similar product {report['sameFirst']:.1%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Benchmarks experiment event tracking throughput and caller latency
+
+Compares the per-event KinesisTracker (one put_record call on the request
+thread) with the BufferedKinesisTracker (events queued and sent in batches
+with put_records by a background thread) using an in-process stub Kinesis
+client that adds a fixed latency per call.
+
+python -m benchmarks.bench_tracking [--latency 0.01] [--events 2000] [--threads 8]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from unittest.mock import patch
+from benchmarks.stubs import StubKinesisClient
+from experimentation import tracking
+from experimentation.tracking import KinesisTracker, BufferedKinesisTracker
+
+def make_event(i):
+    return {
+        'event_type': 'Experiment Exposure',
+        'attributes': {
+            'user_id': str(i % 1000),
+            'experiment': { 'name': 'home_product_recs', 'type': 'ab', 'variationIndex': i % 2 },
+            'items': [ str(j) for j in range(25) ]
+        }
+    }
+
+def run(tracker, events, threads):
+    """ Logs events from several threads and returns (caller latencies in ms, elapsed seconds) """
+    latencies = []
+    lock = threading.Lock()
+    per_thread = events // threads
+
+    def worker(offset):
+        timings = []
+        for i in range(offset, offset + per_thread):
+            start = time.perf_counter()
+            tracker.log_exposure(make_event(i))
+            timings.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(timings)
+
+    start = time.perf_counter()
+    workers = [ threading.Thread(target = worker, args = (t * per_thread,)) for t in range(threads) ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    if isinstance(tracker, BufferedKinesisTracker):
+        tracker.flush()
+    return latencies, time.perf_counter() - start
+
+def report(name, client, latencies, elapsed, stats = None):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f'{name:>22} {len(latencies) / elapsed:>10.0f} {statistics.median(latencies):>10.3f} ms {p99:>10.3f} ms {client.calls:>8} {client.records:>8}'
+        + (f'  dropped={stats["dropped"]} failed={stats["failed"]} retried={stats["retried"]}' if stats else ''))
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type = float, default = 0.01, help = 'stub latency per Kinesis call in seconds')
+    parser.add_argument('--events', type = int, default = 2000)
+    parser.add_argument('--threads', type = int, default = 8)
+    parser.add_argument('--failure-rate', type = float, default = 0.05, help = 'fraction of records throttled by put_records')
+    args = parser.parse_args()
+
+    print(f'Stub latency: {args.latency * 1000:.1f} ms, events: {args.events}, threads: {args.threads}')
+    print(f'{"tracker":>22} {"events/s":>10} {"caller p50":>13} {"caller p99":>13} {"calls":>8} {"records":>8}')
+
+    client = StubKinesisClient(latency = args.latency)
+    with patch.object(tracking, 'kinesis', client):
+        latencies, elapsed = run(KinesisTracker('stream', 'stream'), args.events, args.threads)
+    report('put_record', client, latencies, elapsed)
+
+    client = StubKinesisClient(latency = args.latency)
+    tracker = BufferedKinesisTracker('stream', 'stream', client = client)
+    latencies, elapsed = run(tracker, args.events, args.threads)
+    report('buffered', client, latencies, elapsed, tracker.stats())
+
+    client = StubKinesisClient(latency = args.latency, failure_rate = args.failure_rate)
+    tracker = BufferedKinesisTracker('stream', 'stream', backoff = 0.01, client = client)
+    latencies, elapsed = run(tracker, args.events, args.threads)
+    report(f'buffered {args.failure_rate:.0%} throttled', client, latencies, elapsed, tracker.stats())
+
+    client = StubKinesisClient(latency = args.latency * 20)
+    tracker = BufferedKinesisTracker('stream', 'stream', max_buffer = 100, client = client)
+    latencies, elapsed = run(tracker, args.events, args.threads)
+    report('buffered slow, drop', client, latencies, elapsed, tracker.stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Local stub services used by the benchmarks
+
+The stubs run in a background thread of the benchmark process and simulate
+backend latency with a configurable delay per request so benchmarks can be
+run without any AWS resources or other Retail Demo Store services.
+"""
+
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATEGORIES = [ 'accessories', 'apparel', 'beauty', 'electronics', 'footwear', 'housewares', 'outdoors', 'tools' ]
+
+def generate_catalog(count = 500):
+    """ Returns a synthetic product catalog shaped like the Products service data """
+    products = []
+    for i in range(1, count + 1):
+        products.append({
+            'id': str(i),
+            'name': f'Product {i}',
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'style': f'style-{i % 7}',
+            'description': f'Description of product {i}',
+            'price': 9.99 + i,
+            'image': f'{i}.jpg',
+            'featured': 'true' if i % 25 == 0 else 'false',
+            'url': f'http://localhost/#/product/{i}'
+        })
+    return products
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(_StubHandler, self).setup()
+        # Avoid Nagle/delayed-ACK stalls on keep-alive connections.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._respond(lambda: self.server.stub.handle_request(self.path))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length)) if length else None
+        self._respond(lambda: self.server.stub.handle_post(self.path, body))
+
+    def _respond(self, handler):
+        self.server.stub.request_count += 1
+        if self.server.stub.latency:
+            time.sleep(self.server.stub.latency)
+
+        status, body = handler()
+        payload = json.dumps(body).encode('utf-8')
+
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except ConnectionError:
+            # Client gave up (e.g. timed out) while the response was delayed
+            self.close_connection = True
+
+class StubService:
+    """ Base class for threaded local HTTP stubs; use as a context manager """
+    def __init__(self, latency = 0.0):
+        self.latency = latency
+        self.request_count = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def handle_request(self, path):
+        """ Returns (status, body) for a request path including its query string """
+        return self.handle(path.split('?')[0])
+
+    def handle(self, path):
+        """ Returns (status, body) for a request path """
+        return 404, { 'message': 'Not found' }
+
+    def handle_post(self, path, body):
+        """ Returns (status, body) for a POST request path and its decoded JSON body """
+        return 404, { 'message': 'Not found' }
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+class StubProductsService(StubService):
+    """ Serves the read-only routes of the Products service from a synthetic catalog """
+    def __init__(self, latency = 0.0, catalog = None):
+        super(StubProductsService, self).__init__(latency)
+        self.catalog = catalog if catalog is not None else generate_catalog()
+        self.products_by_id = { p['id']: p for p in self.catalog }
+
+    def handle(self, path):
+        match = re.match(r'^/products/id/([^/]+)$', path)
+        if match:
+            product = self.products_by_id.get(match.group(1))
+            return (200, product) if product else (404, { 'message': 'Product not found' })
+
+        match = re.match(r'^/products/category/([^/]+)$', path)
+        if match:
+            return 200, [ p for p in self.catalog if p['category'] == match.group(1) ]
+
+        if path == '/products/featured':
+            return 200, [ p for p in self.catalog if p['featured'] == 'true' ]
+
+        if path == '/products/all':
+            return 200, self.catalog
+
+        return super(StubProductsService, self).handle(path)
+
+class StubSearchService(StubService):
+    """ Serves /similar/products with an approximation of the Elasticsearch more_like_this query
+
+    Like the Search service query, the 10 highest TF-IDF terms of the product
+    (per field of name, category, style and description) are selected and the
+    other products are scored by the query terms they contain, using Lucene's
+    classic TF-IDF scoring without coordination or boosts. Scoring is done per
+    request against an inverted index, as Elasticsearch does.
+    """
+    FIELDS = [ 'name', 'category', 'style', 'description' ]
+
+    def __init__(self, latency = 0.0, catalog = None, max_query_terms = 10, size = 10):
+        super(StubSearchService, self).__init__(latency)
+        self.catalog = catalog if catalog is not None else generate_catalog()
+        self.max_query_terms = max_query_terms
+        self.size = size
+
+        self.terms = {}
+        self.postings = {}
+        for product in self.catalog:
+            counts = {}
+            for field in self.FIELDS:
+                for token in re.findall(r'[a-z0-9]+', str(product.get(field) or '').lower()):
+                    counts[(field, token)] = counts.get((field, token), 0) + 1
+            self.terms[product['id']] = counts
+            for term, count in counts.items():
+                self.postings.setdefault(term, []).append((product['id'], count, len(counts)))
+
+    def idf(self, term):
+        return 1 + math.log(len(self.catalog) / (len(self.postings.get(term, ())) + 1))
+
+    def handle_request(self, path):
+        path, query = (path.split('?', 1) + [ '' ])[:2]
+        params = urllib.parse.parse_qs(query)
+        if path == '/similar/products' and params.get('productId'):
+            return 200, self.similar(params['productId'][0])
+        return self.handle(path)
+
+    def similar(self, product_id):
+        counts = self.terms.get(product_id, {})
+        query = sorted(counts, key = lambda term: counts[term] * self.idf(term), reverse = True)[:self.max_query_terms]
+
+        scores = {}
+        for term in query:
+            idf = self.idf(term)
+            for other_id, count, length in self.postings[term]:
+                if other_id != product_id:
+                    scores[other_id] = scores.get(other_id, 0) + math.sqrt(count) * idf * idf / math.sqrt(length)
+
+        ranked = sorted(scores.items(), key = lambda score: -score[1])[:self.size]
+        return [ { 'itemId': other_id } for other_id, score in ranked ]
+
+class StubRecommenderService(StubService):
+    """ Serves a list of {'id': ...} recommendations for any path, as expected by HttpResolver
+
+    POST requests are answered as a bulk endpoint with the list for each of the
+    body's requests.
+    """
+    def __init__(self, latency = 0.0, count = 25):
+        super(StubRecommenderService, self).__init__(latency)
+        self.items = [ { 'id': str(i) } for i in range(1, count + 1) ]
+
+    def handle(self, path):
+        return 200, self.items
+
+    def handle_post(self, path, body):
+        return 200, [ self.items for request in body['requests'] ]
+
+class StubKinesisClient:
+    """ In-process stand-in for the boto3 Kinesis client
+
+    Each call sleeps for latency seconds (plus per_record_latency for each record
+    in put_records) and a failure_rate fraction of records in put_records is
+    rejected as throttled, like a stream that is close to its shard limits.
+    """
+    def __init__(self, latency = 0.0, per_record_latency = 0.0, failure_rate = 0.0, seed = 42):
+        self.latency = latency
+        self.per_record_latency = per_record_latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.records = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def put_record(self, StreamName, Data, PartitionKey):
+        time.sleep(self.latency + self.per_record_latency)
+        with self._lock:
+            self.calls += 1
+            self.records += 1
+        return { 'ShardId': 'shardId-000000000000', 'SequenceNumber': str(self.records) }
+
+    def put_records(self, StreamName, Records):
+        time.sleep(self.latency + self.per_record_latency * len(Records))
+        results = []
+        with self._lock:
+            self.calls += 1
+            for record in Records:
+                if self._random.random() < self.failure_rate:
+                    results.append({ 'ErrorCode': 'ProvisionedThroughputExceededException', 'ErrorMessage': 'Rate exceeded' })
+                else:
+                    self.records += 1
+                    results.append({ 'ShardId': 'shardId-000000000000', 'SequenceNumber': str(self.records) })
+        return { 'FailedRecordCount': sum(1 for r in results if 'ErrorCode' in r), 'Records': results }
+
+class StubPersonalizeRuntime:
+    """ In-process stand-in for the boto3 personalize-runtime client with a fixed latency per call
+
+    Recommendations are the same list of IDs for everyone unless catalog_size is
+    set, in which case each user gets their own random selection of product IDs
+    from 1 to catalog_size.
+    """
+    def __init__(self, latency = 0.0, catalog_size = None):
+        self.latency = latency
+        self.catalog_size = catalog_size
+        self.calls = 0
+
+    def get_recommendations(self, **params):
+        self.calls += 1
+        time.sleep(self.latency)
+        num_results = params.get('numResults', 25)
+        if self.catalog_size:
+            rng = random.Random(params.get('userId'))
+            return { 'itemList': [ { 'itemId': str(i) } for i in rng.sample(range(1, self.catalog_size + 1), num_results) ] }
+        return { 'itemList': [ { 'itemId': str(i) } for i in range(num_results) ] }
+
+    def get_personalized_ranking(self, **params):
+        self.calls += 1
+        time.sleep(self.latency)
+        return { 'personalizedRanking': [ { 'itemId': item_id } for item_id in params['inputList'] ] }
+
+class StubResolver:
+    """ Resolver that returns num_results synthetic items after a latency (seconds or a function returning seconds) """
+    def __init__(self, latency = 0.0, prefix = 'item'):
+        self.latency = latency
+        self.prefix = prefix
+        self.calls = 0
+
+    def get_items(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency() if callable(self.latency) else self.latency)
+        return [ { 'itemId': f'{self.prefix}-{i}' } for i in range(kwargs.get('num_results', 10)) ]
@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import logging
+import threading
+import weakref
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+class BanditState:
+    """ In-memory Beta posteriors of the arms (variations) of a multi-armed bandit
+
+    The posterior of each arm is Beta(conversions + 1, exposures + 1), combining
+    the persisted counts (replaced on every sync) with exposures and conversions
+    recorded locally that are not included in them yet, so this process's own
+    traffic is reflected immediately rather than after the counts are written
+    and reloaded (see refresh).
+
+    Thompson sampling selections are served from a batch of pre-drawn posterior
+    samples: batch_size draws for all arms are taken with a single vectorized
+    call and the winning arm of each draw is precomputed. The batch is redrawn
+    when it is used up, when the persisted counts are synced, or once
+    max_updates local updates have been applied since it was drawn, which bounds
+    how stale the posterior behind a selection can be.
+    """
+    def __init__(self, arm_count, batch_size = 256, max_updates = 32, seed = None):
+        self.arm_count = arm_count
+        self.batch_size = batch_size
+        self.max_updates = max_updates
+
+        # Row 0 holds conversions and row 1 exposures for each arm
+        self._persisted = np.zeros((2, arm_count))
+        self._local = np.zeros((2, arm_count))
+
+        self._choices = None
+        self._next = 0
+        self._updates = 0
+        self._seed = seed
+        self._rng = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @property
+    def alpha(self):
+        return self._persisted[0] + self._local[0] + 1
+
+    @property
+    def beta(self):
+        return self._persisted[1] + self._local[1] + 1
+
+    def select(self):
+        """ Returns the index of the arm selected by Thompson sampling """
+        with self._lock:
+            if self._choices is None or self._next >= len(self._choices) or self._updates >= self.max_updates:
+                self._draw()
+            choice = self._choices[self._next]
+            self._next += 1
+            return int(choice)
+
+    def record_exposure(self, arm, count = 1):
+        self._record(1, arm, count)
+
+    def record_conversion(self, arm, count = 1):
+        self._record(0, arm, count)
+
+    def local_updates(self):
+        """ Returns a copy of the local updates (conversions and exposures per arm) not included in the persisted counts """
+        with self._lock:
+            return self._local.copy()
+
+    def sync(self, counts, written = None):
+        """ Replaces the persisted counts
+
+        Arguments:
+            counts - list with a dictionary of 'exposures' and 'conversions' per arm
+            written - local updates (see local_updates) that had been written when counts
+                were read; they are included in counts so they are removed from the local
+                updates. Other local updates are kept.
+        """
+        with self._lock:
+            for i, arm_counts in enumerate(counts[:self.arm_count]):
+                self._persisted[0][i] = int(arm_counts.get('conversions', 0))
+                self._persisted[1][i] = int(arm_counts.get('exposures', 0))
+            if written is not None:
+                self._local = np.maximum(self._local - written, 0)
+            self._choices = None
+
+    def refresh(self, write, read):
+        """ Syncs with the persisted counts without losing local updates that have not been written
+
+        Arguments:
+            write - function that writes pending updates to the persisted counts and
+                returns True if all of them were written
+            read - function returning the persisted counts (as for sync)
+        """
+        with self._sync_lock:
+            written = self.local_updates()
+            if not write():
+                # Some updates are still pending so it is unknown which are included in counts
+                written = None
+            self.sync(read(), written)
+
+    def _record(self, row, arm, count):
+        with self._lock:
+            self._local[row][arm] += count
+            self._updates += 1
+
+    def _draw(self):
+        # Reseed after a fork so processes do not share the same sample sequence.
+        if self._rng is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._rng = np.random.default_rng(self._seed)
+
+        theta = self._rng.beta(self.alpha, self.beta, size = (self.batch_size, self.arm_count))
+        self._choices = np.argmax(theta, axis = 1)
+        self._next = 0
+        self._updates = 0
+
+_states = weakref.WeakValueDictionary()
+_states_lock = threading.Lock()
+
+def get_bandit_state(experiment_id, counts):
+    """ Returns the BanditState shared by all instances of an experiment
+
+    An experiment can be cached under several keys (e.g. its feature and its ID)
+    and is recompiled when it changes, so its instances share one state and keep
+    its local updates. The state is created and synced with counts (as for
+    BanditState.sync) if the experiment has none yet.
+    """
+    key = (experiment_id, len(counts))
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = BanditState(len(counts))
+            state.sync(counts)
+    return state
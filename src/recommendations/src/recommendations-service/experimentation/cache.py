@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import time
+
+from collections import OrderedDict
+
+# Sentinel value returned by LRUCache.get for keys cached as not found (negative caching).
+NOT_FOUND = object()
+
+class LRUCache:
+    """ Thread-safe, size-bounded LRU cache with per-entry time-to-live
+
+    Entries are evicted in least recently used order once max_size is reached
+    and are treated as misses once their TTL has passed. Lookups that are known
+    to have no value (e.g. a 404 from a backend) can be cached with put_missing
+    so they are not retried on every request; get returns NOT_FOUND for them.
+
+    Hit, miss, eviction and expiration counters are available from stats().
+    """
+    def __init__(self, max_size = 1024, ttl = None, negative_ttl = None):
+        """ Arguments:
+            max_size - maximum number of entries to keep
+            ttl - default time-to-live in seconds for entries (None for no expiration)
+            negative_ttl - time-to-live in seconds for not found entries (defaults to ttl)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default = None):
+        """ Returns the cached value for key, NOT_FOUND for negative entries, or default """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl = None):
+        """ Stores value for key, evicting the least recently used entry if needed """
+        if ttl is None:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (value, expires_at)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+    def put_missing(self, key):
+        """ Records that key has no value so lookups can be skipped until the negative TTL passes """
+        self.put(key, NOT_FOUND, self.negative_ttl)
+
+    def invalidate(self, key):
+        """ Removes key from the cache """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def values(self):
+        """ Returns the values of entries that have not expired """
+        now = time.monotonic()
+        with self._lock:
+            return [ value for value, expires_at in self._entries.values() if expires_at is None or expires_at > now ]
+
+    def clear(self):
+        """ Removes all entries from the cache """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """ Returns a dictionary of cache counters """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,206 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import logging
+import threading
+import time
+import urllib.parse
+
+from experimentation.discovery import service_discovery
+from experimentation.http_client import http_client
+
+log = logging.getLogger(__name__)
+
+class Catalog:
+    """ Immutable in-memory index of the product catalog by ID, category and featured flag
+
+    Category and featured lists keep the order products are given in (or the order
+    of the featured/categories lists when provided) so queries return products in
+    the same order as the corresponding Products service endpoints.
+    """
+    def __init__(self, products, featured = None, categories = None):
+        """ Arguments:
+            products - list of product dictionaries
+            featured - ordered list of featured products (derived from the 'featured' attribute of products if None)
+            categories - dictionary of category name to ordered list of products (derived from products if None)
+        """
+        self.products = { str(product['id']): product for product in products }
+
+        if featured is None:
+            featured = [ product for product in products if str(product.get('featured', '')).lower() == 'true' ]
+        self.featured = tuple(str(product['id']) for product in featured)
+
+        if categories is None:
+            categories = {}
+            for product in products:
+                if product.get('category'):
+                    categories.setdefault(product['category'], []).append(product)
+        self.categories = { name: tuple(str(product['id']) for product in category_products) for name, category_products in categories.items() }
+
+    def get_product(self, product_id):
+        """ Returns the product for an ID or None if it is not in the catalog """
+        return self.products.get(str(product_id))
+
+    def related_product_ids(self, product_id = None, num_results = 10):
+        """ Returns up to num_results IDs of products in the same category as product_id
+
+        Featured products are returned if product_id is not given, not in the catalog
+        or has no category. product_id itself is never included.
+        """
+        product = self.get_product(product_id) if product_id else None
+        category = product.get('category') if product else None
+
+        product_ids = self.categories.get(category, ()) if category else self.featured
+
+        exclude_id = str(product_id) if product_id else None
+
+        related = []
+        for related_id in product_ids:
+            if related_id != exclude_id:
+                related.append(related_id)
+                if len(related) >= num_results:
+                    break
+        return related
+
+    def __len__(self):
+        return len(self.products)
+
+    @staticmethod
+    def from_file(path):
+        """ Returns a catalog loaded from a products.yaml file (as used to seed the Products service) """
+        try:
+            import yaml
+        except ImportError:
+            raise Exception('PyYAML is required to load the catalog from a file')
+
+        with open(path) as f:
+            products = yaml.safe_load(f) or []
+
+        return Catalog(products)
+
+    @staticmethod
+    def from_service(host = None, port = 80):
+        """ Returns a catalog snapshot pulled from the Products service
+
+        All products are loaded, then the featured and category lists are loaded from
+        their own endpoints so their order matches what the service returns for them.
+        """
+        host = host or service_discovery.get_host('products')
+        base_url = f'http://{host}:{port}'
+
+        products = _get_json(f'{base_url}/products/all')
+        featured = _get_json(f'{base_url}/products/featured')
+
+        categories = {}
+        for name in sorted(set(product['category'] for product in products if product.get('category'))):
+            categories[name] = _get_json(f'{base_url}/products/category/{urllib.parse.quote(name, safe = "")}')
+
+        return Catalog(products, featured = featured, categories = categories)
+
+def _get_json(url):
+    log.debug('Catalog - loading ' + url)
+    response = http_client.get(url)
+    if not response.ok:
+        raise Exception(f'Error calling products service: {response.status_code}: {response.reason}')
+    return response.json() or []
+
+class CatalogStore:
+    """ Holds the current Catalog and refreshes it in the background
+
+    The first call to get() loads the catalog. After refresh_interval seconds the
+    current catalog keeps being served while a new one is loaded in a background
+    thread and swapped in as a whole, so readers always see a consistent index.
+    If loading fails the current catalog stays in use and loading is retried
+    after retry_interval seconds.
+    """
+    def __init__(self, loader, refresh_interval = 300, retry_interval = 30):
+        """ Arguments:
+            loader - function without arguments that returns a Catalog
+            refresh_interval - seconds between catalog refreshes (0 to never refresh)
+            retry_interval - seconds before retrying a failed refresh
+        """
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+
+        self._catalog = None
+        self._refresh_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """ Returns the current catalog, loading it on first use """
+        catalog = self._catalog
+        if catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    self._swap(self.loader())
+                catalog = self._catalog
+        elif self._refresh_at is not None and self._refresh_at <= time.monotonic() and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target = self._refresh, daemon = True).start()
+
+        return catalog
+
+    def refresh(self):
+        """ Loads the catalog and swaps it in """
+        catalog = self.loader()
+        with self._lock:
+            self._swap(catalog)
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process """
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            log.warning(f'CatalogStore - unable to refresh catalog, keeping current catalog: {e}')
+            self._refresh_at = time.monotonic() + self.retry_interval
+        finally:
+            self._refreshing = False
+
+    def _swap(self, catalog):
+        log.info(f'CatalogStore - loaded catalog with {len(catalog)} products')
+        self._catalog = catalog
+        self._refresh_at = time.monotonic() + self.refresh_interval if self.refresh_interval > 0 else None
+
+CATALOG_FILE = os.environ.get('CATALOG_FILE')
+CATALOG_REFRESH_INTERVAL = float(os.environ.get('CATALOG_REFRESH_INTERVAL', 300))
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_catalog_store(catalog_file = None, products_service_host = None, products_service_port = 80):
+    """ Returns the shared CatalogStore for a catalog file or Products service
+
+    The catalog is loaded from catalog_file (or the CATALOG_FILE environment
+    variable) if set and otherwise from the Products service at the given host
+    (or a discovered instance).
+    """
+    catalog_file = catalog_file or CATALOG_FILE
+    key = (catalog_file,) if catalog_file else (products_service_host, products_service_port)
+
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                if catalog_file:
+                    loader = lambda: Catalog.from_file(catalog_file)
+                else:
+                    loader = lambda: Catalog.from_service(products_service_host, products_service_port)
+                store = _stores[key] = CatalogStore(loader, refresh_interval = CATALOG_REFRESH_INTERVAL)
+    return store
+
+def after_fork():
+    """ Resets process-specific state of the shared catalog stores in a forked child process """
+    global _stores_lock
+    _stores_lock = threading.Lock()
+    for store in list(_stores.values()):
+        store.after_fork()
@@ -0,0 +1,187 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import functools
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+log = logging.getLogger(__name__)
+
+TIMEOUT = 'timeout'
+SKIPPED = 'skipped'
+
+class FanOut:
+    """ Runs backend calls (e.g. resolvers) concurrently on a shared thread pool
+
+    The pool is created lazily and recreated after a fork since executor threads
+    do not survive in the child process.
+    """
+    def __init__(self, max_workers = 32, thread_name_prefix = 'fan-out'):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        # Calls submitted by run() and not yet completed by key
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._in_flight = {}
+                    self._in_flight_lock = threading.Lock()
+                    self._executor = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = self.thread_name_prefix)
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def run(self, calls, timeout = None, keys = None, max_in_flight = None):
+        """ Calls each function in calls concurrently and waits at most timeout seconds for all of them
+
+        timeout can also be a list with a timeout for each call (None for no timeout),
+        in which case each call only has until its own deadline to complete.
+
+        keys (a list with a key for each call, e.g. the resolver called) and max_in_flight
+        limit the calls per key that occupy the pool. Calls that time out keep running
+        in the background, so a backend that stops answering would otherwise take over
+        every worker and make calls to healthy backends time out waiting for one. A call
+        is not made while max_in_flight calls with its key have not completed.
+
+        Return:
+            Tuple of (results, errors) where results holds each call's return value in
+            the order of calls (None for calls that did not complete successfully) and
+            errors maps the index of each failed call to TIMEOUT, SKIPPED (not made since
+            its key was at max_in_flight) or the exception raised. Calls that time out
+            keep running in the background; their results are discarded.
+        """
+        start = time.monotonic()
+        futures = [ self._submit_keyed(call, keys[i] if keys is not None else None, max_in_flight) for i, call in enumerate(calls) ]
+        results = [ None ] * len(calls)
+        errors = { i: SKIPPED for i, future in enumerate(futures) if future is None }
+
+        if isinstance(timeout, (list, tuple)):
+            # Wait for calls in deadline order, noting which completed by their own deadline
+            in_time = [ False ] * len(calls)
+            for i in sorted(range(len(calls)), key = lambda i: float('inf') if timeout[i] is None else timeout[i]):
+                if futures[i] is None:
+                    continue
+                remaining = None if timeout[i] is None else max(0, start + timeout[i] - time.monotonic())
+                wait([ futures[i] ], timeout = remaining)
+                in_time[i] = futures[i].done()
+        else:
+            wait([ future for future in futures if future is not None ], timeout = timeout)
+            in_time = [ future is not None and future.done() for future in futures ]
+
+        for i, future in enumerate(futures):
+            if future is None:
+                continue
+            elif not in_time[i]:
+                future.cancel()
+                errors[i] = TIMEOUT
+            elif future.exception() is not None:
+                errors[i] = future.exception()
+            else:
+                results[i] = future.result()
+
+        return results, errors
+
+    def in_flight(self, key):
+        """ Returns the number of calls submitted by run() with key that have not completed """
+        with self._in_flight_lock:
+            return self._in_flight.get(key, 0)
+
+    def _submit_keyed(self, call, key, max_in_flight):
+        if key is None or not max_in_flight:
+            return self.executor.submit(call)
+
+        # Resets the in-flight counts in a forked process
+        executor = self.executor
+        with self._in_flight_lock:
+            if self._in_flight.get(key, 0) >= max_in_flight:
+                return None
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+        try:
+            future = executor.submit(call)
+        except Exception:
+            self._call_done(key, None)
+            raise
+        # Also called when the call is cancelled before it started
+        future.add_done_callback(functools.partial(self._call_done, key))
+        return future
+
+    def _call_done(self, key, future):
+        with self._in_flight_lock:
+            self._in_flight[key] -= 1
+            if self._in_flight[key] <= 0:
+                del self._in_flight[key]
+
+    def run_limited(self, calls, max_concurrency):
+        """ Calls each function in calls with at most max_concurrency calls running at once and waits for all of them
+
+        Further calls are submitted as earlier ones complete, so a large batch does
+        not occupy the whole pool.
+
+        Return:
+            Tuple of (results, errors) as for run(), where errors maps the index of
+            each failed call to the exception raised.
+        """
+        max_concurrency = max(1, int(max_concurrency))
+        results = [ None ] * len(calls)
+        errors = {}
+        pending = {}
+        next_index = 0
+
+        while next_index < len(calls) or pending:
+            while next_index < len(calls) and len(pending) < max_concurrency:
+                pending[self.executor.submit(calls[next_index])] = next_index
+                next_index += 1
+
+            done, not_done = wait(list(pending), return_when = FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                if future.exception() is not None:
+                    errors[i] = future.exception()
+                else:
+                    results[i] = future.result()
+
+        return results, errors
+
+# Shared pool for resolver fan-out.
+resolver_fan_out = FanOut(
+    max_workers = int(os.environ.get('RESOLVER_FAN_OUT_WORKERS', 32)),
+    thread_name_prefix = 'resolver-fan-out'
+)
+
+# Separate pool for the children of ensemble resolvers so an ensemble called from the
+# resolver fan-out (e.g. as an interleaving variation) cannot starve it.
+ensemble_fan_out = FanOut(
+    max_workers = int(os.environ.get('ENSEMBLE_FAN_OUT_WORKERS', 32)),
+    thread_name_prefix = 'ensemble-fan-out'
+)
+
+# Pool for the calls of fallback chain resolvers. Calls that lost a race keep running
+# until their backend answers, so they get their own pool rather than holding up
+# ensemble children (see FallbackChainResolver).
+fallback_fan_out = FanOut(
+    max_workers = int(os.environ.get('FALLBACK_FAN_OUT_WORKERS', 64)),
+    thread_name_prefix = 'fallback-fan-out'
+)
+
+# Pool for batches of requests (see Resolver.get_items_batch) so offline batch jobs
+# do not compete with online requests for the resolver fan-out.
+batch_fan_out = FanOut(
+    max_workers = int(os.environ.get('BATCH_FAN_OUT_WORKERS', 16)),
+    thread_name_prefix = 'batch-fan-out'
+)
@@ -0,0 +1,291 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import sys
+import atexit
+import logging
+import threading
+import boto3
+
+from boto3.dynamodb.types import TypeDeserializer
+
+log = logging.getLogger(__name__)
+
+COUNTER_FIELDS = [ 'exposures', 'conversions' ]
+
+# Maximum number of keys accepted by a single DynamoDB BatchGetItem call.
+BATCH_GET_MAX_KEYS = 100
+
+def shard_item_id(experiment_id, shard):
+    """ Returns the ID of the item holding a counter shard for an experiment """
+    return f'{experiment_id}#counters#{shard}'
+
+def shard_attribute_name(variation, field_name):
+    """ Returns the attribute name of a variation's counter field on a shard item """
+    return f'v{variation}_{field_name}'
+
+def read_variation_counts(table, experiment_id, variation_count, shards = 0):
+    """ Returns the exposure and conversion counts for each variation of an experiment
+
+    For experiments with sharded counters (shards > 0), the counts are the sum of
+    the counter shard items plus any counts still stored inline on the experiment
+    item (i.e. counts recorded before the experiment was migrated to shards).
+
+    Return:
+        List with a dictionary of 'exposures' and 'conversions' per variation
+    """
+    counts = [ { field_name: 0 for field_name in COUNTER_FIELDS } for i in range(variation_count) ]
+
+    keys = [ { 'id': experiment_id } ] + [ { 'id': shard_item_id(experiment_id, shard) } for shard in range(shards) ]
+    items = _batch_get(table, keys) if shards > 0 else [ table.get_item(Key={'id': experiment_id}, ProjectionExpression='variations').get('Item', {}) ]
+
+    for item in items:
+        for i, variation in enumerate(item.get('variations', [])[:variation_count]):
+            for field_name in COUNTER_FIELDS:
+                counts[i][field_name] += int(variation.get(field_name, 0))
+
+        for i in range(variation_count):
+            for field_name in COUNTER_FIELDS:
+                counts[i][field_name] += int(item.get(shard_attribute_name(i, field_name), 0))
+
+    return counts
+
+def migrate_to_sharded_counters(table, experiment_id, shards):
+    """ Switches an experiment with inline counters to sharded counters
+
+    Counts already stored inline on the experiment item (variations[i].exposures
+    and variations[i].conversions) are kept where they are and are included in
+    the summed counts, so nothing needs to be copied and no counts are lost from
+    processes that still write inline until they reload the experiment. The
+    experiment's version is incremented so cached experiments are reloaded.
+    """
+    if shards < 1:
+        raise ValueError('shards must be greater than zero')
+
+    table.update_item(
+        Key={'id': experiment_id},
+        UpdateExpression='SET #shards = :shards, #version = if_not_exists(#version, :zero) + :one',
+        ConditionExpression='attribute_exists(#id)',
+        ExpressionAttributeNames={'#id': 'id', '#shards': 'counter_shards', '#version': 'version'},
+        ExpressionAttributeValues={':shards': shards, ':zero': 0, ':one': 1}
+    )
+
+def _batch_get(table, keys):
+    deserializer = TypeDeserializer()
+    client = table.meta.client
+
+    items = []
+    for i in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        request = { table.table_name: { 'Keys': [ { 'id': { 'S': key['id'] } } for key in keys[i:i + BATCH_GET_MAX_KEYS] ] } }
+
+        while request:
+            response = client.batch_get_item(RequestItems = request)
+            for item in response['Responses'].get(table.table_name, []):
+                items.append({ name: deserializer.deserialize(value) for name, value in item.items() })
+            request = response.get('UnprocessedKeys')
+
+    return items
+
+class CounterAggregator:
+    """ Write-behind aggregation of experiment variation counters
+
+    Exposure and conversion increments are collected in memory per experiment,
+    variation and field, and written periodically (every flush_interval seconds)
+    or as soon as max_pending increments are waiting. Each flush applies a single
+    combined update per experiment instead of one update per increment, which
+    takes the write off the request path and reduces contention on the
+    experiment's item.
+
+    Increments for experiments with sharded counters are aggregated per shard and
+    written to the shard's own item (see shard_item_id) so writes for a popular
+    experiment are spread across partitions.
+
+    Increments that fail to be written are kept and retried on the next flush,
+    up to max_attempts times. Pending increments are flushed when the process
+    exits. With a flush_interval of zero or less, increments are written
+    immediately (write-through).
+    """
+    def __init__(self, flush_interval = 1.0, max_pending = 1000, max_attempts = 3):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+
+        self._pending = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        atexit.register(self.close)
+
+    @property
+    def pending_count(self):
+        """ Number of increments waiting to be written """
+        return self._pending_count
+
+    def increment(self, table, experiment_id, variation, field_name, count = 1, shard = None):
+        """ Queues an increment of a variation's counter field for an experiment
+
+        The increment is written inline on the experiment item when shard is None,
+        otherwise to the given counter shard.
+        """
+        self.increment_many(table, experiment_id, [ (variation, field_name, count, shard) ])
+
+    def increment_many(self, table, experiment_id, increments):
+        """ Queues several increments for an experiment together
+
+        Arguments:
+            increments - list of (variation, field_name, count, shard) tuples
+
+        The increments are queued atomically so they are written in the same flush,
+        i.e. in one combined update per experiment (and counter shard).
+        """
+        with self._lock:
+            for variation, field_name, count, shard in increments:
+                key = (table.table_name, experiment_id, shard)
+                batch = self._pending.get(key)
+                if batch is None:
+                    batch = self._pending[key] = { 'table': table, 'counts': {}, 'increments': 0, 'attempts': 0 }
+
+                counter_key = (int(variation), field_name)
+                batch['counts'][counter_key] = batch['counts'].get(counter_key, 0) + count
+                batch['increments'] += 1
+                self._pending_count += 1
+
+            flush_now = self._pending_count >= self.max_pending
+
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher()
+            if flush_now:
+                self._wakeup.set()
+
+    def flush(self):
+        """ Writes all pending increments, one combined update per experiment
+
+        Returns True if all increments were written.
+        """
+        written = True
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+                self._pending_count = 0
+
+            for (table_name, experiment_id, shard), batch in pending.items():
+                try:
+                    if shard is None:
+                        self._write(batch['table'], experiment_id, batch['counts'])
+                    else:
+                        self._write_shard(batch['table'], experiment_id, shard, batch['counts'])
+                except Exception as e:
+                    written = False
+                    batch['attempts'] += 1
+                    if batch['attempts'] >= self.max_attempts:
+                        log.error(f'CounterAggregator - dropping counts {batch["counts"]} for experiment {experiment_id} after {batch["attempts"]} attempts: {e}')
+                    else:
+                        log.warning(f'CounterAggregator - unable to write counts for experiment {experiment_id}, will retry: {e}')
+                        self._requeue((table_name, experiment_id, shard), batch)
+
+        return written
+
+    def close(self):
+        """ Flushes pending increments; called automatically at process exit """
+        if self._pending_count > 0:
+            self.flush()
+
+    def _write(self, table, experiment_id, counts):
+        updates = []
+        values = { ':zero': 0 }
+        for i, ((variation, field_name), count) in enumerate(sorted(counts.items())):
+            path = f'variations[{variation}].{field_name}'
+            updates.append(f'{path} = if_not_exists({path}, :zero) + :incr{i}')
+            values[f':incr{i}'] = count
+
+        log.debug(f'CounterAggregator - writing counts {counts} for experiment {experiment_id}')
+
+        table.update_item(
+            Key={'id': experiment_id},
+            UpdateExpression='SET ' + ', '.join(updates),
+            ExpressionAttributeValues=values
+        )
+
+    def _write_shard(self, table, experiment_id, shard, counts):
+        updates = []
+        values = { ':experiment_id': experiment_id }
+        for i, ((variation, field_name), count) in enumerate(sorted(counts.items())):
+            updates.append(f'{shard_attribute_name(variation, field_name)} :incr{i}')
+            values[f':incr{i}'] = count
+
+        log.debug(f'CounterAggregator - writing counts {counts} for experiment {experiment_id} shard {shard}')
+
+        table.update_item(
+            Key={'id': shard_item_id(experiment_id, shard)},
+            UpdateExpression='SET experiment_id = :experiment_id ADD ' + ', '.join(updates),
+            ExpressionAttributeValues=values
+        )
+
+    def _requeue(self, key, batch):
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None:
+                self._pending[key] = batch
+            else:
+                for counter_key, count in batch['counts'].items():
+                    current['counts'][counter_key] = current['counts'].get(counter_key, 0) + count
+                current['increments'] += batch['increments']
+                current['attempts'] = max(current['attempts'], batch['attempts'])
+            # pending_count counts increments (as in increment_many), not counter keys
+            self._pending_count += batch['increments']
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process
+
+        Increments pending in the parent are dropped from the child's copy since
+        the parent writes them.
+        """
+        self._pending = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork so the flusher is (re)started lazily in each process.
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target = self._run, name = 'counter-aggregator', daemon = True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception('CounterAggregator - unexpected error flushing counts')
+
+# Shared aggregator for experiment counters.
+counter_aggregator = CounterAggregator(
+    flush_interval = float(os.environ.get('EXPERIMENT_COUNTER_FLUSH_INTERVAL', 1)),
+    max_pending = int(os.environ.get('EXPERIMENT_COUNTER_MAX_PENDING', 1000))
+)
+
+if __name__ == '__main__':
+    # Migrates an experiment from inline counters to sharded counters.
+    if len(sys.argv) != 4:
+        print('Usage: python -m experimentation.counters TABLE_NAME EXPERIMENT_ID SHARDS')
+        sys.exit(1)
+
+    table = boto3.resource('dynamodb').Table(sys.argv[1])
+    migrate_to_sharded_counters(table, sys.argv[2], int(sys.argv[3]))
+    print(f'Experiment {sys.argv[2]} now uses {sys.argv[3]} counter shards')
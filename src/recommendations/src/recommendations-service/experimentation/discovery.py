@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import itertools
+import logging
+import threading
+import time
+import boto3
+
+log = logging.getLogger(__name__)
+
+class ServiceDiscoveryCache:
+    """ Caches healthy instances of services registered in AWS Cloud Map
+
+    Looking up service instances is a control-plane call so the healthy instance
+    set for each service is kept in memory for ttl seconds. Once that passes,
+    the cached instances keep being served while a refresh runs in a background
+    thread. If discovery fails or returns no healthy instances, the previously
+    discovered instances stay in use and the refresh is retried after
+    retry_interval seconds. Only the very first lookup for a service blocks.
+
+    Requests are spread across all healthy instances in round-robin order.
+    """
+    def __init__(self, namespace = 'retaildemostore.local', ttl = 30, retry_interval = 5, client = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._client = client
+        self._own_client = client is None
+
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def get_host(self, service_name):
+        """ Returns the host/IP of a healthy instance of the service, rotating across instances """
+        entry = self._get_entry(service_name)
+        hosts = entry['hosts']
+        return hosts[next(entry['counter']) % len(hosts)]
+
+    def get_hosts(self, service_name):
+        """ Returns the hosts/IPs of all known healthy instances of the service """
+        return list(self._get_entry(service_name)['hosts'])
+
+    def invalidate(self, service_name = None):
+        """ Forces instances to be rediscovered on next use for a service (or all services) """
+        with self._lock:
+            if service_name:
+                self._services.pop(service_name, None)
+            else:
+                self._services.clear()
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process
+
+        Discovered instances are kept. The boto3 client is recreated on next use
+        and refreshes that were running in the parent are forgotten.
+        """
+        self._lock = threading.Lock()
+        for entry in list(self._services.values()):
+            entry['refreshing'] = False
+        if self._own_client:
+            self._client = None
+
+    def _get_entry(self, service_name):
+        entry = self._services.get(service_name)
+
+        if entry is None:
+            with self._lock:
+                entry = self._services.get(service_name)
+                if entry is None:
+                    entry = {
+                        'hosts': self._discover(service_name),
+                        'counter': itertools.count(),
+                        'refresh_at': time.monotonic() + self.ttl,
+                        'refreshing': False
+                    }
+                    self._services[service_name] = entry
+        elif entry['refresh_at'] <= time.monotonic() and not entry['refreshing']:
+            with self._lock:
+                if not entry['refreshing']:
+                    entry['refreshing'] = True
+                    threading.Thread(target = self._refresh, args = (service_name, entry), daemon = True).start()
+
+        return entry
+
+    def _refresh(self, service_name, entry):
+        try:
+            entry['hosts'] = self._discover(service_name)
+            entry['refresh_at'] = time.monotonic() + self.ttl
+        except Exception as e:
+            log.warning(f'ServiceDiscoveryCache - unable to refresh instances for {service_name}, keeping {entry["hosts"]}: {e}')
+            entry['refresh_at'] = time.monotonic() + self.retry_interval
+        finally:
+            entry['refreshing'] = False
+
+    def _discover(self, service_name):
+        if self._client is None:
+            self._client = boto3.client('servicediscovery')
+
+        response = self._client.discover_instances(
+            NamespaceName=self.namespace,
+            ServiceName=service_name,
+            HealthStatus='HEALTHY'
+        )
+
+        hosts = [ instance['Attributes']['AWS_INSTANCE_IPV4'] for instance in response['Instances'] ]
+        if not hosts:
+            raise Exception(f'No healthy instances found for service {service_name}')
+
+        log.debug(f'ServiceDiscoveryCache - discovered instances for {service_name}: {hosts}')
+        return hosts
+
+# Shared discovery cache for the service.
+service_discovery = ServiceDiscoveryCache(
+    ttl = float(os.environ.get('SERVICE_DISCOVERY_TTL', 30))
+)
@@ -1,11 +1,16 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import functools
 import logging
+import random
+import time
+import zlib
 
-from botocore.exceptions import ClientError
 from abc import ABC, abstractmethod
-from experimentation.resolvers import ResolverFactory
+from experimentation.concurrency import batch_fan_out
+from experimentation.counters import counter_aggregator, read_variation_counts
+from experimentation.resolvers import ResolverFactory, BATCH_CONCURRENCY
 
 log = logging.getLogger(__name__)
 
@@ -17,6 +22,10 @@ class Variation:
 class Experiment(ABC):
     """ Base class for all experiment types """
 
+    # Set by experiment types that use the exposure/conversion counts of variations
+    # when serving requests so that cached experiments have their counts refreshed.
+    uses_variation_counts = False
+
     def __init__(self, table, **data):
         self._table = table
         self.id = data['id']
@@ -25,16 +34,43 @@ class Experiment(ABC):
         self.status = data['status']
         self.type = data['type']
 
+        # Number of counter shard items for exposure/conversion counts (0 to store counts inline on the experiment).
+        self.counter_shards = int(data.get('counter_shards', 0))
+
         self.variations = []
 
         for v in data['variations']:
             self.variations.append(Variation(**v))
 
+    def bind_table(self, table):
+        """ Replaces the experiment strategy table used for counts (e.g. with one created after a fork) """
+        self._table = table
+
     @abstractmethod
     def get_items(self, user_id, current_item_id = None, item_list = None, num_results = 10, tracker = None):
         """ For a given user, returns item recommendations for this experiment along with experiment tracking/correlation information """
         pass
 
+    def get_items_batch(self, requests, tracker = None, max_concurrency = None):
+        """ Returns item recommendations for each of a batch of users (see get_items)
+
+        Each user is assigned a variation exactly as for get_items. The default
+        implementation calls get_items for each request on the batch fan-out pool
+        with at most max_concurrency requests in flight.
+
+        Arguments:
+            requests - list of dictionaries of get_items parameters (user_id, current_item_id, item_list, num_results), one per user
+            tracker - optional tracker to log an exposure event for each user
+            max_concurrency - maximum number of requests resolved at once (default RESOLVER_BATCH_CONCURRENCY or 8)
+
+        Return:
+            Tuple of (results, errors) where results holds the items of each request in the
+            order of requests (None for failed requests) and errors maps the index of each
+            failed request to the exception raised
+        """
+        calls = [ functools.partial(self.get_items, tracker = tracker, **request) for request in requests ]
+        return batch_fan_out.run_limited(calls, max_concurrency or BATCH_CONCURRENCY)
+
     def track_conversion(self, user_id, variation_index, result_rank):
         """ Call this method to track a conversion/outcome for an experiment """
         if variation_index < 0 or variation_index >= len(self.variations):
@@ -42,40 +78,80 @@ class Experiment(ABC):
 
         log.debug(f'Incrementing conversion count for variation {variation_index}, rank {result_rank}, based on user {user_id}')
 
-        return self._increment_convert_count(variation_index)
+        return self._increment_convert_count(variation_index, user_id = user_id)
+
+    def track_conversions(self, conversions, tracker = None):
+        """ Call this method to track a batch of conversions/outcomes for an experiment
+
+        Arguments:
+            conversions - list of (user_id, variation_index, result_rank) tuples
+            tracker - optional tracker to log an outcome event for each conversion
+
+        Conversion counts for the batch are combined and queued together so they are
+        written in one update per experiment (and counter shard).
+        """
+        for user_id, variation_index, result_rank in conversions:
+            if variation_index < 0 or variation_index >= len(self.variations):
+                raise Exception('variation_index is out of bounds')
+
+        log.debug(f'Incrementing conversion counts for {len(conversions)} conversions for experiment {self.id}')
+
+        increments = {}
+        for user_id, variation_index, result_rank in conversions:
+            key = (variation_index, self._counter_shard(user_id))
+            increments[key] = increments.get(key, 0) + 1
+
+        counter_aggregator.increment_many(self._table, self.id,
+            [ (variation_index, 'conversions', count, shard) for (variation_index, shard), count in increments.items() ])
+
+        if tracker is not None:
+            timestamp = int(round(time.time() * 1000))
+            tracker.log_outcomes([ {
+                'event_type': 'Experiment Outcome',
+                'event_timestamp': timestamp,
+                'attributes': {
+                    'user_id': user_id,
+                    'experiment': {
+                        'id': self.id,
+                        'feature': self.feature,
+                        'name': self.name,
+                        'type': self.type
+                    },
+                    'variation_index': variation_index,
+                    'result_rank': result_rank,
+                    'correlation_id': self._create_correlation_id(user_id, variation_index, result_rank)
+                }
+            } for user_id, variation_index, result_rank in conversions ])
+
+    def refresh_counts(self):
+        """ Reloads the exposure and conversion counts of this experiment's variations
 
-    def _increment_exposure_count(self, variation, count = 1):
+        For sharded counters, the counts are summed across all shards.
+        """
+        counts = read_variation_counts(self._table, self.id, len(self.variations), self.counter_shards)
+
+        for variation, variation_counts in zip(self.variations, counts):
+            variation.config.update(variation_counts)
+
+    def _increment_exposure_count(self, variation, count = 1, user_id = None):
         """ Call this method when a user is exposed to a variation of an experiment """
-        return self.__increment_variation_count('exposures', variation, count)
+        return self.__increment_variation_count('exposures', variation, count, user_id)
 
-    def _increment_convert_count(self, variation, count = 1):
+    def _increment_convert_count(self, variation, count = 1, user_id = None):
         """ Call this method when a user converts for a variation of an experiment """
-        return self.__increment_variation_count('conversions', variation, count)
-
-    def __increment_variation_count(self, field_name, variation, count = 1):
-        try:
-            response = self._table.update_item(
-                Key={'id': self.id},
-                UpdateExpression=f'SET variations[{variation}].{field_name} = variations[{variation}].{field_name} + :incr',
-                ExpressionAttributeValues={
-                    ':incr': count
-                },
-                ReturnValues='UPDATED_NEW'
-            )
-            return int(response['Attributes']['variations'][0][field_name])
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ValidationException':
-                response = self._table.update_item(
-                    Key={'id': self.id},
-                    UpdateExpression=f'SET variations[{variation}].{field_name} = :incr',
-                    ExpressionAttributeValues={
-                        ':incr': count
-                    },
-                    ReturnValues='UPDATED_NEW'
-                )
-                return int(response['Attributes']['variations'][0][field_name])
-            else:
-                raise e
+        return self.__increment_variation_count('conversions', variation, count, user_id)
+
+    def __increment_variation_count(self, field_name, variation, count = 1, user_id = None):
+        # Increments are aggregated in memory and written behind in combined updates.
+        counter_aggregator.increment(self._table, self.id, variation, field_name, count, self._counter_shard(user_id))
+
+    def _counter_shard(self, user_id):
+        """ Returns the counter shard for a user (spreading writes across shards) or None for inline counters """
+        if self.counter_shards < 1:
+            return None
+        if user_id is None:
+            return random.randrange(self.counter_shards)
+        return zlib.crc32(str(user_id).encode('utf-8')) % self.counter_shards
 
     def _create_correlation_id(self, user_id, variation_index, result_rank):
         """ Returns an identifier representing a recommended item for an experiment """
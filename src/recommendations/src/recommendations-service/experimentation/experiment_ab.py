@@ -1,15 +1,75 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import os
+import sys
 import time
 import hashlib
 import logging
+import functools
+import itertools
+import numpy as np
 
 from experimentation.experiment import Experiment, Variation
 from experimentation.tracking import Tracker
 
 log = logging.getLogger(__name__)
 
+# Number of user assignments remembered for repeat users. The cache is shared by all
+# A/B experiments in the process, so it holds assignments across experiments.
+ASSIGNMENT_CACHE_SIZE = int(os.environ.get('AB_ASSIGNMENT_CACHE_SIZE', 100000))
+
+def variation_hasher(feature, name):
+    """ Returns a SHA-1 hash object primed with the experiment's prefix of the assignment key
+
+    Copying the primed hash and adding the user ID gives the same digest as hashing
+    'experiments.{feature}.{name}.{user_id}' in full.
+    """
+    return hashlib.sha1(f'experiments.{feature}.{name}.'.encode('ascii'))
+
+def _hash_int(hasher, user_id):
+    # The first 8 bytes of the digest shifted right 4 bits equal its first 15 hex digits.
+    h = hasher.copy()
+    h.update(str(user_id).encode('ascii'))
+    return int.from_bytes(h.digest()[:8], 'big') >> 4
+
+def assign_variation_indexes(feature, name, variation_count, user_ids):
+    """ Returns a numpy array with the variation index of each user ID for an A/B experiment
+
+    Uses the same bucketing as ABExperiment.calculate_variation_index.
+    """
+    if variation_count == 0:
+        return np.array([ -1 for user_id in user_ids ], dtype = np.int64)
+
+    copy = variation_hasher(feature, name).copy
+
+    def digest(user_id):
+        h = copy()
+        h.update(str(user_id).encode('ascii'))
+        return h.digest()
+
+    # Convert the leading 8 bytes of all digests at once
+    digests = np.frombuffer(b''.join(map(digest, user_ids)), dtype = np.uint8).reshape(-1, 20)
+    hashes = np.ascontiguousarray(digests[:, :8]).view('>u8').ravel() >> np.uint64(4)
+    return (hashes % np.uint64(variation_count)).astype(np.int64)
+
+def stream_variation_indexes(feature, name, variation_count, user_ids, chunk_size = 100000):
+    """ Yields (user IDs, variation indexes array) for chunks of an iterable of user IDs
+
+    Only one chunk is held in memory at a time so arbitrarily large inputs (e.g. the
+    lines of a file) can be assigned.
+    """
+    user_ids = iter(user_ids)
+    while True:
+        chunk = list(itertools.islice(user_ids, chunk_size))
+        if not chunk:
+            break
+        yield chunk, assign_variation_indexes(feature, name, variation_count, chunk)
+
+@functools.lru_cache(maxsize = ASSIGNMENT_CACHE_SIZE)
+def _cached_variation_index(feature, name, variation_count, user_id):
+    return _hash_int(variation_hasher(feature, name), user_id) % variation_count
+
 class ABExperiment(Experiment):
     """ Implements a traditional A/B/n test across 2 or more variations where users are randomly and consistently partitioned across n groups """
 
@@ -27,20 +87,64 @@ class ABExperiment(Experiment):
         log.debug(f'{self._getClassName()} - assigned user {user_id} to variation {variation_idx} for experiment {self.feature}.{self.name}')
 
         # Increment exposure counter for variation for this experiment.
-        self._increment_exposure_count(variation_idx)
+        self._increment_exposure_count(variation_idx, user_id = user_id)
 
         # Get item recommendations from the variation's resolver.
         variation = self.variations[variation_idx]
 
-        resolve_params = {
+        items = variation.resolver.get_items(**self._resolve_params(user_id, current_item_id, item_list, num_results))
+
+        return self._expose(user_id, variation_idx, items, tracker)
+
+    def get_items_batch(self, requests, tracker = None, max_concurrency = None):
+        """ Returns item recommendations for each of a batch of users (see Experiment.get_items_batch)
+
+        Users are assigned to variations in bulk and the requests of all users assigned
+        to a variation are resolved with one get_items_batch call to its resolver.
+        """
+        if len(self.variations) < 2:
+            raise Exception(f'Experiment {self.id} does not have 2 or more variations')
+        for request in requests:
+            if not request.get('user_id'):
+                raise Exception('user_id is required')
+
+        variation_indexes = self.calculate_variation_indexes([ request['user_id'] for request in requests ])
+
+        results = [ None ] * len(requests)
+        errors = {}
+
+        for variation_idx, variation in enumerate(self.variations):
+            indexes = np.flatnonzero(variation_indexes == variation_idx).tolist()
+            if not indexes:
+                continue
+
+            log.debug(f'{self._getClassName()} - resolving {len(indexes)} users assigned to variation {variation_idx} for experiment {self.feature}.{self.name}')
+
+            for i in indexes:
+                self._increment_exposure_count(variation_idx, user_id = requests[i]['user_id'])
+
+            variation_results, variation_errors = variation.resolver.get_items_batch(
+                [ self._resolve_params(**requests[i]) for i in indexes ], max_concurrency = max_concurrency)
+
+            for j, i in enumerate(indexes):
+                if j in variation_errors:
+                    errors[i] = variation_errors[j]
+                else:
+                    results[i] = self._expose(requests[i]['user_id'], variation_idx, variation_results[j], tracker)
+
+        return results, errors
+
+    @staticmethod
+    def _resolve_params(user_id, current_item_id = None, item_list = None, num_results = 10):
+        return {
             'user_id': user_id,
             'product_id': current_item_id,
             'product_list': item_list,
             'num_results': num_results
         }
-        items = variation.resolver.get_items(**resolve_params)
 
-        # Inject experiment details into recommended item list.
+    def _expose(self, user_id, variation_idx, items, tracker):
+        """ Injects experiment details into the user's recommended items and logs the exposure to tracker """
         rank = 1
         for item in items:
             correlation_id = self._create_correlation_id(user_id, variation_idx, rank)
@@ -75,7 +179,7 @@ class ABExperiment(Experiment):
                         'type': self.type
                     },
                     'variation_index': variation_idx,
-                    'variation': variation.config
+                    'variation': self.variations[variation_idx].config
                 }
             }
 
@@ -92,8 +196,21 @@ class ABExperiment(Experiment):
         if len(self.variations) == 0:
             return -1
 
-        hash_str = f'experiments.{self.feature}.{self.name}.{user_id}'.encode('ascii')
-        hash_int = int(hashlib.sha1(hash_str).hexdigest()[:15], 16)
-        index = hash_int % len(self.variations)
+        return _cached_variation_index(self.feature, self.name, len(self.variations), user_id)
+
+    def calculate_variation_indexes(self, user_ids):
+        """ Returns a numpy array with the variation index of each user ID (bulk calculate_variation_index) """
+        return assign_variation_indexes(self.feature, self.name, len(self.variations), user_ids)
+
+if __name__ == '__main__':
+    # Assigns the user IDs in a file (one per line) to variations, writing "user_id,variation_index" lines.
+    if len(sys.argv) != 6:
+        print('Usage: python -m experimentation.experiment_ab FEATURE NAME VARIATION_COUNT INPUT_FILE OUTPUT_FILE')
+        sys.exit(1)
+
+    feature, name, variation_count, input_file, output_file = sys.argv[1:]
 
-        return index
+    with open(input_file) as f_in, open(output_file, 'w') as f_out:
+        user_ids = (line.strip() for line in f_in if line.strip())
+        for chunk, indexes in stream_variation_indexes(feature, name, int(variation_count), user_ids):
+            f_out.writelines(f'{user_id},{index}\n' for user_id, index in zip(chunk, indexes))
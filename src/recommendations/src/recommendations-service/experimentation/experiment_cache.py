@@ -0,0 +1,169 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import logging
+import threading
+import time
+
+from experimentation.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+class _CacheEntry:
+    def __init__(self, experiment, signature):
+        now = time.monotonic()
+        self.experiment = experiment
+        self.signature = signature
+        self.loaded_at = now
+        self.checked_at = now
+        self.counts_at = now
+        self.refreshing = False
+
+class ExperimentCache:
+    """ Per-process cache of compiled experiments
+
+    Compiling an experiment (i.e. creating the Experiment and a resolver for each
+    of its variations) is done once and the result is kept in memory under a key
+    such as the feature name or experiment ID. Lookups on the request path are
+    in-memory; revalidation happens in a background thread:
+
+    - every ttl seconds a cheap signature of the experiment is checked (e.g. the
+      active experiment ID and its version) and the experiment is only reloaded
+      and recompiled when the signature changed,
+    - after max_age seconds the experiment is reloaded regardless,
+    - for experiments that use variation counts (e.g. multi-armed bandit), the
+      counts are refreshed every counts_interval seconds.
+
+    Cached entries keep being served while they are revalidated and if
+    revalidation fails.
+
+    Keys can come from user input (e.g. correlation IDs of outcomes) so at most
+    max_size keys are kept, evicting the least recently used, and keys without
+    an experiment are dropped once they have not been revalidated for
+    negative_ttl seconds. A key is loaded while holding a lock for that key
+    only, so a slow load does not block lookups of other keys.
+    """
+    def __init__(self, ttl = 30, max_age = 300, counts_interval = 5, max_size = 1000, negative_ttl = 60, background = True):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.counts_interval = counts_interval
+        self.negative_ttl = negative_ttl
+        self.background = background
+
+        self._entries = LRUCache(max_size = max_size)
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load, check):
+        """ Returns the cached experiment for key (which may be None)
+
+        Arguments:
+            key - cache key
+            load - function returning (experiment, signature) for key
+            check - function returning the current signature for key
+        """
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return self._load(key, load).experiment
+
+        now = time.monotonic()
+        revalidate = now - entry.checked_at >= self.ttl or now - entry.loaded_at >= self.max_age
+        refresh_counts = (entry.experiment is not None and entry.experiment.uses_variation_counts and
+            now - entry.counts_at >= self.counts_interval)
+
+        if (revalidate or refresh_counts) and not entry.refreshing:
+            with self._lock:
+                if entry.refreshing:
+                    return entry.experiment
+                entry.refreshing = True
+
+            if self.background:
+                threading.Thread(target = self._revalidate, args = (key, entry, load, check, revalidate, refresh_counts), daemon = True).start()
+            else:
+                self._revalidate(key, entry, load, check, revalidate, refresh_counts)
+
+        return self._entries.get(key, entry).experiment
+
+    def put(self, key, experiment, signature = None):
+        """ Adds an already compiled experiment to the cache """
+        self._put(key, _CacheEntry(experiment, signature))
+
+    def invalidate(self, key = None):
+        """ Removes key (or all keys) from the cache so it is reloaded on next use """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.invalidate(key)
+
+    def experiments(self):
+        """ Returns the distinct experiments currently in the cache """
+        experiments = {}
+        for entry in self._entries.values():
+            if entry.experiment is not None:
+                experiments[id(entry.experiment)] = entry.experiment
+        return list(experiments.values())
+
+    def stats(self):
+        """ Returns a dictionary of cache counters """
+        return self._entries.stats()
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process
+
+        Cached experiments are kept; revalidations that were running in the
+        parent are forgotten so they are started again in the child.
+        """
+        self._lock = threading.Lock()
+        self._loading = {}
+        for entry in self._entries.values():
+            entry.refreshing = False
+
+    def _load(self, key, load):
+        """ Loads key unless another thread already did, holding only the lock for key """
+        with self._lock:
+            lock = self._loading.setdefault(key, threading.Lock())
+
+        try:
+            with lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    experiment, signature = load()
+                    entry = _CacheEntry(experiment, signature)
+                    self._put(key, entry)
+                return entry
+        finally:
+            with self._lock:
+                if self._loading.get(key) is lock:
+                    del self._loading[key]
+
+    def _put(self, key, entry):
+        self._entries.put(key, entry, ttl = self.negative_ttl if entry.experiment is None else None)
+
+    def _revalidate(self, key, entry, load, check, revalidate, refresh_counts):
+        try:
+            now = time.monotonic()
+
+            if revalidate:
+                signature = check() if now - entry.loaded_at < self.max_age else None
+
+                if signature is not None and signature == entry.signature:
+                    entry.checked_at = now
+                    if entry.experiment is None:
+                        # Keys that are still looked up keep their negative entry
+                        self._put(key, entry)
+                else:
+                    log.debug(f'ExperimentCache - reloading experiment for {key}')
+                    experiment, signature = load()
+                    self._put(key, _CacheEntry(experiment, signature))
+                    return
+
+            if refresh_counts:
+                entry.experiment.refresh_counts()
+                entry.counts_at = now
+        except Exception as e:
+            log.warning(f'ExperimentCache - unable to revalidate experiment for {key}: {e}')
+            entry.checked_at = time.monotonic()
+            entry.counts_at = entry.checked_at
+        finally:
+            entry.refreshing = False
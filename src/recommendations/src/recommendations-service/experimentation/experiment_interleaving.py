@@ -1,11 +1,13 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import random
+import os
 import time
 import logging
 
 from botocore.exceptions import ClientError
+from experimentation import interleaving
+from experimentation.concurrency import resolver_fan_out, SKIPPED, TIMEOUT
 from experimentation.experiment import Experiment
 
 log = logging.getLogger(__name__)
@@ -13,13 +15,31 @@ log = logging.getLogger(__name__)
 class InterleavingExperiment(Experiment):
     """ Implements interleaving technique described in research paper by 
     Chapelle et al http://olivier.chapelle.cc/pub/interleaving.pdf
+
+    Also supports multileaving and probabilistic interleaving (see the
+    interleaving module), which are better suited to experiments with many
+    variations.
+
+    Items for all variations are retrieved concurrently. A variation whose resolver
+    fails or does not respond within resolver_timeout seconds is left out of the
+    interleaved result and reported in the exposure event.
+
+    Resolver calls that time out keep running on the shared resolver fan-out pool.
+    So that one slow resolver cannot take over the pool, a resolver that already has
+    resolver_max_in_flight calls running is not called and its variation is reported
+    as timed out.
     """
     METHOD_BALANCED = 'balanced'
     METHOD_TEAM_DRAFT = 'team-draft'
+    METHOD_MULTILEAVE = 'multileave'
+    METHOD_PROBABILISTIC = 'probabilistic'
 
     def __init__(self, table, **data):
         super(InterleavingExperiment, self).__init__(table, **data)
         self.method = data.get('method', InterleavingExperiment.METHOD_BALANCED)
+        self.resolver_timeout = float(data.get('resolver_timeout', os.environ.get('INTERLEAVING_RESOLVER_TIMEOUT', 2)))
+        max_in_flight = data.get('resolver_max_in_flight', os.environ.get('INTERLEAVING_RESOLVER_MAX_IN_FLIGHT'))
+        self.resolver_max_in_flight = int(max_in_flight) if max_in_flight is not None else None
 
     def get_items(self, user_id, current_item_id = None, item_list = None, num_results = 10, tracker = None):
         if not user_id:
@@ -27,9 +47,6 @@ class InterleavingExperiment(Experiment):
         if len(self.variations) < 2:
             raise Exception(f'Experiment {self.id} does not have 2 or more variations')
 
-        # Initialize array structure to hold item recommendations for each variation
-        variations_data = [[] for x in range(len(self.variations))]
-
         resolve_params = {
             'user_id': user_id,
             'product_id': current_item_id,
@@ -37,22 +54,39 @@ class InterleavingExperiment(Experiment):
             'num_results': num_results * 3  # account for overlaps
         }
 
-        # Get recomended items for each variation
-        for i in range(len(self.variations)):
-            variation = self.variations[i]
-            items = variation.resolver.get_items(**resolve_params)
-            variations_data[i] = items
-
-        # Interleave items to produce result
-        interleaved = []
-        if self.method == InterleavingExperiment.METHOD_TEAM_DRAFT:
-            interleaved = self._interleave_team_draft(user_id, variations_data, num_results)
-        else:
-            interleaved = self._interleave_balanced(user_id, variations_data, num_results)
-
-        # Increment exposure for each variation (can be optimized)
-        for i in range(len(self.variations)):
-            self._increment_exposure_count(i)
+        # Get recomended items for all variations concurrently
+        calls = [ lambda resolver = variation.resolver: resolver.get_items(**resolve_params) for variation in self.variations ]
+        max_in_flight = self.resolver_max_in_flight or max(1, resolver_fan_out.max_workers // 2)
+        results, errors = resolver_fan_out.run(calls, timeout = self.resolver_timeout,
+            keys = [ variation.resolver for variation in self.variations ], max_in_flight = max_in_flight)
+
+        # Skipped resolvers are reported as timed out since their earlier calls are still running
+        timeouts = sorted(i for i, error in errors.items() if error in (TIMEOUT, SKIPPED))
+        failures = sorted(i for i, error in errors.items() if error not in (TIMEOUT, SKIPPED))
+        for i in timeouts:
+            if errors[i] is SKIPPED:
+                log.warning(f'InterleavingExperiment - resolver for variation {i} of experiment {self.id} skipped with {max_in_flight} calls still running')
+            else:
+                log.warning(f'InterleavingExperiment - resolver for variation {i} of experiment {self.id} timed out after {self.resolver_timeout}s')
+        for i in failures:
+            log.warning(f'InterleavingExperiment - resolver for variation {i} of experiment {self.id} failed: {errors[i]}')
+
+        # Only interleave variations that returned items
+        variation_indexes = [ i for i in range(len(self.variations)) if i not in errors ]
+        if not variation_indexes:
+            if failures:
+                raise errors[failures[0]]
+            raise Exception(f'All resolvers for experiment {self.id} timed out after {self.resolver_timeout}s')
+
+        variations_data = [ results[i] for i in variation_indexes ]
+
+        # Interleave items to produce result (balanced unless another supported method is configured)
+        method = interleaving.METHODS.get(self.method, interleaving.balanced)
+        interleaved = self._interleave(method, user_id, variations_data, num_results, variation_indexes)
+
+        # Increment exposure for each variation that contributed (can be optimized)
+        for i in variation_indexes:
+            self._increment_exposure_count(i, user_id = user_id)
 
         if tracker is not None:
             # Track exposure details
@@ -79,6 +113,11 @@ class InterleavingExperiment(Experiment):
                 }
             }
 
+            if timeouts:
+                event['attributes']['timeouts'] = timeouts
+            if failures:
+                event['attributes']['failures'] = failures
+
             tracker.log_exposure(event)
 
         return interleaved
@@ -105,54 +144,13 @@ class InterleavingExperiment(Experiment):
 
     Output: list of interleaved results from all rankings
     """
-    def _interleave_balanced(self, user_id, list_of_item_lists, count):
-        """ Returns interleaved list of items following the balanced method """
-        # Randomize selection order of lists
-        selection_order = list(range(len(list_of_item_lists)))
-        random.shuffle(selection_order)
+    def _interleave_balanced(self, user_id, list_of_item_lists, count, variation_indexes = None):
+        """ Returns interleaved list of items following the balanced method
 
-        # Holds next selection offset into each variation list
-        offsets = [0] * len(list_of_item_lists)
-
-        result = []
-        while len(result) < count:
-            # Find lowest offset to determine which variation list to pull next result
-            next_idx = 0
-            for i in range(len(offsets)):
-                if (offsets[i] < offsets[next_idx] and 
-                        offsets[i] < len(list_of_item_lists[selection_order[i]])):
-                    next_idx = i
-
-            # As soon as we reach end of a variation list, we're done
-            if offsets[next_idx] >= len(list_of_item_lists[selection_order[next_idx]]):
-                break
-
-            # Add value to result if not already there
-            item = list_of_item_lists[selection_order[next_idx]][offsets[next_idx]]
-            if not any(i['itemId'] == item['itemId'] for i in result):
-                variation_idx = selection_order[next_idx]
-                correlation_id = self._create_correlation_id(user_id, variation_idx, len(result) + 1)
-
-                item_experiment = {
-                    'id': self.id,
-                    'feature': self.feature,
-                    'name': self.name,
-                    'type': self.type,
-                    'method': self.method,
-                    'variationIndex': variation_idx,
-                    'resultRank': len(result) + 1,
-                    'correlationId': correlation_id
-                }
-
-                item.update({ 
-                    'experiment': item_experiment
-                })
-
-                result.append(item)
-            
-            offsets[next_idx] = offsets[next_idx] + 1 
-        
-        return result
+        variation_indexes optionally maps each list to the index of its variation
+        (e.g. when some variations are left out); by default list i is variation i.
+        """
+        return self._interleave(interleaving.balanced, user_id, list_of_item_lists, count, variation_indexes)
 
     """
     Implements the team-draft interleaving method described in the Interleaving 
@@ -179,65 +177,39 @@ class InterleavingExperiment(Experiment):
 
     Output: list of interleaved results from all rankings
     """
-    def _interleave_team_draft(self, user_id, list_of_item_lists, count):
-        """ Returns interleaved list of items following the team draft method """
-        # List of team rosters
-        teams = [[] for x in range(len(list_of_item_lists))]
+    def _interleave_team_draft(self, user_id, list_of_item_lists, count, variation_indexes = None):
+        """ Returns interleaved list of items following the team draft method
 
-        # Offsets into list of item lists
-        offsets = [0] * len(list_of_item_lists)
+        variation_indexes optionally maps each list to the index of its variation
+        (e.g. when some variations are left out); by default list i is variation i.
+        """
+        return self._interleave(interleaving.team_draft, user_id, list_of_item_lists, count, variation_indexes)
 
-        result = []
-        while len(result) < count:
-            # Team offsets keyed by team size
-            size_teams = {}
-            for i in range(len(teams)):
-                team_size = len(teams[i])
-                teams_at_size = size_teams.get(team_size, [])
-                teams_at_size.append(i)
-                size_teams[team_size] = teams_at_size
+    def _interleave(self, method, user_id, list_of_item_lists, count, variation_indexes = None):
+        """ Interleaves items with an interleaving method and annotates each item with experiment details """
+        if variation_indexes is None:
+            variation_indexes = list(range(len(list_of_item_lists)))
 
-            # List of team offsets with smallest size
-            ordered_keys = sorted(size_teams.keys())
-            smallest_teams = size_teams.get(ordered_keys[0])
-
-            # Choose an offset at random from smallest team offsets
-            team_index = random.choice(smallest_teams)
-
-            next_offset = offsets[team_index]
-            items = list_of_item_lists[team_index]
-
-            while next_offset < len(items):
-                offsets[team_index] = next_offset + 1
-
-                item = items[next_offset]
-                if not any(i['itemId'] == item['itemId'] for i in result):
-                    correlation_id = self._create_correlation_id(user_id, team_index, len(result) + 1)
-
-                    item_experiment = {
-                        'id': self.id,
-                        'feature': self.feature,
-                        'name': self.name,
-                        'type': self.type,
-                        'method': self.method,
-                        'variationIndex': team_index,
-                        'resultRank': len(result) + 1,
-                        'correlationId': correlation_id
-                    }
-
-                    item.update({ 
-                        'experiment': item_experiment
-                    })
-
-                    # Add item to result and team roster
-                    result.append(item)
-                    teams[team_index].append(item)
-                    break
+        result = []
+        for list_idx, item in method(list_of_item_lists, count):
+            variation_idx = variation_indexes[list_idx]
+            correlation_id = self._create_correlation_id(user_id, variation_idx, len(result) + 1)
+
+            item_experiment = {
+                'id': self.id,
+                'feature': self.feature,
+                'name': self.name,
+                'type': self.type,
+                'method': self.method,
+                'variationIndex': variation_idx,
+                'resultRank': len(result) + 1,
+                'correlationId': correlation_id
+            }
 
-                next_offset += 1
+            item.update({ 
+                'experiment': item_experiment
+            })
 
-            # If at end of any items list, done
-            if next_offset >= len(items):
-                break
+            result.append(item)
 
-        return result
\ No newline at end of file
+        return result
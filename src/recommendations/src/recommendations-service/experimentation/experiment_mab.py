@@ -1,11 +1,12 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
-import numpy as np
 import logging
 import json
 import time
 
+from experimentation.bandit import get_bandit_state
+from experimentation.counters import counter_aggregator
 from experimentation.experiment import Experiment
 
 log = logging.getLogger(__name__)
@@ -13,9 +14,17 @@ log = logging.getLogger(__name__)
 class MultiArmedBanditExperiment(Experiment):
     """ Implementation of the multi-armed bandit problem using the Thompson Sampling approach 
     to exploring variations to identify and exploit the best performing variation
+
+    The posterior of each variation is kept in a BanditState, shared by all
+    instances of the experiment, which is synced with the persisted
+    exposure/conversion counts whenever they are refreshed and updated locally
+    as users are exposed and convert.
     """
+    uses_variation_counts = True
+
     def __init__(self, table, **data):
         super(MultiArmedBanditExperiment, self).__init__(table, **data)
+        self.bandit = get_bandit_state(self.id, [ variation.config for variation in self.variations ])
 
     def get_items(self, user_id, current_item_id = None, item_list = None, num_results = 10, tracker = None):
         if not user_id:
@@ -28,7 +37,8 @@ class MultiArmedBanditExperiment(Experiment):
         log.debug(f'{self._getClassName()} - assigned user {user_id} to variation {variation_idx} for experiment {self.feature}.{self.name}')
 
         # Increment exposure count for variation
-        self._increment_exposure_count(variation_idx)
+        self._increment_exposure_count(variation_idx, user_id = user_id)
+        self.bandit.record_exposure(variation_idx)
 
         # Fetch recommendations using the variation's resolver
         variation = self.variations[variation_idx]
@@ -84,20 +94,30 @@ class MultiArmedBanditExperiment(Experiment):
 
         return items
 
+    def track_conversion(self, user_id, variation_index, result_rank):
+        result = super(MultiArmedBanditExperiment, self).track_conversion(user_id, variation_index, result_rank)
+        self.bandit.record_conversion(variation_index)
+        return result
+
+    def track_conversions(self, conversions, tracker = None):
+        super(MultiArmedBanditExperiment, self).track_conversions(conversions, tracker)
+        for user_id, variation_index, result_rank in conversions:
+            self.bandit.record_conversion(variation_index)
+
+    def refresh_counts(self):
+        def read():
+            super(MultiArmedBanditExperiment, self).refresh_counts()
+            return [ variation.config for variation in self.variations ]
+
+        # Pending counts are written first so the counts read include this process's local updates
+        self.bandit.refresh(counter_aggregator.flush, read)
+
     def _select_variation_index(self):
-        """ Selects the variation using Thompson Sampling """
-        variation_count = len(self.variations)
-        exposures = np.zeros(variation_count)
-        conversions = np.zeros(variation_count)
-
-        for i in range(variation_count):
-            variation = self.variations[i]
-            exposures[i] = int(variation.config.get('exposures', 0))
-            conversions[i] = int(variation.config.get('conversions', 0))
-
-        # Sample from posterior (this is the Thompson Sampling approach)
-        # This leads to more exploration because variations with > uncertainty can then be selected
-        theta = np.random.beta(conversions + 1, exposures + 1)
-
-        # Select variation index with highest posterior p of converting
-        return np.argmax(theta)
+        """ Selects the variation using Thompson Sampling
+
+        Samples from the posterior of each variation (this is the Thompson Sampling
+        approach) and selects the variation with the highest posterior p of converting.
+        This leads to more exploration because variations with > uncertainty can then
+        be selected. Samples are pre-drawn in batches by the BanditState.
+        """
+        return self.bandit.select()
@@ -1,19 +1,21 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import os
 import boto3
 import logging
 
 from boto3.dynamodb.conditions import Key
 from experimentation.experiment_ab import ABExperiment
+from experimentation.experiment_cache import ExperimentCache
 from experimentation.experiment_interleaving import InterleavingExperiment
 from experimentation.experiment_mab import MultiArmedBanditExperiment
-from experimentation.experiment_optimizely import OptimizelyFeatureTest, optimizely_sdk
-from experimentation.tracking import KinesisTracker
+from experimentation.experiment_optimizely import OptimizelyFeatureTest, get_snapshot as get_optimizely_snapshot
+from experimentation.parameters import parameter_store
+from experimentation.tracking import BufferedKinesisTracker
 
 log = logging.getLogger(__name__)
 
-ssm = boto3.client('ssm')
 dynamodb = boto3.resource('dynamodb')
 
 class ExperimentManager:
@@ -25,6 +27,16 @@ class ExperimentManager:
 
     __table_name = None
     __experiments = {}
+    __trackers = {}
+
+    # Compiled experiments keyed by ('feature', name) and ('id', id).
+    cache = ExperimentCache(
+        ttl = float(os.environ.get('EXPERIMENT_CACHE_TTL', 30)),
+        max_age = float(os.environ.get('EXPERIMENT_CACHE_MAX_AGE', 300)),
+        max_size = int(os.environ.get('EXPERIMENT_CACHE_SIZE', 1000)),
+        negative_ttl = float(os.environ.get('EXPERIMENT_CACHE_NEGATIVE_TTL', 60)),
+        counts_interval = float(os.environ.get('EXPERIMENT_COUNTS_REFRESH_INTERVAL', 5))
+    )
 
     @staticmethod
     def register_experiment(type, experiment):
@@ -39,47 +51,22 @@ class ExperimentManager:
         """ Returns the active experiment for the given feature """
         experiment = None
 
-        config = optimizely_sdk.get_optimizely_config()
-        if config:
-            if feature in config.features_map:
-                optimizely_feature = config.features_map[feature]
-                experiment_keys = optimizely_feature.experiments_map.keys()
-                if len(experiment_keys) > 0:
-                    experiment_key = list(experiment_keys)[0]
-                    experiment = optimizely_feature.experiments_map[experiment_key]
-                    data = {'id': experiment.id,
-                            'feature': feature,
-                            'name': experiment_key,
-                            'status': 'ACTIVE',
-                            'type': 'optimizely',
-                            'variations': []}
-                    return OptimizelyFeatureTest(None, **data)
+        # Optimizely feature tests take precedence; they are looked up in a snapshot of the current datafile revision.
+        snapshot = get_optimizely_snapshot()
+        if snapshot:
+            experiment = snapshot.get_test(feature)
+            if experiment:
+                return experiment
 
         table = self.__get_table()
         
         if table:
-            log.debug(f'ExperimentManager - querying {table.table_name} for active experiments for {feature}')
-
-            # Get active experiments for the feature. 
-            response = table.query(
-                IndexName='feature-name-index',
-                KeyConditionExpression=Key('feature').eq(feature),
-                FilterExpression=Key('status').eq('ACTIVE')
+            experiment = ExperimentManager.cache.get(
+                ('feature', feature),
+                load = lambda: self.__load_active(table, feature),
+                check = lambda: self.__check_active(table, feature)
             )
 
-            experiment_count = response['Count']
-            if experiment_count > 0:
-                experiment_config = response['Items'][0]
-                log.debug(f'ExperimentManager - {experiment_count} active experiments found for feature {feature}')
-
-                experiment_type = experiment_config['type']
-                experiment_class = ExperimentManager.__experiments.get(experiment_type)
-                if not experiment_class:
-                    raise ValueError(f'Experiment class for type {experiment_type} could not be found')
-                experiment = experiment_class(table, **experiment_config)
-            else:
-                log.debug(f'ExperimentManager - no active experiments for feature {feature}')
-
         return experiment
 
     def get_by_id(self, id):
@@ -88,46 +75,144 @@ class ExperimentManager:
         if not table:
             raise Exception('Experiment strategy table has not been configured')
 
+        return ExperimentManager.cache.get(
+            ('id', id),
+            load = lambda: self.__load_by_id(table, id),
+            check = lambda: self.__check_by_id(table, id)
+        )
+
+    def __load_active(self, table, feature):
+        """ Queries for and compiles the active experiment for a feature """
+        log.debug(f'ExperimentManager - querying {table.table_name} for active experiments for {feature}')
+
+        experiment = None
+
+        # Get active experiments for the feature. 
+        response = table.query(
+            IndexName='feature-name-index',
+            KeyConditionExpression=Key('feature').eq(feature),
+            FilterExpression=Key('status').eq('ACTIVE')
+        )
+
+        experiment_config = None
+
+        experiment_count = response['Count']
+        if experiment_count > 0:
+            experiment_config = response['Items'][0]
+            log.debug(f'ExperimentManager - {experiment_count} active experiments found for feature {feature}')
+
+            # The compiled experiment is also cached by ID for tracking outcomes.
+            experiment = self.__create_experiment(table, experiment_config)
+            ExperimentManager.cache.put(('id', experiment.id), experiment, ExperimentManager.__signature(experiment_config))
+        else:
+            log.debug(f'ExperimentManager - no active experiments for feature {feature}')
+
+        return experiment, ExperimentManager.__signature(experiment_config)
+
+    def __check_active(self, table, feature):
+        """ Returns the signature of the active experiment for a feature without loading its configuration """
+        response = table.query(
+            IndexName='feature-name-index',
+            KeyConditionExpression=Key('feature').eq(feature),
+            FilterExpression=Key('status').eq('ACTIVE'),
+            ProjectionExpression='#id, #status, #version',
+            ExpressionAttributeNames={'#id': 'id', '#status': 'status', '#version': 'version'}
+        )
+
+        return ExperimentManager.__signature(response['Items'][0] if response['Count'] > 0 else None)
+
+    def __load_by_id(self, table, id):
+        """ Loads and compiles an experiment by its ID """
         experiment = None
 
         response = table.get_item(Key={'id': id})
         if response.get('Item'):
-            experiment_config = response['Item']
-            experiment_type = experiment_config['type']
-            experiment_class = ExperimentManager.__experiments.get(experiment_type)
-            if not experiment_class:
-                raise ValueError(f'Experiment class for type {experiment_type} could not be found')
-            experiment = experiment_class(table, **experiment_config)
+            experiment = self.__create_experiment(table, response['Item'])
+
+        return experiment, ExperimentManager.__signature(response.get('Item'))
+
+    def __check_by_id(self, table, id):
+        """ Returns the signature of an experiment without loading its configuration """
+        response = table.get_item(
+            Key={'id': id},
+            ProjectionExpression='#id, #status, #version',
+            ExpressionAttributeNames={'#id': 'id', '#status': 'status', '#version': 'version'}
+        )
+
+        return ExperimentManager.__signature(response.get('Item'))
+
+    def __create_experiment(self, table, experiment_config):
+        experiment_type = experiment_config['type']
+        experiment_class = ExperimentManager.__experiments.get(experiment_type)
+        if not experiment_class:
+            raise ValueError(f'Experiment class for type {experiment_type} could not be found')
+        experiment = experiment_class(table, **experiment_config)
+
+        if experiment.uses_variation_counts and experiment.counter_shards > 0:
+            # Counts on the experiment item do not include counter shards so load the summed counts.
+            experiment.refresh_counts()
 
         return experiment
 
+    @staticmethod
+    def __signature(experiment_config):
+        """ Returns a value that changes when an experiment is replaced, deactivated or its version is bumped
+
+        The version is bumped when migrating to sharded counters, for example.
+        """
+        if not experiment_config:
+            return 'NONE'
+        return (experiment_config['id'], experiment_config.get('status'), str(experiment_config.get('version')))
+
     def default_tracker(self):
-        """ Creates a Kinesis stream tracker for an experiment if environment is 
+        """ Returns a Kinesis stream tracker for an experiment if environment is 
         configured with a Kinesis stream
+
+        Trackers are shared per stream so events from all requests are buffered and
+        sent to Kinesis in batches by a background thread.
         """
         tracker = None
 
-        try:
-            response = ssm.get_parameter(Name='retaildemostore-kinesis-event-stream-name')
-            if response['Parameter']['Value'] != 'NONE':
-                stream_name = response['Parameter']['Value']
-                tracker = KinesisTracker(
+        stream_name = parameter_store.get_value('retaildemostore-kinesis-event-stream-name')
+        if stream_name:
+            tracker = ExperimentManager.__trackers.get(stream_name)
+            if tracker is None:
+                tracker = ExperimentManager.__trackers.setdefault(stream_name, BufferedKinesisTracker(
                     exposure_stream_name = stream_name, 
-                    outcome_stream_name = stream_name
-                )
-        except ssm.exceptions.ParameterNotFound:
-            pass
+                    outcome_stream_name = stream_name,
+                    max_buffer = int(os.environ.get('EXPERIMENT_TRACKER_BUFFER_SIZE', 10000)),
+                    full_policy = os.environ.get('EXPERIMENT_TRACKER_FULL_POLICY', BufferedKinesisTracker.FULL_POLICY_DROP)
+                ))
 
         return tracker
 
+    def after_fork(self):
+        """ Recreates AWS clients and resets shared state in a forked child process
+
+        boto3 clients and resources are not fork-safe, so the DynamoDB resource is
+        recreated and compiled experiments are bound to a table from it. Trackers
+        drop events buffered by the parent (which sends them itself).
+        """
+        global dynamodb
+        dynamodb = boto3.resource('dynamodb')
+
+        ExperimentManager.cache.after_fork()
+        if ExperimentManager.__table_name not in [ None, 'NONE' ]:
+            table = dynamodb.Table(ExperimentManager.__table_name)
+            for experiment in ExperimentManager.cache.experiments():
+                experiment.bind_table(table)
+
+        for tracker in list(ExperimentManager.__trackers.values()):
+            tracker.after_fork()
+
     def __get_table(self):
         """ Lazily initializes the DDB table name for experiment strategies """
         if ExperimentManager.__table_name is None:
             log.debug('ExperimentManager - looking up experiment strategy table name from SSM')
-            response = ssm.get_parameter(Name='retaildemostore-experiment-strategy-table-name')
+            table_name = parameter_store.get_value('retaildemostore-experiment-strategy-table-name')
 
-            if response['Parameter']['Value']:
-                ExperimentManager.__table_name = response['Parameter']['Value']
+            if table_name:
+                ExperimentManager.__table_name = table_name
             else:
                 ExperimentManager.__table_name = 'NONE'
 
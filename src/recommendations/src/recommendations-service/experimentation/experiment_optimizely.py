@@ -2,35 +2,126 @@
 # SPDX-License-Identifier: MIT-0
 
 import os
+import json
+import hashlib
+import logging
+import threading
 
 from optimizely import optimizely
 
 from . import experiment, resolvers
 
+log = logging.getLogger(__name__)
 
 optimizely_sdk = optimizely.Optimizely(sdk_key=os.environ.get('OPTIMIZELY_SDK_KEY'))
 
+class OptimizelySnapshot:
+    """ Optimizely feature tests for one revision of the Optimizely datafile
+
+    Building the Optimizely config is expensive so it is done once per datafile
+    revision. The snapshot maps each feature to its first feature test and keeps
+    the OptimizelyFeatureTest instances and the resolvers built from feature
+    variables for that revision. When the revision changes a new snapshot is built
+    and swapped in as a whole (see get_snapshot).
+    """
+    def __init__(self, revision, config):
+        self.revision = revision
+
+        # Feature -> (experiment key, experiment ID) of the feature's first feature test
+        self.feature_tests = {}
+        for feature_key, feature in config.features_map.items():
+            experiment_keys = list(feature.experiments_map.keys())
+            if len(experiment_keys) > 0:
+                self.feature_tests[feature_key] = (experiment_keys[0], feature.experiments_map[experiment_keys[0]].id)
+
+        self._tests = {}
+        self._resolvers = {}
+        self._lock = threading.Lock()
+
+    def get_test(self, feature):
+        """ Returns the OptimizelyFeatureTest for a feature or None if it has no feature test """
+        test = self._tests.get(feature)
+        if test is None and feature in self.feature_tests:
+            experiment_key, experiment_id = self.feature_tests[feature]
+            data = {'id': experiment_id,
+                    'feature': feature,
+                    'name': experiment_key,
+                    'status': 'ACTIVE',
+                    'type': 'optimizely',
+                    'variations': []}
+            test = self._tests.setdefault(feature, OptimizelyFeatureTest(None, snapshot = self, **data))
+        return test
+
+    def get_resolver(self, algorithm_type, algorithm_config):
+        """ Returns a resolver for an algorithm type and config, reusing resolvers with the same config """
+        key = (algorithm_type, hashlib.sha1(json.dumps(algorithm_config, sort_keys = True).encode('utf-8')).hexdigest())
+        resolver = self._resolvers.get(key)
+        if resolver is None:
+            with self._lock:
+                resolver = self._resolvers.get(key)
+                if resolver is None:
+                    resolver = self._resolvers[key] = resolvers.ResolverFactory.get(type=algorithm_type, **algorithm_config)
+        return resolver
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def after_fork():
+    """ Recreates the Optimizely client in a forked child process
+
+    The client polls for datafile updates on a thread, which does not survive a fork.
+    """
+    global optimizely_sdk, _snapshot_lock
+    _snapshot_lock = threading.Lock()
+    if os.environ.get('OPTIMIZELY_SDK_KEY'):
+        optimizely_sdk = optimizely.Optimizely(sdk_key=os.environ.get('OPTIMIZELY_SDK_KEY'))
+
+def get_snapshot():
+    """ Returns the OptimizelySnapshot for the current datafile revision or None if Optimizely is not configured """
+    global _snapshot
+
+    if not optimizely_sdk.is_valid:
+        return None
+
+    project_config = optimizely_sdk.config_manager.get_config()
+    if not project_config:
+        return None
+
+    snapshot = _snapshot
+    if snapshot is None or snapshot.revision != project_config.revision:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.revision != project_config.revision:
+                config = optimizely_sdk.get_optimizely_config()
+                if not config:
+                    return None
+                log.info(f'OptimizelySnapshot - building snapshot for datafile revision {config.revision}')
+                snapshot = _snapshot = OptimizelySnapshot(config.revision, config)
+
+    return snapshot
+
 class OptimizelyFeatureTest(experiment.Experiment):
+    def __init__(self, table, snapshot = None, **data):
+        super(OptimizelyFeatureTest, self).__init__(table, **data)
+        self.snapshot = snapshot
+
     def get_items(self, user_id, current_item_id = None, item_list = None, num_results = 10, tracker = None):
         assert user_id, "`user_id` is required"
 
+        snapshot = self.snapshot or get_snapshot()
+        assert snapshot and self.feature in snapshot.feature_tests, f'Feature {self.feature} is not set up properly on Optimizely'
+
         # All the kwargs that are passed to ResolverFactory.get will be stored as a JSON feature variable.
         algorithm_type = optimizely_sdk.get_feature_variable_string(self.feature, 'algorithm_type', user_id=user_id)
         algorithm_config = optimizely_sdk.get_feature_variable_json(self.feature, 'algorithm_config', user_id=user_id)
-        resolver = resolvers.ResolverFactory.get(type=algorithm_type, **algorithm_config)
+        resolver = snapshot.get_resolver(algorithm_type, algorithm_config)
 
         items = resolver.get_items(user_id=user_id,
                                    product_id=current_item_id,
                                    product_list=item_list,
                                    num_results=num_results)
 
-        config = optimizely_sdk.get_optimizely_config()
-
-        assert self.feature in config.features_map, f'Feature {self.feature} is not set up properly on Optimizely'
-        feature = config.features_map[self.feature]
-
-        assert len(feature.experiments_map.keys()) > 0, "No feature tests have been set up for this feature"
-        experiment_key = list(feature.experiments_map.keys())[0]
+        experiment_key, experiment_id = snapshot.feature_tests[self.feature]
 
         variation_key = optimizely_sdk.get_variation(experiment_key, user_id)
 
@@ -41,6 +132,6 @@ class OptimizelyFeatureTest(experiment.Experiment):
                                   'name': experiment_key,
                                   'experiment_key': experiment_key,
                                   'variationIndex': variation_key,
-                                  'revision_number': config.revision,
+                                  'revision_number': snapshot.revision,
                                   'correlationId': correlation_id}
         return items
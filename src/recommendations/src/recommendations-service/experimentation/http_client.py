@@ -0,0 +1,193 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import collections
+import logging
+import random
+import threading
+import time
+import urllib.parse
+import requests
+
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+# Methods that are safe to retry
+IDEMPOTENT_METHODS = [ 'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE' ]
+
+# Response status codes that are retried for idempotent methods
+RETRY_STATUS_CODES = [ 502, 503, 504 ]
+
+class HostBusyError(Exception):
+    """ Raised when a request is rejected because too many requests to its host are in flight """
+    def __init__(self, host, max_in_flight):
+        self.host = host
+        super(HostBusyError, self).__init__(f'Too many requests in flight to {host} (max {max_in_flight})')
+
+class _HostStats:
+    def __init__(self, window):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen = window)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'inFlight': self.in_flight,
+            'latencyP50Ms': percentile(0.5),
+            'latencyP99Ms': percentile(0.99)
+        }
+
+class HttpClient:
+    """ Shared HTTP client for calling backend services from resolvers
+
+    All requests share keep-alive connection pools, one per host (up to
+    pool_maxsize connections each). Every request has a connect and a read
+    timeout so a slow or unresponsive backend cannot hold a caller's thread
+    indefinitely; both can be overridden per request (e.g. per resolver).
+
+    Idempotent requests are retried up to retries times on connection errors
+    (including connect timeouts) and 502/503/504 responses, with jittered
+    exponential backoff. Read timeouts are not retried: a backend that did not
+    answer within the read timeout is unlikely to answer a retry any faster, and
+    retrying would multiply the time a caller waits. At most max_in_flight
+    requests per host are allowed at once (zero for no limit); further requests
+    fail immediately with HostBusyError instead of queueing behind a slow backend.
+
+    Request counts, errors and latency percentiles (over the last metrics_window
+    requests) are kept per host; see metrics().
+    """
+    def __init__(self, connect_timeout = 2, read_timeout = 5, retries = 2, backoff = 0.05, max_backoff = 1.0,
+            pool_maxsize = 16, max_in_flight = 64, metrics_window = 1000):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_in_flight = max_in_flight
+        self.metrics_window = metrics_window
+        self.pool_maxsize = pool_maxsize
+
+        self._process_session = None
+        self._pid = None
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def _session(self):
+        # Pooled connections must not be shared with forked processes (e.g. pre-forked
+        # server workers) so the session is created lazily in each process.
+        if self._process_session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._process_session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections = 32, pool_maxsize = self.pool_maxsize)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._pid = os.getpid()
+                    self._process_session = session
+        return self._process_session
+
+    def get(self, url, **kwargs):
+        """ Sends a GET request; see request() """
+        return self.request('GET', url, **kwargs)
+
+    def request(self, method, url, connect_timeout = None, read_timeout = None, retries = None, **kwargs):
+        """ Sends a request and returns the requests Response
+
+        Arguments:
+            method - HTTP method
+            url - URL to request
+            connect_timeout - seconds to wait for a connection (default for the client if None)
+            read_timeout - seconds to wait for the response (default for the client if None)
+            retries - number of retries for idempotent requests (default for the client if None)
+            kwargs - passed on to requests (e.g. params, json, headers)
+
+        Raises requests exceptions for read timeouts, connection errors once retries
+        are exhausted and HostBusyError when the host has too many requests in flight.
+        """
+        timeout = (connect_timeout if connect_timeout is not None else self.connect_timeout,
+                   read_timeout if read_timeout is not None else self.read_timeout)
+        retries = (retries if retries is not None else self.retries) if method.upper() in IDEMPOTENT_METHODS else 0
+
+        host = urllib.parse.urlsplit(url).netloc
+        stats = self._host_stats(host)
+
+        with self._lock:
+            if self.max_in_flight > 0 and stats.in_flight >= self.max_in_flight:
+                stats.rejected += 1
+                raise HostBusyError(host, self.max_in_flight)
+            stats.in_flight += 1
+
+        try:
+            attempt = 0
+            while True:
+                start = time.monotonic()
+                try:
+                    response = self._session.request(method, url, timeout = timeout, **kwargs)
+                    error = None
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response = None
+                    error = e
+
+                with self._lock:
+                    stats.requests += 1
+                    stats.latencies.append(time.monotonic() - start)
+                    if error is not None:
+                        stats.errors += 1
+                        if isinstance(error, requests.Timeout):
+                            stats.timeouts += 1
+                    elif response.status_code >= 500:
+                        stats.errors += 1
+
+                # ConnectTimeout is a ConnectionError; ReadTimeout is not
+                retryable = isinstance(error, requests.ConnectionError) if error is not None else response.status_code in RETRY_STATUS_CODES
+                if not retryable or attempt >= retries:
+                    if error is not None:
+                        raise error
+                    return response
+
+                attempt += 1
+                with self._lock:
+                    stats.retries += 1
+
+                delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5)
+                log.debug(f'HttpClient - retrying {method} {url} in {delay:.3f}s (attempt {attempt} of {retries}): {error or response.status_code}')
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                stats.in_flight -= 1
+
+    def metrics(self):
+        """ Returns request metrics by host """
+        with self._lock:
+            return { host: stats.to_dict() for host, stats in self._stats.items() }
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(host, _HostStats(self.metrics_window))
+        return stats
+
+# Shared HTTP client for resolvers.
+http_client = HttpClient(
+    connect_timeout = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 2)),
+    read_timeout = float(os.environ.get('HTTP_READ_TIMEOUT', 5)),
+    retries = int(os.environ.get('HTTP_RETRIES', 2)),
+    pool_maxsize = int(os.environ.get('HTTP_POOL_SIZE', 16)),
+    max_in_flight = int(os.environ.get('HTTP_MAX_IN_FLIGHT_PER_HOST', 64))
+)
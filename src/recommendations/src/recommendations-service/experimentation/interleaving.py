@@ -0,0 +1,226 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Interleaving and multileaving methods
+
+Each method takes a list of rankings (lists of item dictionaries with an 'itemId'
+key, one ranking per ranker/variation) and returns up to count picks as a list of
+(ranking index, item) tuples in result order. Items already picked are tracked in
+a set so each pick is O(1) regardless of how deep the rankings are.
+
+All methods take an rng argument (the random module by default) so results can
+be reproduced with a seeded random.Random.
+"""
+
+import bisect
+import itertools
+import random
+
+def balanced(rankings, count, rng = random):
+    """ Balanced interleaving (Chapelle et al http://olivier.chapelle.cc/pub/interleaving.pdf)
+
+    Rankings are visited in a random order, always advancing the ranking with the
+    lowest offset, and an item is added if it is not already in the result.
+    """
+    selection_order = list(range(len(rankings)))
+    rng.shuffle(selection_order)
+
+    # Holds next selection offset into each ranking (by position in selection order)
+    offsets = [0] * len(rankings)
+
+    seen = set()
+    picks = []
+    while len(picks) < count:
+        # Find lowest offset to determine which ranking to pull next item from
+        next_idx = 0
+        for i in range(len(offsets)):
+            if offsets[i] < offsets[next_idx] and offsets[i] < len(rankings[selection_order[i]]):
+                next_idx = i
+
+        ranking_idx = selection_order[next_idx]
+        ranking = rankings[ranking_idx]
+
+        # As soon as we reach end of the selected ranking, we're done
+        if offsets[next_idx] >= len(ranking):
+            break
+
+        item = ranking[offsets[next_idx]]
+        if item['itemId'] not in seen:
+            seen.add(item['itemId'])
+            picks.append((ranking_idx, item))
+
+        offsets[next_idx] += 1
+
+    return picks
+
+def team_draft(rankings, count, rng = random):
+    """ Team-draft interleaving (Chapelle et al http://olivier.chapelle.cc/pub/interleaving.pdf)
+
+    The team (ranking) with the fewest picks so far, chosen at random among ties,
+    adds its highest ranked item that is not already in the result. Teams are kept
+    in buckets by size so the smallest teams are known without rescanning.
+    """
+    offsets = [0] * len(rankings)
+
+    # Team indexes (in ascending order) keyed by team size
+    buckets = { 0: list(range(len(rankings))) }
+    smallest = 0
+
+    seen = set()
+    picks = []
+    while len(picks) < count:
+        team_index = rng.choice(buckets[smallest])
+
+        items = rankings[team_index]
+        next_offset = offsets[team_index]
+
+        while next_offset < len(items):
+            offsets[team_index] = next_offset + 1
+
+            item = items[next_offset]
+            if item['itemId'] not in seen:
+                seen.add(item['itemId'])
+                picks.append((team_index, item))
+
+                # Move team to the next size bucket
+                bucket = buckets[smallest]
+                bucket.remove(team_index)
+                bisect.insort(buckets.setdefault(smallest + 1, []), team_index)
+                if not bucket:
+                    del buckets[smallest]
+                    smallest += 1
+                break
+
+            next_offset += 1
+
+        # If at end of any ranking, done
+        if next_offset >= len(items):
+            break
+
+    return picks
+
+def multileave(rankings, count, rng = random, candidates = 20):
+    """ Approximation of optimized multileaving (Schuth et al, CIKM 2014)
+
+    A number of candidate result lists are sampled where each position takes the
+    highest ranked remaining item of a randomly chosen ranking (prefix constrained
+    sampling). Each ranking earns credit 1 / rank for every item of the candidate
+    that it contains, and the candidate whose credit is most evenly spread across
+    rankings is returned, so no ranker is favored by how the list was composed.
+    Items are attributed to the ranking that contributed them.
+    """
+    rank_maps = []
+    for ranking in rankings:
+        ranks = {}
+        for rank, item in enumerate(ranking, 1):
+            ranks.setdefault(item['itemId'], rank)
+        rank_maps.append(ranks)
+
+    best = None
+    best_spread = None
+    for c in range(max(1, candidates)):
+        picks = _sample_prefix_constrained(rankings, count, rng)
+
+        credit = [0.0] * len(rankings)
+        for ranking_idx, item in picks:
+            for i, ranks in enumerate(rank_maps):
+                rank = ranks.get(item['itemId'])
+                if rank is not None:
+                    credit[i] += 1.0 / rank
+
+        spread = max(credit) - min(credit) if credit else 0
+        if best is None or len(picks) > len(best) or (len(picks) == len(best) and spread < best_spread):
+            best = picks
+            best_spread = spread
+
+    return best
+
+def probabilistic(rankings, count, rng = random, tau = 3.0):
+    """ Probabilistic interleaving (Hofmann et al, CIKM 2011)
+
+    For each position a ranking is chosen at random and an item is sampled from
+    that ranking's softmax distribution P(r) ~ 1 / r^tau over its remaining items.
+    Sampling draws from the cumulative weights starting at the ranking's first
+    remaining item and rejects items already picked, which is rarely needed since
+    most of the remaining weight is on that first item.
+    """
+    cumulative = [ list(itertools.accumulate(1.0 / (rank ** tau) for rank in range(1, len(ranking) + 1))) for ranking in rankings ]
+    heads = [0] * len(rankings)
+    active = [ i for i in range(len(rankings)) if rankings[i] ]
+
+    seen = set()
+    picks = []
+    while len(picks) < count and active:
+        ranking_idx = rng.choice(active)
+        item = _sample_softmax(rankings[ranking_idx], cumulative[ranking_idx], heads, ranking_idx, seen, rng)
+
+        if item is None:
+            active.remove(ranking_idx)
+            continue
+
+        seen.add(item['itemId'])
+        picks.append((ranking_idx, item))
+
+    return picks
+
+METHODS = {
+    'balanced': balanced,
+    'team-draft': team_draft,
+    'multileave': multileave,
+    'probabilistic': probabilistic
+}
+
+def _sample_prefix_constrained(rankings, count, rng):
+    offsets = [0] * len(rankings)
+    active = [ i for i in range(len(rankings)) if rankings[i] ]
+
+    seen = set()
+    picks = []
+    while len(picks) < count and active:
+        ranking_idx = rng.choice(active)
+        ranking = rankings[ranking_idx]
+
+        offset = offsets[ranking_idx]
+        while offset < len(ranking) and ranking[offset]['itemId'] in seen:
+            offset += 1
+
+        if offset >= len(ranking):
+            offsets[ranking_idx] = offset
+            active.remove(ranking_idx)
+            continue
+
+        item = ranking[offset]
+        offsets[ranking_idx] = offset + 1
+        seen.add(item['itemId'])
+        picks.append((ranking_idx, item))
+
+    return picks
+
+def _sample_softmax(ranking, cumulative, heads, ranking_idx, seen, rng, max_tries = 16):
+    # Advance past items at the head of the ranking that were already picked
+    head = heads[ranking_idx]
+    while head < len(ranking) and ranking[head]['itemId'] in seen:
+        head += 1
+    heads[ranking_idx] = head
+
+    if head >= len(ranking):
+        return None
+
+    base = cumulative[head - 1] if head > 0 else 0.0
+    total = cumulative[-1] - base
+
+    for attempt in range(max_tries):
+        offset = bisect.bisect_left(cumulative, base + rng.random() * total, lo = head)
+        item = ranking[min(offset, len(ranking) - 1)]
+        if item['itemId'] not in seen:
+            return item
+
+    # Too many rejections; sample directly from the remaining items
+    remaining = [ (offset, cumulative[offset] - (cumulative[offset - 1] if offset > 0 else 0.0))
+        for offset in range(head, len(ranking)) if ranking[offset]['itemId'] not in seen ]
+    x = rng.random() * sum(weight for offset, weight in remaining)
+    for offset, weight in remaining:
+        x -= weight
+        if x <= 0:
+            break
+    return ranking[offset]
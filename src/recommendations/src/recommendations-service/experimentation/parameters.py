@@ -0,0 +1,173 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import sys
+import json
+import logging
+import threading
+import time
+import boto3
+
+log = logging.getLogger(__name__)
+
+# SSM parameters used by the Recommendations service. These are loaded together
+# so a single batched call keeps all of them current.
+DEFAULT_PARAMETER_NAMES = [
+    'retaildemostore-product-recommendation-campaign-arn',
+    'retaildemostore-related-products-campaign-arn',
+    'retaildemostore-personalized-ranking-campaign-arn',
+    'retaildemostore-personalize-filter-purchased-arn',
+    'retaildemostore-experiment-strategy-table-name',
+    'retaildemostore-kinesis-event-stream-name'
+]
+
+# Maximum number of names accepted by a single SSM GetParameters call.
+GET_PARAMETERS_MAX_NAMES = 10
+
+class ParameterStore:
+    """ In-memory view of the Retail Demo Store SSM parameters
+
+    All known parameters are loaded with batched ssm.get_parameters calls and
+    served from memory. Once refresh_interval seconds have passed, the current
+    values keep being served while they are reloaded in a background thread.
+    Parameters requested for the first time are fetched synchronously and then
+    included in subsequent refreshes.
+
+    The store can also be seeded from a local JSON snapshot file that maps
+    parameter names to values. When a snapshot is used and refresh_interval is
+    zero or less, SSM is never called and parameters missing from the snapshot
+    are treated as not existing; this allows the service to run without SSM.
+    """
+    def __init__(self, names = DEFAULT_PARAMETER_NAMES, refresh_interval = 60, snapshot_file = None, client = None):
+        self.refresh_interval = refresh_interval
+        self._client = client
+        self._own_client = client is None
+
+        self._names = list(names)
+        self._values = {}
+        self._lock = threading.Lock()
+        self._refresh_at = None
+        self._refreshing = False
+
+        self.offline = False
+        if snapshot_file:
+            self.load_snapshot(snapshot_file)
+            self.offline = refresh_interval <= 0
+
+    def get_value(self, name):
+        """ Returns the value for a parameter or None if it does not exist or its value is 'NONE' """
+        return self.get_values([ name ])[0]
+
+    def get_values(self, names):
+        """ Returns values for parameters in the same order as names
+
+        Values are None for parameters that don't exist or that have value equal 'NONE'.
+        """
+        if not self.offline:
+            self._ensure_loaded(names)
+
+        values = []
+        for name in names:
+            value = self._values.get(name)
+            values.append(value if value != 'NONE' else None)
+
+        return values
+
+    def refresh(self):
+        """ Reloads all known parameters from SSM """
+        self._values = dict(self._values, **self._fetch(self._names))
+        self._refresh_at = time.monotonic() + self.refresh_interval
+
+    def load_snapshot(self, path):
+        """ Loads parameter values from a JSON snapshot file """
+        with open(path) as f:
+            snapshot = json.load(f)
+
+        log.info(f'ParameterStore - loaded {len(snapshot)} parameters from snapshot {path}')
+
+        with self._lock:
+            for name in snapshot:
+                if name not in self._names:
+                    self._names.append(name)
+            self._values = dict(self._values, **snapshot)
+            self._refresh_at = time.monotonic() + self.refresh_interval
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process
+
+        The boto3 client (and its connections) is recreated on next use and a
+        background refresh that was running in the parent is forgotten.
+        """
+        self._lock = threading.Lock()
+        self._refreshing = False
+        if self._own_client:
+            self._client = None
+
+    def save_snapshot(self, path):
+        """ Writes the current parameter values to a JSON snapshot file """
+        with open(path, 'w') as f:
+            json.dump(self._values, f, indent = 2, sort_keys = True)
+
+    def _ensure_loaded(self, names):
+        new_names = [ name for name in names if name not in self._names ]
+
+        if new_names or self._refresh_at is None:
+            with self._lock:
+                new_names = [ name for name in names if name not in self._names ]
+                self._names.extend(new_names)
+
+                if self._refresh_at is None:
+                    self.refresh()
+                elif new_names:
+                    self._values = dict(self._values, **self._fetch(new_names))
+        elif self._refresh_at <= time.monotonic() and not self._refreshing:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target = self._background_refresh, daemon = True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            log.warning(f'ParameterStore - unable to refresh parameters, keeping current values: {e}')
+            self._refresh_at = time.monotonic() + min(self.refresh_interval, 5)
+        finally:
+            self._refreshing = False
+
+    def _fetch(self, names):
+        if self._client is None:
+            self._client = boto3.client('ssm')
+
+        values = {}
+        for i in range(0, len(names), GET_PARAMETERS_MAX_NAMES):
+            chunk = names[i:i + GET_PARAMETERS_MAX_NAMES]
+            log.debug(f'ParameterStore - loading parameters {chunk}')
+            response = self._client.get_parameters(Names = chunk)
+
+            for param in response['Parameters']:
+                values[param['Name']] = param['Value']
+
+            # Remember parameters that do not exist so they are not looked up on every call.
+            for name in response.get('InvalidParameters', []):
+                values[name] = None
+
+        return values
+
+# Shared parameter store for the service.
+parameter_store = ParameterStore(
+    refresh_interval = float(os.environ.get('PARAMETER_REFRESH_INTERVAL', 60)),
+    snapshot_file = os.environ.get('PARAMETER_SNAPSHOT_FILE')
+)
+
+if __name__ == '__main__':
+    # Writes a snapshot of the current SSM parameters that can be used with PARAMETER_SNAPSHOT_FILE.
+    if len(sys.argv) != 2:
+        print('Usage: python -m experimentation.parameters SNAPSHOT_FILE')
+        sys.exit(1)
+
+    store = ParameterStore()
+    store.refresh()
+    store.save_snapshot(sys.argv[1])
+    print(f'Saved {len(store._values)} parameters to {sys.argv[1]}')
@@ -0,0 +1,202 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from experimentation.concurrency import FanOut
+
+log = logging.getLogger(__name__)
+
+class PersonalizeResultCache:
+    """ Thread-safe, size-bounded cache of Amazon Personalize results with stale-while-revalidate
+
+    Results are fresh for ttl seconds after they are loaded. After that they stay
+    usable until stale_ttl seconds have passed: a stale result is returned
+    immediately while one background refresh reloads it, so repeat requests for a
+    user (e.g. paging back to the home page) never wait on Personalize. Results
+    older than stale_ttl are reloaded in the calling thread.
+
+    Entries are indexed by user so all results for a user can be dropped with
+    invalidate_user when their history is known to have changed (e.g. after a
+    purchase). A refresh that was running when its entry was invalidated is
+    discarded. Entries are evicted in least recently used order once max_size
+    is reached.
+
+    The cache is per process and so is invalidation: with several server worker
+    processes, only the worker that handles an invalidation drops the user's
+    results. The other workers can serve their cached results for up to ttl
+    seconds, and then one more stale result if it is younger than stale_ttl, so
+    both should be kept short.
+    """
+    def __init__(self, max_size = 10000, ttl = 30, stale_ttl = 60, refresh_workers = 4):
+        """ Arguments:
+            max_size - maximum number of results to keep
+            ttl - seconds a result is served without being refreshed (0 disables the cache)
+            stale_ttl - seconds after loading that a result may still be served while it is refreshed
+            refresh_workers - number of threads for background refreshes
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+
+        self._entries = OrderedDict()
+        self._users = {}
+        self._invalidations = 0
+        self._lock = threading.Lock()
+        self._refresh_pool = FanOut(max_workers = refresh_workers, thread_name_prefix = 'personalize-refresh')
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key, loader, user_id = None):
+        """ Returns the result for key, calling loader() to load or refresh it
+
+        Arguments:
+            key - hashable key that identifies the request (campaign, user/item, filter, ...)
+            loader - function without arguments that returns the result from Personalize
+            user_id - user the result was personalized for, used by invalidate_user (optional)
+        """
+        if not self.enabled:
+            return loader()
+
+        now = time.monotonic()
+        refresh = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['stale_at'] <= now:
+                self._remove(key)
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry['refresh_at'] > now:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    if not entry['refreshing']:
+                        entry['refreshing'] = refresh = True
+            else:
+                self.misses += 1
+                invalidations = self._invalidations
+
+        if entry is None:
+            value = loader()
+            # Not cached if results were invalidated while loading since it may predate the invalidation
+            self._put(key, value, user_id, invalidations = invalidations)
+            return value
+
+        if refresh:
+            self._refresh_pool.submit(self._refresh, key, entry, loader)
+
+        return entry['value']
+
+    def invalidate_user(self, user_id):
+        """ Removes all results for a user in this process (see the class docstring for other processes) """
+        with self._lock:
+            self._invalidations += 1
+            for key in list(self._users.get(str(user_id), ())):
+                self._remove(key)
+
+    def clear(self):
+        """ Removes all results """
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+            self._users.clear()
+
+    def stats(self):
+        """ Returns a dictionary of cache counters """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'hits': self.hits,
+                'staleHits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'refreshErrors': self.refresh_errors,
+                'evictions': self.evictions
+            }
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process
+
+        Cached results are kept; refreshes that were running in the parent are
+        forgotten so they are started again in the child.
+        """
+        self._lock = threading.Lock()
+        for entry in list(self._entries.values()):
+            entry['refreshing'] = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put(self, key, value, user_id, replaces = None, invalidations = None):
+        now = time.monotonic()
+        entry = {
+            'value': value,
+            'user_id': str(user_id) if user_id is not None else None,
+            'refresh_at': now + self.ttl,
+            'stale_at': now + self.stale_ttl,
+            'refreshing': False
+        }
+
+        with self._lock:
+            if replaces is not None and self._entries.get(key) is not replaces:
+                # Entry was invalidated or evicted while it was being refreshed
+                return
+            if invalidations is not None and invalidations != self._invalidations:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            if entry['user_id'] is not None:
+                self._users.setdefault(entry['user_id'], set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _refresh(self, key, entry, loader):
+        try:
+            value = loader()
+        except Exception as e:
+            log.warning(f'PersonalizeResultCache - unable to refresh {key}, serving stale result: {e}')
+            with self._lock:
+                self.refresh_errors += 1
+                entry['refreshing'] = False
+            return
+
+        with self._lock:
+            self.refreshes += 1
+            entry['refreshing'] = False
+
+        self._put(key, value, entry['user_id'], replaces = entry)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry['user_id'] is not None:
+            keys = self._users.get(entry['user_id'])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._users[entry['user_id']]
+
+# Shared cache for Personalize resolvers.
+personalize_cache = PersonalizeResultCache(
+    max_size = int(os.environ.get('PERSONALIZE_CACHE_SIZE', 10000)),
+    ttl = float(os.environ.get('PERSONALIZE_CACHE_TTL', 30)),
+    stale_ttl = float(os.environ.get('PERSONALIZE_CACHE_STALE_TTL', 60))
+)
@@ -0,0 +1,155 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import logging
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+from experimentation.cache import LRUCache, NOT_FOUND
+from experimentation.concurrency import FanOut
+
+log = logging.getLogger(__name__)
+
+# Shared cache of Products service responses. Product documents rarely change so a
+# hot catalog can be served from memory; products that do not exist are negatively
+# cached so repeated lookups for them do not reach the Products service either.
+product_cache = LRUCache(
+    max_size = int(os.environ.get('PRODUCT_CACHE_SIZE', 5000)),
+    ttl = float(os.environ.get('PRODUCT_CACHE_TTL', 300)),
+    negative_ttl = float(os.environ.get('PRODUCT_CACHE_NEGATIVE_TTL', 60))
+)
+
+def product_cache_key(product_id, fully_qualify_image_urls = False):
+    """ Returns the product_cache key for a product's details """
+    return ('product', str(product_id), bool(fully_qualify_image_urls))
+
+class ProductLookupError(Exception):
+    """ Raised when the Products service could not return details for a product """
+    def __init__(self, product_id, status_code = None, reason = None):
+        self.product_id = product_id
+        self.status_code = status_code
+        self.reason = reason
+        super(ProductLookupError, self).__init__(f'Error looking up product {product_id}: {status_code}: {reason}')
+
+class ProductHydrator:
+    """ Retrieves product details from the Products service for recommended items
+
+    Recommendations only carry item IDs so every item has to be "hydrated" with
+    the product details before being returned to the client. Lookups are issued
+    concurrently from a bounded pool of worker threads sharing a pool of keep-alive
+    connections, so hydrating a list of items costs roughly the latency of the
+    slowest lookup rather than the sum of all of them. The order of the items
+    (i.e. ranking) is preserved and a failed lookup only affects its own item.
+
+    Product details are read through the shared product cache so only items that
+    have not been seen recently result in a call to the Products service.
+    """
+    def __init__(self, max_workers = 16, timeout = 5, cache = product_cache):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache = cache
+
+        self._process_session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        # Worker threads and connections are created lazily in each process so the
+        # hydrator can be shared with forked processes (e.g. pre-forked server workers).
+        self._pool = FanOut(max_workers = max_workers, thread_name_prefix = 'product-hydrator')
+
+    @property
+    def _session(self):
+        if self._process_session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._process_session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = self.max_workers)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._pid = os.getpid()
+                    self._process_session = session
+        return self._process_session
+
+    def fetch_product(self, host, port, product_id, fully_qualify_image_urls = False):
+        """ Returns the product details for a single product from the Products service
+
+        Raises ProductLookupError if the Products service does not return the product.
+        """
+        url = f'http://{host}:{port}/products/id/{product_id}?fullyQualifyImageUrls={fully_qualify_image_urls}'
+        log.debug('ProductHydrator - getting product details ' + url)
+        response = self._session.get(url, timeout = self.timeout)
+
+        if not response.ok:
+            if response.status_code == 404 and self.cache is not None:
+                self.cache.put_missing(product_cache_key(product_id, fully_qualify_image_urls))
+            raise ProductLookupError(product_id, response.status_code, response.reason)
+
+        product = response.json()
+        if self.cache is not None:
+            self.cache.put(product_cache_key(product_id, fully_qualify_image_urls), product)
+
+        return dict(product)
+
+    def get_product(self, host, port, product_id, fully_qualify_image_urls = False):
+        """ Returns the product details for a single product, reading through the cache
+
+        A copy of the cached product is returned so callers are free to modify it.
+        Raises ProductLookupError if the product does not exist.
+        """
+        if self.cache is not None:
+            product = self.cache.get(product_cache_key(product_id, fully_qualify_image_urls))
+            if product is NOT_FOUND:
+                raise ProductLookupError(product_id, 404, 'Not Found (cached)')
+            if product is not None:
+                return dict(product)
+
+        return self.fetch_product(host, port, product_id, fully_qualify_image_urls)
+
+    def hydrate(self, items, host, port, fully_qualify_image_urls = False):
+        """ Adds the product details under a 'product' key to each item in place
+
+        Arguments:
+            items - list of dictionaries with an 'itemId' key, in ranked order
+            host - Products service host/IP
+            port - Products service port
+            fully_qualify_image_urls - whether image URLs should be fully qualified
+
+        Return:
+            List of failures as dictionaries with 'itemId' and 'error' keys. Items
+            that could not be hydrated are left without a 'product' key.
+        """
+        errors = {}
+        futures = {}
+
+        # Serve what we can from the cache and only look up the remaining items concurrently.
+        for index, item in enumerate(items):
+            product = self.cache.get(product_cache_key(item['itemId'], fully_qualify_image_urls)) if self.cache is not None else None
+
+            if product is NOT_FOUND:
+                errors[index] = ProductLookupError(item['itemId'], 404, 'Not Found (cached)')
+            elif product is not None:
+                item['product'] = dict(product)
+            else:
+                futures[index] = self._pool.submit(self.fetch_product, host, port, item['itemId'], fully_qualify_image_urls)
+
+        for index, future in futures.items():
+            try:
+                items[index]['product'] = future.result()
+            except Exception as e:
+                errors[index] = e
+
+        failures = []
+        for index in sorted(errors.keys()):
+            item_id = items[index]['itemId']
+            log.warning(f'ProductHydrator - unable to hydrate item {item_id}: {errors[index]}')
+            failures.append({ 'itemId': item_id, 'error': str(errors[index]) })
+
+        return failures
+
+# Shared hydrator for the service so that worker threads and connections are reused across requests.
+product_hydrator = ProductHydrator(
+    max_workers = int(os.environ.get('PRODUCT_HYDRATION_WORKERS', 16)),
+    timeout = float(os.environ.get('PRODUCT_SERVICE_TIMEOUT', 5))
+)
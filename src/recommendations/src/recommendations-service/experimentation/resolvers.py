@@ -2,15 +2,40 @@
 # SPDX-License-Identifier: MIT-0
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import wait, FIRST_COMPLETED
 
-import requests
+import os
 import boto3
+import functools
 import json
+import threading
+import time
 import urllib.parse
+import weakref
 import logging
 
+from experimentation.cache import NOT_FOUND
+from experimentation.catalog import get_catalog_store
+from experimentation.concurrency import batch_fan_out, ensemble_fan_out, fallback_fan_out, SKIPPED, TIMEOUT
+from experimentation.discovery import service_discovery
+from experimentation.http_client import http_client
+from experimentation.personalize_cache import personalize_cache
+from experimentation.similarity import get_similarity_table
+from experimentation.products import product_cache, product_cache_key
+
 log = logging.getLogger(__name__)
-servicediscovery = boto3.client('servicediscovery')
+
+# Default number of requests of a batch resolved at once
+BATCH_CONCURRENCY = int(os.environ.get('RESOLVER_BATCH_CONCURRENCY', 8))
+
+def http_options(params):
+    """ Returns the shared HTTP client options (timeouts and retries) from resolver params
+
+    Resolvers that call HTTP services accept optional connect_timeout, read_timeout
+    (seconds) and retries params; the shared client's defaults are used otherwise.
+    """
+    return { name: params[name] for name in ('connect_timeout', 'read_timeout', 'retries') if params.get(name) is not None }
 
 class Resolver(ABC):
     """ Abstract base class for all resolvers"""
@@ -26,6 +51,37 @@ class Resolver(ABC):
         """
         pass
 
+    def get_items_batch(self, requests, max_concurrency = None):
+        """ Returns recommended items for each of a batch of requests (e.g. many users or products)
+
+        The default implementation calls get_items for each request on the batch
+        fan-out pool, with at most max_concurrency requests in flight. Resolvers
+        whose backend can answer many requests at once override this.
+
+        Arguments:
+            requests - list of dictionaries of get_items parameters, one per request
+            max_concurrency - maximum number of requests resolved at once (default RESOLVER_BATCH_CONCURRENCY or 8)
+
+        Return:
+            Tuple of (results, errors) where results holds the items of each request in the
+            order of requests (None for failed requests) and errors maps the index of each
+            failed request to the exception raised
+        """
+        calls = [ functools.partial(self.get_items, **request) for request in requests ]
+        return batch_fan_out.run_limited(calls, max_concurrency or BATCH_CONCURRENCY)
+
+    @staticmethod
+    def _resolve_each(get_items, requests):
+        """ Calls get_items for each request in turn, for resolvers that answer from memory """
+        results = [ None ] * len(requests)
+        errors = {}
+        for i, request in enumerate(requests):
+            try:
+                results[i] = get_items(**request)
+            except Exception as e:
+                errors[i] = e
+        return results, errors
+
 class DefaultProductResolver(Resolver):
     """ Provides recommendations using the Product service
 
@@ -41,20 +97,13 @@ class DefaultProductResolver(Resolver):
         self.products_service_host = params.get('products_service_host')
         self.products_service_port = params.get('products_service_port', 80)
         if not self.products_service_host:
-            # host/IP wasn't provided so attempt to discover instance
-            response = servicediscovery.discover_instances(
-                NamespaceName='retaildemostore.local',
-                ServiceName='products',
-                MaxResults=1,
-                HealthStatus='HEALTHY'
-            )
-
-            self.products_service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4']
-            log.debug('DefaultProductResolver - fetched product service instance ' + self.products_service_host)
+            # host/IP wasn't provided so instances are discovered (and cached) when items are requested
+            log.debug('DefaultProductResolver - using discovered product service instances')
         else:
             log.debug('DefaultProductResolver - using product service instance ' + self.products_service_host)
 
         self.fully_qualify_image_urls = params.get('fully_qualify_image_urls', False)
+        self.http_options = http_options(params)
 
     def get_items(self, **kwargs):
         """ Returns recommended items given a product_id from curated list of products
@@ -71,41 +120,94 @@ class DefaultProductResolver(Resolver):
 
         items = []
 
+        products_service_host = self.products_service_host or service_discovery.get_host('products')
+
         category = None
 
         if product_id:
             # Lookup product to determine if it belongs to a category
-            url = f'http://{self.products_service_host}:{self.products_service_port}/products/id/{product_id}'
-            log.debug('DefaultProductResolver - getting product details ' + url)
-            response = requests.get(url)
+            product = product_cache.get(product_cache_key(product_id))
+            if product is None:
+                url = f'http://{products_service_host}:{self.products_service_port}/products/id/{product_id}'
+                log.debug('DefaultProductResolver - getting product details ' + url)
+                response = http_client.get(url, **self.http_options)
+
+                if response.ok:
+                    product = response.json()
+                    product_cache.put(product_cache_key(product_id), product)
+                elif response.status_code == 404:
+                    product_cache.put_missing(product_cache_key(product_id))
 
-            if response.ok:
-                category = response.json()['category']
+            if product and product is not NOT_FOUND:
+                category = product['category']
 
         if category:
             # Product belongs to a category so get list of products in same category
-            url = f'http://{self.products_service_host}:{self.products_service_port}/products/category/{category}?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
-            log.debug('DefaultProductResolver - getting products for category ' + url)
-            response = requests.get(url)
+            cache_key = ('category', category, bool(self.fully_qualify_image_urls))
+            url = f'http://{products_service_host}:{self.products_service_port}/products/category/{category}?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
         else:
             # Product not specified or does not belong to a category so fallback to featured products
-            url = f'http://{self.products_service_host}:{self.products_service_port}/products/featured?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
-            log.debug('DefaultProductResolver - getting featured products ' + url)
-            response = requests.get(url)
-
-        if response.ok:
-            # Create response making sure not to include current product
-            for product in response.json():
-                if product['id'] != product_id:
-                    items.append({'itemId': str(product['id'])})
-
-                    if len(items) >= num_results:
-                        break
-        else:
-            raise Exception(f'Error calling products service: {response.status_code}: {response.reason}')
+            cache_key = ('featured', bool(self.fully_qualify_image_urls))
+            url = f'http://{products_service_host}:{self.products_service_port}/products/featured?fullyQualifyImageUrls={self.fully_qualify_image_urls}'
+
+        products = product_cache.get(cache_key)
+        if products is None or products is NOT_FOUND:
+            log.debug('DefaultProductResolver - getting products ' + url)
+            response = http_client.get(url, **self.http_options)
+
+            if not response.ok:
+                raise Exception(f'Error calling products service: {response.status_code}: {response.reason}')
+
+            products = response.json()
+            product_cache.put(cache_key, products)
+
+        # Create response making sure not to include current product
+        for product in products:
+            if product['id'] != product_id:
+                items.append({'itemId': str(product['id'])})
+
+                if len(items) >= num_results:
+                    break
 
         return items
 
+class CatalogProductResolver(Resolver):
+    """ Provides the same recommendations as DefaultProductResolver from an in-memory catalog
+
+    Products from the same category as the current product (or featured products)
+    are looked up in a local index of the catalog instead of calling the Products
+    service. The catalog is loaded from a products.yaml file or a snapshot of the
+    Products service and is refreshed in the background (see CatalogStore).
+    """
+    def __init__(self, **params):
+        self.store = get_catalog_store(
+            catalog_file = params.get('catalog_file'),
+            products_service_host = params.get('products_service_host'),
+            products_service_port = params.get('products_service_port', 80)
+        )
+
+    def get_items(self, **kwargs):
+        """ Returns recommended items given a product_id from the catalog
+
+        Arguments:
+            product_id - item ID of the currently displayed product (optional)
+            num_results - number of recommendations to return (optional)
+        """
+        return self._get_items(self.store.get(), **kwargs)
+
+    def get_items_batch(self, requests, max_concurrency = None):
+        """ Returns recommended items for each of a batch of requests from one snapshot of the catalog """
+        return self._resolve_each(functools.partial(self._get_items, self.store.get()), requests)
+
+    def _get_items(self, catalog, **kwargs):
+        num_results = 10
+        if kwargs.get('num_results'):
+            num_results = int(kwargs['num_results'])
+
+        product_ids = catalog.related_product_ids(kwargs.get('product_id'), num_results)
+
+        return [ {'itemId': product_id} for product_id in product_ids ]
+
 class SearchSimilarProductsResolver(Resolver): 
     """ Provides recommendations using the Search service
 
@@ -120,18 +222,12 @@ class SearchSimilarProductsResolver(Resolver):
         self.search_service_host = params.get('search_service_host') 
         self.search_service_port = params.get('search_service_port', 80) 
         if not self.search_service_host: 
-            # host/IP wasn't provided so attempt to discover instance
-            response = servicediscovery.discover_instances( 
-                NamespaceName='retaildemostore.local', 
-                ServiceName='search', 
-                MaxResults=1, 
-                HealthStatus='HEALTHY' 
-            ) 
- 
-            self.search_service_host = response['Instances'][0]['Attributes']['AWS_INSTANCE_IPV4'] 
-            log.debug('SearchSimilarProductsResolver - fetched search service instance ' + self.search_service_host) 
+            # host/IP wasn't provided so instances are discovered (and cached) when items are requested
+            log.debug('SearchSimilarProductsResolver - using discovered search service instances')
         else: 
             log.debug('SearchSimilarProductsResolver - using search service instance ' + self.search_service_host) 
+
+        self.http_options = http_options(params)
  
     def get_items(self, **kwargs): 
         """ Returns recommended items given a product_id from using similar item search
@@ -148,9 +244,11 @@ class SearchSimilarProductsResolver(Resolver):
         if kwargs.get('num_results'): 
             num_results = int(kwargs['num_results']) 
  
-        url = f'http://{self.search_service_host}:{self.search_service_port}/similar/products?productId={product_id}' 
+        search_service_host = self.search_service_host or service_discovery.get_host('search')
+
+        url = f'http://{search_service_host}:{self.search_service_port}/similar/products?productId={product_id}' 
         log.debug('SearchSimilarProductsResolver - getting similar products ' + url) 
-        response = requests.get(url) 
+        response = http_client.get(url, **self.http_options) 
  
         items = [] 
  
@@ -163,6 +261,44 @@ class SearchSimilarProductsResolver(Resolver):
  
         return items 
 
+class PrecomputedSimilarProductsResolver(Resolver):
+    """ Provides similar item/product recommendations from a precomputed similarity table
+
+    This is an alternative to the SearchSimilarProductsResolver that looks up the
+    products most similar to the current product in a table built offline (see
+    experimentation.similarity) instead of running a query per request.
+    """
+    def __init__(self, **params):
+        self.table_path = params.get('table_path', os.environ.get('SIMILARITY_TABLE_PATH'))
+        if not self.table_path:
+            raise Exception('table_path required for PrecomputedSimilarProductsResolver')
+
+    def get_items(self, **kwargs):
+        """ Returns recommended items given a product_id from the similarity table
+
+        Arguments:
+            product_id - item ID of the currently displayed product (required)
+            num_results - number of recommendations to return (optional)
+        """
+        return self._get_items(get_similarity_table(self.table_path), **kwargs)
+
+    def get_items_batch(self, requests, max_concurrency = None):
+        """ Returns recommended items for each of a batch of requests from the similarity table """
+        return self._resolve_each(functools.partial(self._get_items, get_similarity_table(self.table_path)), requests)
+
+    def _get_items(self, table, **kwargs):
+        product_id = kwargs.get('product_id')
+        if not product_id:
+            raise Exception('product_id is required')
+
+        num_results = 10
+        if kwargs.get('num_results'):
+            num_results = int(kwargs['num_results'])
+
+        similar_ids = table.similar(product_id, num_results)
+
+        return [ {'itemId': similar_id} for similar_id in similar_ids ]
+
 class PersonalizeRecommendationsResolver(Resolver):
     """ Provides recommendations from an Amazon Personalize campaign """
     __personalize_runtime = boto3.client('personalize-runtime')
@@ -176,6 +312,11 @@ class PersonalizeRecommendationsResolver(Resolver):
         # Optionally support filter specified at resolver creation.
         self.filter_arn = params.get('filter_arn')
 
+    @classmethod
+    def after_fork(cls):
+        """ Recreates the Personalize runtime client in a forked child process (boto3 clients are not fork-safe) """
+        cls.__personalize_runtime = boto3.client('personalize-runtime')
+
     def get_items(self, **kwargs):
         """ Returns recommendations from an Amazon Personalize campaign trained with a user recommendation recipe such as HRNN
         
@@ -211,11 +352,16 @@ class PersonalizeRecommendationsResolver(Resolver):
         if num_results:
             params['numResults'] = num_results
 
-        log.debug('PersonalizeRecommendationsResolver - getting recommendations ' + str(params))
+        def get_recommendations():
+            log.debug('PersonalizeRecommendationsResolver - getting recommendations ' + str(params))
+            response = PersonalizeRecommendationsResolver.__personalize_runtime.get_recommendations(**params)
+            return response['itemList']
 
-        response = PersonalizeRecommendationsResolver.__personalize_runtime.get_recommendations(**params)
+        cache_key = ('recommendations', self.campaign_arn, params.get('userId'), params.get('itemId'), params.get('filterArn'), params.get('numResults'))
+        items = personalize_cache.get(cache_key, get_recommendations, user_id = user_id)
 
-        return response['itemList']
+        # Callers annotate items so each gets its own copies of the cached items
+        return [ dict(item) for item in items ]
 
 class HttpResolver(Resolver):
     """ Provides item recommendations provided by an HTTP resource such as a web service 
@@ -223,6 +369,12 @@ class HttpResolver(Resolver):
     This class is intended to provide example of how you might incorporate 
     recommendations from, say, an existing recommendation system as part of
     an experiment to evaluate Amazon Personalize.
+
+    If the resource has a bulk endpoint (batch_url), batches of requests are sent
+    to it batch_size at a time as a JSON POST body of the form
+    {"requests": [{"userId": ..., "itemId": ..., "numResults": ...}, ...]} (using the
+    configured parameter names) and it is expected to return a JSON list with the
+    list of items of each request in the same order.
     """
     def __init__(self, **params):
         self.base_url = params.get('base_url')
@@ -231,8 +383,69 @@ class HttpResolver(Resolver):
         self.user_id_parameter_name = params.get('user_id_parameter_name', 'userId')
         self.item_id_parameter_name = params.get('item_id_parameter_name', 'itemId')
         self.num_results_parameter_name = params.get('num_results_parameter_name', 'numResults')
+        self.batch_url = params.get('batch_url')
+        self.batch_size = int(params.get('batch_size', 100))
+        self.http_options = http_options(params)
 
     def get_items(self, **kwargs):
+        params, num_results = self._request_params(kwargs)
+
+        url = self.base_url
+        if '?' in url:
+            url += '&'
+        else:
+            url += '?'
+
+        url += urllib.parse.urlencode(params)
+
+        log.debug('HttpResolver - calling ' + url)
+        response = http_client.get(url, **self.http_options)
+
+        if not response.ok:
+            raise Exception(f'Error calling HTTP endpoint service: {response.status_code}: {response.reason}')
+
+        return self._to_items(response.json(), num_results)
+
+    def get_items_batch(self, requests, max_concurrency = None):
+        """ Returns recommended items for each of a batch of requests using the bulk endpoint if there is one
+
+        Chunks of batch_size requests are sent concurrently (at most max_concurrency
+        at once). A failed chunk fails each of its requests.
+        """
+        if not self.batch_url:
+            return super(HttpResolver, self).get_items_batch(requests, max_concurrency)
+
+        chunks = [ requests[i:i + self.batch_size] for i in range(0, len(requests), self.batch_size) ]
+        chunk_results, chunk_errors = batch_fan_out.run_limited([ functools.partial(self._get_chunk, chunk) for chunk in chunks ],
+            max_concurrency or BATCH_CONCURRENCY)
+
+        results = []
+        errors = {}
+        for c, chunk in enumerate(chunks):
+            for i in range(len(chunk)):
+                if c in chunk_errors:
+                    errors[len(results)] = chunk_errors[c]
+                    results.append(None)
+                else:
+                    results.append(chunk_results[c][i])
+        return results, errors
+
+    def _get_chunk(self, requests):
+        request_params = [ self._request_params(request) for request in requests ]
+
+        log.debug(f'HttpResolver - calling {self.batch_url} with {len(requests)} requests')
+        response = http_client.request('POST', self.batch_url, json = { 'requests': [ params for params, num_results in request_params ] }, **self.http_options)
+
+        if not response.ok:
+            raise Exception(f'Error calling HTTP endpoint service: {response.status_code}: {response.reason}')
+
+        item_lists = response.json()
+        if len(item_lists) != len(requests):
+            raise Exception(f'HTTP endpoint returned {len(item_lists)} results for {len(requests)} requests')
+
+        return [ self._to_items(items, num_results) for items, (params, num_results) in zip(item_lists, request_params) ]
+
+    def _request_params(self, kwargs):
         user_id = kwargs.get('user_id')
         item_id = kwargs.get('product_id')
         num_results = 10
@@ -248,31 +461,19 @@ class HttpResolver(Resolver):
         if num_results:
             params[self.num_results_parameter_name] = num_results
 
-        url = self.base_url
-        if '?' in url:
-            url += '&'
-        else:
-            url += '?'
-
-        url += urllib.parse.urlencode(params)
-
-        log.debug('HttpResolver - calling ' + url)
-        response = requests.get(url)
+        return params, num_results
 
+    @staticmethod
+    def _to_items(response_items, num_results):
+        # This logic assumes we need to do some mapping from the endpoint
+        # to the expected response. In this case, we're assuming that the
+        # endpoint returns a list of 'id' which we need to map to 'itemId'.
         items = []
+        for item in response_items:
+            items.append({'itemId': str(item['id'])})
 
-        if response.ok:
-            # This logic assumes we need to do some mapping from the endpoint
-            # to the expected response. In this case, we're assuming that the
-            # endpoint returns a list of 'id' which we need to map to 'itemId'.
-            for item in response.json():
-                items.append({'itemId': str(item['id'])})
-
-                if len(items) >= num_results:
-                    break
-        else:
-            raise Exception(f'Error calling HTTP endpoint service: {response.status_code}: {response.reason}')
-
+            if len(items) >= num_results:
+                break
         return items
 
 class PersonalizeRankingResolver(Resolver):
@@ -291,6 +492,11 @@ class PersonalizeRankingResolver(Resolver):
         # Optionally support filter specified at resolver creation.
         self.filter_arn = params.get('filter_arn')
 
+    @classmethod
+    def after_fork(cls):
+        """ Recreates the Personalize runtime client in a forked child process (boto3 clients are not fork-safe) """
+        cls.__personalize_runtime = boto3.client('personalize-runtime')
+
     def get_items(self, **kwargs):
         """ Returns reranking items from an Amazon Personalize campaign trained with Personalized-Ranking recipe
         
@@ -319,11 +525,16 @@ class PersonalizeRankingResolver(Resolver):
         elif self.filter_arn:
             params['filterArn'] = self.filter_arn
 
-        log.debug('PersonalizeRankingResolver - getting personalized ranking ' + str(params))
+        def get_personalized_ranking():
+            log.debug('PersonalizeRankingResolver - getting personalized ranking ' + str(params))
+            response = PersonalizeRankingResolver.__personalize_runtime.get_personalized_ranking(**params)
+            return response['personalizedRanking']
 
-        response = PersonalizeRankingResolver.__personalize_runtime.get_personalized_ranking(**params)
+        cache_key = ('ranking', self.campaign_arn, params['userId'], tuple(input_list), params.get('filterArn'))
+        items = personalize_cache.get(cache_key, get_personalized_ranking, user_id = user_id)
 
-        return response['personalizedRanking']
+        # Callers annotate items so each gets its own copies of the cached items
+        return [ dict(item) for item in items ]
 
 class RankingProductsNoOpResolver(Resolver):
     """ Simply returns the provided items in unchanged order; a dummy or no-op resolver for ranking use-cases 
@@ -351,16 +562,427 @@ class RankingProductsNoOpResolver(Resolver):
 
         return echo_items
 
+    def get_items_batch(self, requests, max_concurrency = None):
+        """ Returns the provided items of each of a batch of requests """
+        return self._resolve_each(self.get_items, requests)
+
+class EnsembleResolver(Resolver):
+    """ Blends the recommendations of several child resolvers into one list
+
+    Children are queried concurrently, each with its own deadline, and the ranked
+    lists of the children that answered in time are fused into one list. A child
+    that times out or fails is left out so, for example, Personalize can be blended
+    with similar items or a category fallback without the slowest backend holding
+    up the response.
+
+    Fusion methods:
+        rrf - reciprocal rank fusion: an item scores weight / (rrf_k + rank) for each child that returned it
+        weighted - an item scores weight * normalized score for each child that returned it, where
+            the score is the item's 'score' (if the child returns scores) divided by the child's
+            highest score, or (n - rank + 1) / n for children that do not return scores
+
+    A child that times out keeps running in the background on the shared pool
+    (ensemble_fan_out). So that a child that stops answering cannot take over the
+    pool and make the other children time out waiting for a worker, a child is
+    skipped (left out like a child that timed out) while max_in_flight of its calls
+    have not completed.
+
+    Items are deduplicated by itemId as they are scored. Latency, timeouts, skipped
+    calls, errors and the number of fused results each child contributed are kept
+    per child; see metrics().
+    """
+    FUSION_RRF = 'rrf'
+    FUSION_WEIGHTED = 'weighted'
+
+    __instances = weakref.WeakSet()
+
+    def __init__(self, **params):
+        """ Arguments:
+            resolvers - list of child resolver configurations, each with a 'type', resolver params and optionally
+                'name', 'weight' (default 1), 'timeout' (seconds, defaults to the ensemble timeout) and
+                'num_results' (defaults to the number of results requested from the ensemble)
+            fusion - 'rrf' (default) or 'weighted'
+            rrf_k - rank constant for reciprocal rank fusion (default 60)
+            timeout - default seconds each child has to answer (default ENSEMBLE_RESOLVER_TIMEOUT or 1)
+            max_in_flight - most calls of each child that may not have completed, including calls that timed
+                out and are still running, before the child is skipped (default ENSEMBLE_CHILD_MAX_IN_FLIGHT
+                or half the workers of ensemble_fan_out)
+            name - name of the ensemble used for metrics (optional)
+        """
+        children = params.get('resolvers')
+        if not children:
+            raise Exception('resolvers required for EnsembleResolver')
+
+        self.name = params.get('name', 'ensemble')
+        self.fusion = params.get('fusion', EnsembleResolver.FUSION_RRF)
+        if self.fusion not in [ EnsembleResolver.FUSION_RRF, EnsembleResolver.FUSION_WEIGHTED ]:
+            raise ValueError(f'Unsupported fusion {self.fusion}')
+        self.rrf_k = float(params.get('rrf_k', 60))
+        self.timeout = float(params.get('timeout', os.environ.get('ENSEMBLE_RESOLVER_TIMEOUT', 1)))
+        max_in_flight = params.get('max_in_flight', os.environ.get('ENSEMBLE_CHILD_MAX_IN_FLIGHT'))
+        self.max_in_flight = int(max_in_flight) if max_in_flight is not None else None
+
+        self.children = []
+        for i, child in enumerate(children):
+            child_params = { name: value for name, value in child.items() if name not in [ 'type', 'name', 'weight', 'timeout', 'num_results' ] }
+            self.children.append({
+                'name': child.get('name', f'{i}:{child["type"]}'),
+                'resolver': ResolverFactory.get(child['type'], **child_params),
+                'weight': float(child.get('weight', 1)),
+                'timeout': float(child.get('timeout', self.timeout)),
+                'num_results': child.get('num_results')
+            })
+
+        self._stats = { child['name']: { 'calls': 0, 'timeouts': 0, 'skipped': 0, 'errors': 0, 'contributed': 0, 'latencies': deque(maxlen = 1000) } for child in self.children }
+        self._lock = threading.Lock()
+        EnsembleResolver.__instances.add(self)
+
+    def get_items(self, **kwargs):
+        """ Returns the fused recommendations of the child resolvers
+
+        Arguments:
+            Parameters of the child resolvers (e.g. user_id, product_id, num_results)
+        """
+        num_results = 10
+        if kwargs.get('num_results'):
+            num_results = int(kwargs['num_results'])
+
+        calls = [ self._make_call(child, dict(kwargs, num_results = child['num_results'] or num_results)) for child in self.children ]
+        max_in_flight = self.max_in_flight or max(1, ensemble_fan_out.max_workers // 2)
+        results, errors = ensemble_fan_out.run(calls, timeout = [ child['timeout'] for child in self.children ],
+            keys = [ child['resolver'] for child in self.children ], max_in_flight = max_in_flight)
+
+        for i, error in errors.items():
+            child = self.children[i]
+            with self._lock:
+                self._stats[child['name']]['timeouts' if error is TIMEOUT else 'skipped' if error is SKIPPED else 'errors'] += 1
+            if error is TIMEOUT:
+                log.warning(f'EnsembleResolver - {self.name} child {child["name"]} timed out after {child["timeout"]}s')
+            elif error is SKIPPED:
+                log.warning(f'EnsembleResolver - {self.name} child {child["name"]} skipped with {max_in_flight} calls still running')
+            else:
+                log.warning(f'EnsembleResolver - {self.name} child {child["name"]} failed: {error}')
+
+        if len(errors) == len(self.children):
+            raise Exception(f'No child resolvers of ensemble {self.name} returned items')
+
+        fused = self._fuse([ (self.children[i], items or []) for i, items in enumerate(results) if i not in errors ], num_results)
+
+        with self._lock:
+            for item, contributors in fused:
+                for name in contributors:
+                    self._stats[name]['contributed'] += 1
+
+        return [ item for item, contributors in fused ]
+
+    def metrics(self):
+        """ Returns calls, timeouts, skipped calls, errors, latency percentiles and contributed results per child """
+        with self._lock:
+            metrics = {}
+            for name, stats in self._stats.items():
+                latencies = sorted(stats['latencies'])
+                percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+                metrics[name] = {
+                    'calls': stats['calls'],
+                    'timeouts': stats['timeouts'],
+                    'skipped': stats['skipped'],
+                    'errors': stats['errors'],
+                    'contributed': stats['contributed'],
+                    'latencyP50Ms': percentile(0.5),
+                    'latencyP99Ms': percentile(0.99)
+                }
+            return metrics
+
+    @staticmethod
+    def all_metrics():
+        """ Returns the metrics of all ensemble resolvers by ensemble name """
+        return { resolver.name: resolver.metrics() for resolver in list(EnsembleResolver.__instances) }
+
+    def _make_call(self, child, kwargs):
+        def call():
+            start = time.monotonic()
+            try:
+                return child['resolver'].get_items(**kwargs)
+            finally:
+                with self._lock:
+                    stats = self._stats[child['name']]
+                    stats['calls'] += 1
+                    stats['latencies'].append(time.monotonic() - start)
+        return call
+
+    def _fuse(self, ranked_lists, num_results):
+        # itemId -> [score, first seen order, item, contributing children]
+        fused = {}
+        for child, items in ranked_lists:
+            if self.fusion == EnsembleResolver.FUSION_RRF:
+                scores = [ child['weight'] / (self.rrf_k + rank) for rank in range(1, len(items) + 1) ]
+            else:
+                scores = self._normalized_scores(items, child['weight'])
+
+            for item, score in zip(items, scores):
+                entry = fused.get(item['itemId'])
+                if entry is None:
+                    # Scores of a child are not comparable with the fused scores
+                    item = { name: value for name, value in item.items() if name != 'score' }
+                    fused[item['itemId']] = [ score, len(fused), item, [ child['name'] ] ]
+                else:
+                    entry[0] += score
+                    entry[3].append(child['name'])
+
+        ranked = sorted(fused.values(), key = lambda entry: (-entry[0], entry[1]))[:num_results]
+        return [ (item, contributors) for score, order, item, contributors in ranked ]
+
+    @staticmethod
+    def _normalized_scores(items, weight):
+        scores = [ item.get('score') for item in items ]
+        if items and all(isinstance(score, (int, float)) for score in scores) and max(scores) > 0:
+            top = max(scores)
+            return [ weight * score / top for score in scores ]
+        return [ weight * (len(items) - rank) / len(items) for rank in range(len(items)) ]
+
+class FallbackChainResolver(Resolver):
+    """ Returns recommendations from the first of a chain of resolvers that answers within a latency budget
+
+    The first (primary) resolver is called immediately. If it has not answered once
+    it has taken longer than its usual latency (the hedge_percentile of its recent
+    calls, but never more than hedge_after seconds so the next resolver has time
+    to answer within the budget), a hedged request is sent to the next resolver in
+    the chain, and so on down the chain. A resolver that fails hands over to the next one immediately. The first
+    successful answer is returned, so latency is bounded by the budget rather than
+    by the slowest backend.
+
+    If no resolver answers within the budget (or all of them fail) the chain degrades
+    rather than failing the request: the optional last_resort resolver, which should
+    be in-process (e.g. 'catalog'), is called, and otherwise no items are returned.
+
+    Calls that have not started when an answer is returned are cancelled, but calls
+    that are already running cannot be: they run to completion in the background and
+    their results are ignored. Calls therefore run on their own pool (fallback_fan_out)
+    and while all of its workers are busy with calls, hedged requests are skipped
+    rather than queued behind slow calls; the chain keeps waiting for the resolvers
+    already called.
+
+    Calls, wins (answers returned), hedges, skipped hedges, errors and latency
+    percentiles are kept per resolver; see metrics().
+    """
+    __instances = weakref.WeakSet()
+
+    # Calls submitted to fallback_fan_out by all chains that have not completed
+    __in_flight = 0
+    __in_flight_lock = threading.Lock()
+
+    def __init__(self, **params):
+        """ Arguments:
+            resolvers - ordered list of resolver configurations, each with a 'type', resolver params and optionally a 'name'
+            budget - total seconds to wait for an answer (default FALLBACK_LATENCY_BUDGET or 1)
+            hedge_percentile - percentile of a resolver's latency after which the next resolver is called (default 0.95)
+            hedge_after - longest time before the next resolver is called, also used until min_samples calls have
+                been seen (default half the budget)
+            min_samples - number of successful calls needed before the percentile is used (default 20)
+            last_resort - resolver configuration, with a 'type' and resolver params, called when no resolver
+                answers within the budget (optional; no items are returned without it)
+            name - name of the chain used for metrics (optional)
+        """
+        children = params.get('resolvers')
+        if not children:
+            raise Exception('resolvers required for FallbackChainResolver')
+
+        self.name = params.get('name', 'fallback')
+        self.budget = float(params.get('budget', os.environ.get('FALLBACK_LATENCY_BUDGET', 1)))
+        self.hedge_percentile = float(params.get('hedge_percentile', 0.95))
+        self.hedge_after = float(params.get('hedge_after', self.budget / 2))
+        self.min_samples = int(params.get('min_samples', 20))
+
+        self.children = []
+        for i, child in enumerate(children):
+            child_params = { name: value for name, value in child.items() if name not in [ 'type', 'name' ] }
+            self.children.append({
+                'name': child.get('name', f'{i}:{child["type"]}'),
+                'resolver': ResolverFactory.get(child['type'], **child_params)
+            })
+
+        self.last_resort = None
+        if params.get('last_resort'):
+            last_resort = params['last_resort']
+            self.last_resort = {
+                'name': last_resort.get('name', f'last-resort:{last_resort["type"]}'),
+                'resolver': ResolverFactory.get(last_resort['type'], **{ name: value for name, value in last_resort.items() if name not in [ 'type', 'name' ] })
+            }
+
+        self._stats = { child['name']: { 'calls': 0, 'wins': 0, 'hedges': 0, 'hedgesSkipped': 0, 'errors': 0, 'latencies': deque(maxlen = 1000), 'hedge_at': None }
+            for child in self.children + ([ self.last_resort ] if self.last_resort else []) }
+        self._lock = threading.Lock()
+        FallbackChainResolver.__instances.add(self)
+
+    def get_items(self, **kwargs):
+        """ Returns the recommendations of the first resolver that answers within the budget
+
+        Arguments:
+            Parameters of the resolvers in the chain (e.g. user_id, product_id, num_results)
+        """
+        items, name = self.resolve(**kwargs)
+        return items
+
+    def resolve(self, **kwargs):
+        """ Returns a tuple of (items, name of the resolver that answered)
+
+        The name is None if no resolver answered and there is no last resort resolver.
+        """
+        start = time.monotonic()
+        deadline = start + self.budget
+
+        pending = {}
+        errors = []
+        next_index = 0
+        next_call_at = start
+
+        try:
+            while True:
+                now = time.monotonic()
+
+                # Call the next resolver when the previous ones are slow or have all failed
+                if next_index < len(self.children) and (now >= next_call_at or not pending):
+                    child = self.children[next_index]
+                    if next_index > 0 and pending:
+                        if FallbackChainResolver.__in_flight >= fallback_fan_out.max_workers:
+                            # A hedge would wait for a worker; keep waiting for the calls already made instead
+                            with self._lock:
+                                self._stats[child['name']]['hedgesSkipped'] += 1
+                            next_call_at = float('inf')
+                            continue
+                        with self._lock:
+                            self._stats[child['name']]['hedges'] += 1
+                    pending[self._submit(child, kwargs)] = child
+                    next_call_at = now + self._hedge_delay(child)
+                    next_index += 1
+                    continue
+
+                if not pending:
+                    log.warning(f'FallbackChainResolver - all resolvers of {self.name} failed: {errors}')
+                    return self._last_resort(kwargs)
+
+                wake_at = min(deadline, next_call_at) if next_index < len(self.children) else deadline
+                if now >= deadline:
+                    log.warning(f'FallbackChainResolver - no resolver of {self.name} answered within {self.budget}s')
+                    return self._last_resort(kwargs)
+
+                done, not_done = wait(list(pending), timeout = max(0, wake_at - now), return_when = FIRST_COMPLETED)
+
+                # Prefer the answer of the earliest resolver in the chain if several completed
+                for future in sorted(done, key = lambda future: self.children.index(pending[future])):
+                    child = pending.pop(future)
+                    if future.exception() is None:
+                        with self._lock:
+                            self._stats[child['name']]['wins'] += 1
+                        return future.result(), child['name']
+                    errors.append(f'{child["name"]}: {future.exception()}')
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def metrics(self):
+        """ Returns calls, wins, hedges, errors, latency percentiles and the latency percentile used for hedging per resolver """
+        with self._lock:
+            metrics = {}
+            for name, stats in self._stats.items():
+                latencies = sorted(stats['latencies'])
+                percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+                metrics[name] = {
+                    'calls': stats['calls'],
+                    'wins': stats['wins'],
+                    'hedges': stats['hedges'],
+                    'hedgesSkipped': stats['hedgesSkipped'],
+                    'errors': stats['errors'],
+                    'latencyP50Ms': percentile(0.5),
+                    'latencyP99Ms': percentile(0.99),
+                    'hedgePercentileMs': round(stats['hedge_at'] * 1000, 2) if stats['hedge_at'] is not None else None
+                }
+            return metrics
+
+    @staticmethod
+    def all_metrics():
+        """ Returns the metrics of all fallback chain resolvers by chain name """
+        return { resolver.name: resolver.metrics() for resolver in list(FallbackChainResolver.__instances) }
+
+    def _submit(self, child, kwargs):
+        with FallbackChainResolver.__in_flight_lock:
+            FallbackChainResolver.__in_flight += 1
+        future = fallback_fan_out.submit(self._call, child, kwargs)
+        # Also called when the call is cancelled before it started
+        future.add_done_callback(FallbackChainResolver.__call_done)
+        return future
+
+    @staticmethod
+    def __call_done(future):
+        with FallbackChainResolver.__in_flight_lock:
+            FallbackChainResolver.__in_flight -= 1
+
+    def _last_resort(self, kwargs):
+        if self.last_resort is None:
+            return [], None
+
+        try:
+            items = self._call(self.last_resort, kwargs)
+        except Exception as e:
+            log.warning(f'FallbackChainResolver - last resort resolver of {self.name} failed: {e}')
+            return [], None
+
+        with self._lock:
+            self._stats[self.last_resort['name']]['wins'] += 1
+        return items, self.last_resort['name']
+
+    def _call(self, child, kwargs):
+        start = time.monotonic()
+        try:
+            items = child['resolver'].get_items(**kwargs)
+        except Exception:
+            with self._lock:
+                stats = self._stats[child['name']]
+                stats['calls'] += 1
+                stats['errors'] += 1
+            raise
+
+        with self._lock:
+            stats = self._stats[child['name']]
+            stats['calls'] += 1
+            stats['latencies'].append(time.monotonic() - start)
+            # Hedge delay is recalculated every few calls rather than sorting on every request
+            if len(stats['latencies']) >= self.min_samples and (stats['hedge_at'] is None or stats['calls'] % 10 == 0):
+                latencies = sorted(stats['latencies'])
+                stats['hedge_at'] = latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile))]
+        return items
+
+    def _hedge_delay(self, child):
+        hedge_at = self._stats[child['name']]['hedge_at']
+        return min(hedge_at, self.hedge_after) if hedge_at is not None else self.hedge_after
+
 class ResolverFactory:
-    """ Provides resolver instance given a type and initialization arguments """
+    """ Provides resolver instance given a type and initialization arguments
+
+    Resolvers are stateless apart from their configuration so get() returns shared
+    instances from a pool keyed by type and initialization arguments. The pool holds
+    at most max_pool_size resolvers (evicting the least recently used) or is
+    unbounded when max_pool_size is zero. Use create() for a new instance.
+    """
     TYPE_HTTP = 'http'
     TYPE_PRODUCT = 'product'
+    TYPE_CATALOG = 'catalog'
     TYPE_SIMILAR = 'similar'
+    TYPE_SIMILAR_PRECOMPUTED = 'similar-precomputed'
     TYPE_PERSONALIZE_RECOMMENDATIONS = 'personalize-recommendations'
     TYPE_PERSONALIZE_RANKING = 'personalize-ranking'
     TYPE_RANKING_NO_OP = 'ranking-no-op'
+    TYPE_ENSEMBLE = 'ensemble'
+    TYPE_FALLBACK = 'fallback'
+
+    # Variation attributes that are not resolver configuration (counters kept on the variation)
+    IGNORED_PARAMS = [ 'exposures', 'conversions' ]
+
+    max_pool_size = int(os.environ.get('RESOLVER_POOL_SIZE', 256))
 
     __resolvers = {}
+    __pool = OrderedDict()
+    __pool_lock = threading.Lock()
 
     @staticmethod
     def register_resolver(type, resolver):
@@ -369,20 +991,58 @@ class ResolverFactory:
 
     @staticmethod
     def get(type, **params):
-        """ Returns an instance of a resolver given its type and initialization arguments """
+        """ Returns a shared instance of a resolver given its type and initialization arguments """
+        params = { name: value for name, value in params.items() if name not in ResolverFactory.IGNORED_PARAMS }
+        key = (type, json.dumps(params, sort_keys = True, default = str))
+
+        with ResolverFactory.__pool_lock:
+            resolver = ResolverFactory.__pool.get(key)
+            if resolver is not None:
+                ResolverFactory.__pool.move_to_end(key)
+                return resolver
+
+        # Created outside the lock since some resolvers do I/O when created.
+        resolver = ResolverFactory.create(type, **params)
+
+        with ResolverFactory.__pool_lock:
+            resolver = ResolverFactory.__pool.setdefault(key, resolver)
+            ResolverFactory.__pool.move_to_end(key)
+            while ResolverFactory.max_pool_size > 0 and len(ResolverFactory.__pool) > ResolverFactory.max_pool_size:
+                ResolverFactory.__pool.popitem(last = False)
+
+        return resolver
+
+    @staticmethod
+    def create(type, **params):
+        """ Returns a new instance of a resolver given its type and initialization arguments """
         log.debug('ResolverFactory - resolving type/params ' + str(type) + '/' + str(params))
         resolver = ResolverFactory.__resolvers.get(type)
         if not resolver:
             raise ValueError(type)
         return resolver(**params)
 
+    @staticmethod
+    def pool_size():
+        """ Returns the number of pooled resolvers """
+        return len(ResolverFactory.__pool)
+
+    @staticmethod
+    def clear_pool():
+        """ Removes all pooled resolvers """
+        with ResolverFactory.__pool_lock:
+            ResolverFactory.__pool.clear()
+
 # Register resolvers with factory
 
 # These resolvers can be used for user recommendations and related product recommendations
 ResolverFactory.register_resolver(ResolverFactory.TYPE_PRODUCT, DefaultProductResolver)
+ResolverFactory.register_resolver(ResolverFactory.TYPE_CATALOG, CatalogProductResolver)
 ResolverFactory.register_resolver(ResolverFactory.TYPE_SIMILAR, SearchSimilarProductsResolver)
+ResolverFactory.register_resolver(ResolverFactory.TYPE_SIMILAR_PRECOMPUTED, PrecomputedSimilarProductsResolver)
 ResolverFactory.register_resolver(ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS, PersonalizeRecommendationsResolver)
 ResolverFactory.register_resolver(ResolverFactory.TYPE_HTTP, HttpResolver)
+ResolverFactory.register_resolver(ResolverFactory.TYPE_ENSEMBLE, EnsembleResolver)
+ResolverFactory.register_resolver(ResolverFactory.TYPE_FALLBACK, FallbackChainResolver)
 # These resolvers are used with product reranking use-cases
 ResolverFactory.register_resolver(ResolverFactory.TYPE_PERSONALIZE_RANKING, PersonalizeRankingResolver)
 ResolverFactory.register_resolver(ResolverFactory.TYPE_RANKING_NO_OP, RankingProductsNoOpResolver)
@@ -0,0 +1,278 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Precomputed item-to-item similarity
+
+Similar products only change when the catalog changes, so rather than running a
+more-like-this query per product page view, the top-K most similar products of
+every product are computed offline in one pass and saved as a table that is
+memory-mapped by the service (see SimilarityTable and the 'similar-precomputed'
+resolver).
+
+Products are represented as TF-IDF vectors over the terms of their name,
+category, style and description. As with the Elasticsearch more_like_this query
+used by the Search service, terms only match within the same field. Cosine
+similarities are computed a block of products at a time so memory use stays
+bounded for large catalogs. SciPy sparse matrices are used when SciPy is
+installed; otherwise vectors are dense NumPy arrays, which is fine for catalogs
+of a few thousand products.
+
+Build a table from a products.yaml file or a Products service snapshot:
+
+python -m experimentation.similarity build CATALOG OUTPUT_DIR [K]
+
+where CATALOG is a products.yaml path or a Products service URL such as
+http://localhost:8001. Compare a table with the Search service results:
+
+python -m experimentation.similarity compare TABLE_DIR SEARCH_SERVICE_URL [K]
+"""
+
+import os
+import sys
+import math
+import re
+import logging
+import threading
+import numpy as np
+
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+log = logging.getLogger(__name__)
+
+FIELDS = [ 'name', 'category', 'style', 'description' ]
+
+NEIGHBORS_FILE = 'neighbors.npy'
+SCORES_FILE = 'scores.npy'
+IDS_FILE = 'ids.txt'
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(product, fields = FIELDS):
+    """ Returns the terms of a product as field:token strings """
+    terms = []
+    for field in fields:
+        value = product.get(field)
+        if value:
+            terms.extend(f'{field}:{token}' for token in _TOKEN_PATTERN.findall(str(value).lower()))
+    return terms
+
+def build_vectors(products, fields = FIELDS):
+    """ Returns an L2 normalized TF-IDF matrix with one row per product
+
+    The matrix is a SciPy CSR matrix if SciPy is installed or a dense NumPy array otherwise.
+    """
+    vocabulary = {}
+    rows, cols, counts = [], [], []
+    for row, product in enumerate(products):
+        term_counts = {}
+        for term in tokenize(product, fields):
+            col = vocabulary.setdefault(term, len(vocabulary))
+            term_counts[col] = term_counts.get(col, 0) + 1
+        for col, count in term_counts.items():
+            rows.append(row)
+            cols.append(col)
+            counts.append(count)
+
+    rows = np.array(rows, dtype = np.int64)
+    cols = np.array(cols, dtype = np.int64)
+    values = np.array(counts, dtype = np.float32)
+
+    # Smoothed inverse document frequency of each term
+    doc_freq = np.bincount(cols, minlength = len(vocabulary))
+    idf = np.log((1 + len(products)) / (1 + doc_freq)) + 1
+    values *= idf[cols].astype(np.float32)
+
+    norms = np.sqrt(np.bincount(rows, weights = values ** 2, minlength = len(products)))
+    values /= np.maximum(norms[rows], 1e-12).astype(np.float32)
+
+    shape = (len(products), len(vocabulary))
+    if sparse is not None:
+        return sparse.csr_matrix((values, (rows, cols)), shape = shape)
+
+    matrix = np.zeros(shape, dtype = np.float32)
+    matrix[rows, cols] = values
+    return matrix
+
+def top_k_similar(matrix, k = 25, block_size = 512):
+    """ Returns (neighbors, scores) with the k most similar rows of each row of matrix
+
+    neighbors is an int32 array of row indexes in descending order of similarity,
+    padded with -1 where a row has fewer than k rows with a positive similarity.
+    A row is never its own neighbor.
+    """
+    count = matrix.shape[0]
+    k = min(k, max(count - 1, 0))
+    neighbors = np.full((count, k), -1, dtype = np.int32)
+    scores = np.zeros((count, k), dtype = np.float32)
+    if k == 0:
+        return neighbors, scores
+
+    transposed = matrix.T.tocsc() if sparse is not None and sparse.issparse(matrix) else matrix.T
+
+    for start in range(0, count, block_size):
+        end = min(start + block_size, count)
+        similarities = matrix[start:end] @ transposed
+        if sparse is not None and sparse.issparse(similarities):
+            similarities = similarities.toarray()
+        similarities = np.asarray(similarities, dtype = np.float32)
+
+        # Exclude each product from its own neighbors
+        similarities[np.arange(end - start), np.arange(start, end)] = -1
+
+        top = np.argpartition(-similarities, k - 1, axis = 1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis = 1)
+        order = np.argsort(-top_scores, axis = 1, kind = 'stable')
+        top = np.take_along_axis(top, order, axis = 1)
+        top_scores = np.take_along_axis(top_scores, order, axis = 1)
+
+        neighbors[start:end] = np.where(top_scores > 0, top, -1)
+        scores[start:end] = np.where(top_scores > 0, top_scores, 0)
+
+    return neighbors, scores
+
+class SimilarityTable:
+    """ Top-K similar products of every product in the catalog
+
+    Neighbors are stored as an int32 matrix of row indexes (one row per product,
+    -1 for unused slots) with the product IDs of the rows in a separate list, so a
+    lookup is a dictionary access and a row slice. Saved tables are loaded with
+    memory-mapping so processes serving the same table share its pages.
+    """
+    def __init__(self, ids, neighbors, scores = None):
+        self.ids = [ str(product_id) for product_id in ids ]
+        self.neighbors = neighbors
+        self.scores = scores
+        self._rows = { product_id: row for row, product_id in enumerate(self.ids) }
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def similar(self, product_id, num_results = 10):
+        """ Returns the IDs of up to num_results products most similar to product_id (empty if it is unknown) """
+        row = self._rows.get(str(product_id))
+        if row is None:
+            return []
+        return [ self.ids[i] for i in self.neighbors[row, :num_results] if i >= 0 ]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, directory):
+        """ Saves the table as neighbors.npy, scores.npy and ids.txt in directory """
+        os.makedirs(directory, exist_ok = True)
+        np.save(os.path.join(directory, NEIGHBORS_FILE), np.ascontiguousarray(self.neighbors, dtype = np.int32))
+        if self.scores is not None:
+            np.save(os.path.join(directory, SCORES_FILE), np.ascontiguousarray(self.scores, dtype = np.float32))
+        with open(os.path.join(directory, IDS_FILE), 'w') as f:
+            f.writelines(f'{product_id}\n' for product_id in self.ids)
+
+    @staticmethod
+    def load(directory, mmap = True):
+        """ Loads a table saved with save(), memory-mapping the arrays unless mmap is False """
+        mmap_mode = 'r' if mmap else None
+        neighbors = np.load(os.path.join(directory, NEIGHBORS_FILE), mmap_mode = mmap_mode)
+
+        scores = None
+        if os.path.exists(os.path.join(directory, SCORES_FILE)):
+            scores = np.load(os.path.join(directory, SCORES_FILE), mmap_mode = mmap_mode)
+
+        with open(os.path.join(directory, IDS_FILE)) as f:
+            ids = [ line.strip() for line in f if line.strip() ]
+
+        if len(ids) != neighbors.shape[0]:
+            raise Exception(f'Similarity table in {directory} has {neighbors.shape[0]} rows but {len(ids)} IDs')
+
+        return SimilarityTable(ids, neighbors, scores)
+
+    @staticmethod
+    def build(products, k = 25, fields = FIELDS):
+        """ Returns the table of the k most similar products of each product """
+        neighbors, scores = top_k_similar(build_vectors(products, fields), k)
+        return SimilarityTable([ product['id'] for product in products ], neighbors, scores)
+
+def overlap(table, reference, k = 10):
+    """ Compares the table's similar products with reference results (e.g. from the Search service)
+
+    Arguments:
+        table - SimilarityTable
+        reference - dictionary of product ID to list of similar product IDs
+        k - number of results compared per product
+
+    Return:
+        Dictionary with the number of products compared, the mean share of the reference
+        top-k that is also in the table's top-k and the share of products with the same
+        most similar product.
+    """
+    overlaps = []
+    same_first = 0
+    for product_id, expected in reference.items():
+        expected = [ str(item_id) for item_id in expected[:k] ]
+        if not expected:
+            continue
+        actual = table.similar(product_id, k)
+        overlaps.append(len(set(actual) & set(expected)) / len(expected))
+        if actual and actual[0] == expected[0]:
+            same_first += 1
+
+    return {
+        'products': len(overlaps),
+        'meanOverlap': sum(overlaps) / len(overlaps) if overlaps else None,
+        'sameFirst': same_first / len(overlaps) if overlaps else None
+    }
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def get_similarity_table(directory):
+    """ Returns the shared SimilarityTable loaded from directory """
+    table = _tables.get(directory)
+    if table is None:
+        with _tables_lock:
+            table = _tables.get(directory)
+            if table is None:
+                table = _tables[directory] = SimilarityTable.load(directory)
+                log.info(f'SimilarityTable - loaded {len(table)} products with {table.k} neighbors each from {directory}')
+    return table
+
+def _load_catalog(source):
+    from experimentation.catalog import Catalog
+
+    if source.startswith('http://') or source.startswith('https://'):
+        address = source.split('://', 1)[1].rstrip('/')
+        host, port = address.split(':') if ':' in address else (address, 80)
+        return list(Catalog.from_service(host, int(port)).products.values())
+
+    return list(Catalog.from_file(source).products.values())
+
+def _search_results(search_service_url, product_ids, k):
+    from experimentation.http_client import http_client
+
+    reference = {}
+    for product_id in product_ids:
+        response = http_client.get(f'{search_service_url.rstrip("/")}/similar/products', params = { 'productId': product_id })
+        if response.ok:
+            reference[product_id] = [ item['itemId'] for item in response.json()[:k] ]
+    return reference
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5) or sys.argv[1] not in ('build', 'compare'):
+        print('Usage: python -m experimentation.similarity build CATALOG OUTPUT_DIR [K]')
+        print('       python -m experimentation.similarity compare TABLE_DIR SEARCH_SERVICE_URL [K]')
+        sys.exit(1)
+
+    if sys.argv[1] == 'build':
+        products = _load_catalog(sys.argv[2])
+        k = int(sys.argv[4]) if len(sys.argv) == 5 else 25
+        table = SimilarityTable.build(products, k)
+        table.save(sys.argv[3])
+        print(f'Saved {k} similar products for each of {len(table)} products to {sys.argv[3]}')
+    else:
+        table = SimilarityTable.load(sys.argv[2])
+        k = int(sys.argv[4]) if len(sys.argv) == 5 else 10
+        report = overlap(table, _search_results(sys.argv[3], table.ids, k), k)
+        percent = lambda value: f'{value:.1%}' if value is not None else 'n/a'
+        print(f"Compared {report['products']} products: mean overlap@{k} {percent(report['meanOverlap'])}, same most similar product {percent(report['sameFirst'])}")
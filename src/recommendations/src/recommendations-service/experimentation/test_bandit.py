@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import numpy as np
+
+from experimentation.bandit import BanditState, get_bandit_state
+
+"""
+python -m unittest experimentation/test_bandit.py
+"""
+
+class TestBanditState(unittest.TestCase):
+
+    def test_posterior_from_persisted_and_local_counts(self):
+        state = BanditState(2)
+        state.sync([ { 'exposures': 100, 'conversions': 10 }, { 'exposures': 50, 'conversions': 1 } ])
+        state.record_exposure(0)
+        state.record_exposure(0)
+        state.record_conversion(1)
+
+        np.testing.assert_array_equal(state.alpha, [ 11, 3 ])
+        np.testing.assert_array_equal(state.beta, [ 103, 51 ])
+
+        # Sync replaces persisted counts and drops the local updates included in them
+        state.refresh(lambda: True, lambda: [ { 'exposures': 102, 'conversions': 10 }, { 'exposures': 50, 'conversions': 2 } ])
+        np.testing.assert_array_equal(state.alpha, [ 11, 3 ])
+        np.testing.assert_array_equal(state.beta, [ 103, 51 ])
+        np.testing.assert_array_equal(state.local_updates(), np.zeros((2, 2)))
+
+    def test_unwritten_local_updates_are_kept(self):
+        state = BanditState(2)
+        state.sync([ { 'exposures': 100, 'conversions': 10 }, { 'exposures': 50, 'conversions': 1 } ])
+        state.record_conversion(1)
+
+        # Updates that could not be written are not in the counts read
+        state.refresh(lambda: False, lambda: [ { 'exposures': 100, 'conversions': 10 }, { 'exposures': 50, 'conversions': 1 } ])
+        np.testing.assert_array_equal(state.alpha, [ 11, 3 ])
+
+        # Updates recorded while counts are being written and read are kept too
+        def write():
+            state.record_conversion(0)
+            return True
+        state.refresh(write, lambda: [ { 'exposures': 100, 'conversions': 10 }, { 'exposures': 50, 'conversions': 2 } ])
+        np.testing.assert_array_equal(state.alpha, [ 12, 3 ])
+
+    def test_state_shared_per_experiment(self):
+        counts = [ { 'exposures': 10, 'conversions': 1 }, { 'exposures': 10, 'conversions': 2 } ]
+        state = get_bandit_state('exp1', counts)
+        state.record_conversion(0)
+
+        self.assertIs(get_bandit_state('exp1', counts), state)
+        self.assertIsNot(get_bandit_state('exp2', counts), state)
+        # A recompiled experiment with other variations gets a new state
+        self.assertIsNot(get_bandit_state('exp1', counts + [ {} ]), state)
+
+    def test_selection_frequencies_match_per_request_sampling(self):
+        counts = [ { 'exposures': 200, 'conversions': 10 }, { 'exposures': 200, 'conversions': 14 }, { 'exposures': 50, 'conversions': 3 } ]
+        state = BanditState(3, batch_size = 500, seed = 1)
+        state.sync(counts)
+
+        selections = np.bincount([ state.select() for i in range(20000) ], minlength = 3) / 20000
+
+        rng = np.random.default_rng(2)
+        conversions = np.array([ c['conversions'] for c in counts ])
+        exposures = np.array([ c['exposures'] for c in counts ])
+        expected = np.bincount(np.argmax(rng.beta(conversions + 1, exposures + 1, size = (20000, 3)), axis = 1), minlength = 3) / 20000
+
+        np.testing.assert_allclose(selections, expected, atol = 0.02)
+
+    def test_local_updates_redraw_samples(self):
+        state = BanditState(2, batch_size = 1000, max_updates = 10, seed = 1)
+        state.sync([ { 'exposures': 50, 'conversions': 50 }, { 'exposures': 0, 'conversions': 0 } ])
+        state.select()
+
+        # Once max_updates local updates are applied the next draw reflects them
+        for i in range(10):
+            state.record_conversion(1)
+
+        self.assertGreater(sum(state.select() for i in range(100)), 90)
+
+if __name__ == '__main__':
+    unittest.main()
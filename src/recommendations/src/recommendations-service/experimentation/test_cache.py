@@ -0,0 +1,49 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import patch
+from experimentation.cache import LRUCache, NOT_FOUND
+
+"""
+python -m unittest experimentation/test_cache.py
+"""
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_size = 2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        # 'b' is now least recently used and gets evicted.
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        stats = cache.stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_ttl_and_negative_entries(self):
+        with patch('experimentation.cache.time.monotonic') as mocked_time:
+            mocked_time.return_value = 100
+            cache = LRUCache(ttl = 10, negative_ttl = 2)
+            cache.put('a', 1)
+            cache.put_missing('b')
+
+            self.assertEqual(cache.get('a'), 1)
+            self.assertIs(cache.get('b'), NOT_FOUND)
+
+            mocked_time.return_value = 105
+            self.assertEqual(cache.get('a'), 1)
+            self.assertIsNone(cache.get('b'))
+
+            mocked_time.return_value = 111
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.stats()['expirations'], 2)
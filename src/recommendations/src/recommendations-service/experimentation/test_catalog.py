@@ -0,0 +1,163 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import os
+import tempfile
+import threading
+import urllib.parse
+
+from unittest.mock import patch, MagicMock
+from experimentation.catalog import Catalog, CatalogStore
+from experimentation.products import product_cache
+from experimentation.resolvers import ResolverFactory, CatalogProductResolver
+
+"""
+python -m unittest experimentation/test_catalog.py
+"""
+
+PRODUCTS_YAML = """
+- id: 1
+  name: Black Leather Backpack
+  category: accessories
+  featured: true
+- id: 2
+  name: Striped Shirt
+  category: apparel
+  featured: true
+- id: 3
+  name: Brown Leather Belt
+  category: accessories
+- id: 4
+  name: Hiking Boots
+  category: footwear
+- id: 5
+  name: Gift Card
+- id: 6
+  name: Sunglasses
+  category: accessories
+  featured: true
+"""
+
+def make_products(count = 50):
+    categories = [ 'accessories', 'apparel', 'beauty', 'electronics' ]
+    return [ { 'id': str(i), 'category': categories[i % len(categories)] if i % 9 else '', 'featured': 'true' if i % 5 == 0 else None }
+        for i in range(1, count + 1) ]
+
+def products_service(products):
+    """ Returns a fake http_client.get that serves the Products service routes from products """
+    def get(url, **kwargs):
+        path = url.split('?')[0].split('/products/', 1)[1]
+        response = MagicMock()
+        response.ok = True
+        response.status_code = 200
+        if path == 'all':
+            response.json.return_value = products
+        elif path == 'featured':
+            response.json.return_value = [ p for p in products if p['featured'] == 'true' ]
+        elif path.startswith('category/'):
+            response.json.return_value = [ p for p in products if p['category'] == urllib.parse.unquote(path.split('/', 1)[1]) ]
+        else:
+            matches = [ p for p in products if p['id'] == path.split('/')[1] ]
+            response.ok = bool(matches)
+            response.status_code = 200 if matches else 404
+            response.json.return_value = matches[0] if matches else None
+        return response
+    return get
+
+class TestCatalog(unittest.TestCase):
+
+    def test_from_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix = '.yaml', delete = False) as f:
+            f.write(PRODUCTS_YAML)
+        self.addCleanup(os.remove, f.name)
+
+        catalog = Catalog.from_file(f.name)
+        self.assertEqual(len(catalog), 6)
+        self.assertEqual(catalog.get_product(3)['name'], 'Brown Leather Belt')
+        self.assertEqual(catalog.featured, ('1', '2', '6'))
+        self.assertEqual(catalog.categories['accessories'], ('1', '3', '6'))
+
+        # Same category without the current product, in catalog order
+        self.assertEqual(catalog.related_product_ids('3'), [ '1', '6' ])
+        self.assertEqual(catalog.related_product_ids('3', num_results = 1), [ '1' ])
+        # Featured products when there is no current product, it has no category or is unknown
+        self.assertEqual(catalog.related_product_ids(), [ '1', '2', '6' ])
+        self.assertEqual(catalog.related_product_ids('5'), [ '1', '2', '6' ])
+        self.assertEqual(catalog.related_product_ids('999'), [ '1', '2', '6' ])
+
+    def test_same_results_as_product_resolver(self):
+        products = make_products()
+        # Service order of categories and featured products differs from the order of all products
+        all_products = products_service(products)
+        reversed_products = products_service(list(reversed(products)))
+
+        def service(url, **kwargs):
+            return reversed_products(url) if '/category/' in url or '/featured' in url else all_products(url)
+
+        product_cache.clear()
+        self.addCleanup(product_cache.clear)
+
+        with patch('experimentation.resolvers.http_client.get', side_effect = service), \
+                patch('experimentation.catalog.http_client.get', side_effect = service):
+            product_resolver = ResolverFactory.create(ResolverFactory.TYPE_PRODUCT, products_service_host = 'products')
+            catalog_resolver = ResolverFactory.create(ResolverFactory.TYPE_CATALOG, products_service_host = 'products')
+
+            for product_id in [ None, '999' ] + [ p['id'] for p in products ]:
+                for num_results in [ 1, 5, 25 ]:
+                    self.assertEqual(catalog_resolver.get_items(product_id = product_id, num_results = num_results),
+                        product_resolver.get_items(product_id = product_id, num_results = num_results))
+
+            requests = [ { 'product_id': p['id'], 'num_results': 5 } for p in products ]
+            results, errors = catalog_resolver.get_items_batch(requests)
+            self.assertEqual(errors, {})
+            self.assertEqual(results, [ product_resolver.get_items(**request) for request in requests ])
+
+    def test_from_service_encodes_category_names(self):
+        products = [ { 'id': '1', 'category': 'home & garden/outdoor', 'featured': None }, { 'id': '2', 'category': 'tools', 'featured': None } ]
+
+        with patch('experimentation.catalog.http_client.get', side_effect = products_service(products)) as mocked_get:
+            catalog = Catalog.from_service('products')
+
+        mocked_get.assert_any_call('http://products:80/products/category/home%20%26%20garden%2Foutdoor')
+        self.assertEqual(catalog.categories['home & garden/outdoor'], ('1',))
+
+    def test_store_refresh(self):
+        catalogs = [ Catalog([ { 'id': '1', 'featured': 'true' } ]), Catalog([ { 'id': '2', 'featured': 'true' } ]) ]
+        loaded = threading.Event()
+
+        def loader():
+            catalog = catalogs.pop(0)
+            if not catalogs:
+                loaded.set()
+            return catalog
+
+        store = CatalogStore(loader, refresh_interval = 60)
+        with patch('experimentation.catalog.time.monotonic', return_value = 1000):
+            self.assertEqual(store.get().featured, ('1',))
+            self.assertEqual(store.get().featured, ('1',))
+
+        # Current catalog is served while the refreshed catalog loads
+        with patch('experimentation.catalog.time.monotonic', return_value = 1100):
+            self.assertEqual(store.get().featured, ('1',))
+            self.assertTrue(loaded.wait(5))
+
+            for i in range(100):
+                if store.get().featured == ('2',):
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(store.get().featured, ('2',))
+
+    def test_store_refresh_failure(self):
+        store = CatalogStore(MagicMock(side_effect = [ Catalog([ { 'id': '1' } ]), Exception('Unavailable') ]), refresh_interval = 60)
+        store.get()
+
+        store._refresh()
+        self.assertEqual(len(store.get()), 1)
+
+    def test_factory(self):
+        resolver = ResolverFactory.get(ResolverFactory.TYPE_CATALOG, catalog_file = 'products.yaml')
+        self.assertTrue(type(resolver) is CatalogProductResolver)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import MagicMock
+from experimentation.counters import CounterAggregator, read_variation_counts, migrate_to_sharded_counters
+
+"""
+python -m unittest experimentation/test_counters.py
+"""
+
+class TestCounterAggregator(unittest.TestCase):
+
+    def test_combined_update_per_experiment(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        aggregator = CounterAggregator(flush_interval = 60)
+
+        aggregator.increment(table, 'exp1', 0, 'exposures')
+        aggregator.increment(table, 'exp1', 0, 'exposures')
+        aggregator.increment(table, 'exp1', 1, 'conversions', 3)
+        aggregator.increment(table, 'exp2', 1, 'exposures')
+        self.assertEqual(aggregator.pending_count, 4)
+        table.update_item.assert_not_called()
+
+        aggregator.flush()
+        self.assertEqual(aggregator.pending_count, 0)
+        self.assertEqual(table.update_item.call_count, 2)
+
+        table.update_item.assert_any_call(
+            Key = {'id': 'exp1'},
+            UpdateExpression = 'SET variations[0].exposures = if_not_exists(variations[0].exposures, :zero) + :incr0, '
+                'variations[1].conversions = if_not_exists(variations[1].conversions, :zero) + :incr1',
+            ExpressionAttributeValues = { ':zero': 0, ':incr0': 2, ':incr1': 3 }
+        )
+
+    def test_failed_writes_are_retried(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        table.update_item.side_effect = Exception('Throttled')
+        aggregator = CounterAggregator(flush_interval = 60, max_attempts = 2)
+
+        aggregator.increment(table, 'exp1', 0, 'exposures')
+        aggregator.increment(table, 'exp1', 0, 'exposures')
+        aggregator.flush()
+        self.assertEqual(aggregator.pending_count, 2)
+
+        # Dropped once max_attempts is reached.
+        aggregator.flush()
+        self.assertEqual(aggregator.pending_count, 0)
+        self.assertEqual(table.update_item.call_count, 2)
+
+    def test_after_fork_drops_parent_pending(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        aggregator = CounterAggregator(flush_interval = 60)
+
+        aggregator.increment(table, 'exp1', 0, 'exposures')
+        aggregator.after_fork()
+        self.assertEqual(aggregator.pending_count, 0)
+
+        aggregator.increment(table, 'exp1', 1, 'exposures')
+        aggregator.flush()
+        table.update_item.assert_called_once()
+        self.assertIn('variations[1].exposures', table.update_item.call_args.kwargs['UpdateExpression'])
+
+    def test_write_through(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        aggregator = CounterAggregator(flush_interval = 0)
+
+        aggregator.increment(table, 'exp1', 0, 'exposures')
+        self.assertEqual(table.update_item.call_count, 1)
+        self.assertEqual(aggregator.pending_count, 0)
+
+    def test_increment_many_written_together(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        aggregator = CounterAggregator(flush_interval = 0)
+
+        aggregator.increment_many(table, 'exp1', [ (0, 'conversions', 2, None), (1, 'conversions', 1, None) ])
+
+        table.update_item.assert_called_once_with(
+            Key = {'id': 'exp1'},
+            UpdateExpression = 'SET variations[0].conversions = if_not_exists(variations[0].conversions, :zero) + :incr0, '
+                'variations[1].conversions = if_not_exists(variations[1].conversions, :zero) + :incr1',
+            ExpressionAttributeValues = { ':zero': 0, ':incr0': 2, ':incr1': 1 }
+        )
+
+    def test_sharded_writes(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        aggregator = CounterAggregator(flush_interval = 60)
+
+        aggregator.increment(table, 'exp1', 0, 'exposures', shard = 2)
+        aggregator.increment(table, 'exp1', 0, 'exposures', shard = 2)
+        aggregator.increment(table, 'exp1', 1, 'exposures', shard = 5)
+        aggregator.flush()
+
+        self.assertEqual(table.update_item.call_count, 2)
+        table.update_item.assert_any_call(
+            Key = {'id': 'exp1#counters#2'},
+            UpdateExpression = 'SET experiment_id = :experiment_id ADD v0_exposures :incr0',
+            ExpressionAttributeValues = { ':experiment_id': 'exp1', ':incr0': 2 }
+        )
+
+class TestShardedCounters(unittest.TestCase):
+
+    def test_read_sums_shards_and_inline_counts(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        table.meta.client.batch_get_item.return_value = {
+            'Responses': {
+                'ExperimentStrategy': [
+                    { 'id': { 'S': 'exp1' }, 'variations': { 'L': [
+                        { 'M': { 'exposures': { 'N': '10' }, 'conversions': { 'N': '1' } } },
+                        { 'M': { 'exposures': { 'N': '20' } } }
+                    ] } },
+                    { 'id': { 'S': 'exp1#counters#0' }, 'v0_exposures': { 'N': '5' }, 'v1_conversions': { 'N': '2' } },
+                    { 'id': { 'S': 'exp1#counters#1' }, 'v0_exposures': { 'N': '1' }, 'v1_exposures': { 'N': '3' } }
+                ]
+            }
+        }
+
+        counts = read_variation_counts(table, 'exp1', 2, shards = 2)
+
+        self.assertEqual(counts, [ { 'exposures': 16, 'conversions': 1 }, { 'exposures': 23, 'conversions': 2 } ])
+        request = table.meta.client.batch_get_item.call_args[1]['RequestItems']['ExperimentStrategy']
+        self.assertEqual([ key['id']['S'] for key in request['Keys'] ], [ 'exp1', 'exp1#counters#0', 'exp1#counters#1' ])
+
+    def test_read_inline_counts(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        table.get_item.return_value = { 'Item': { 'variations': [ { 'exposures': 4, 'conversions': 1 }, {} ] } }
+
+        counts = read_variation_counts(table, 'exp1', 2)
+        self.assertEqual(counts, [ { 'exposures': 4, 'conversions': 1 }, { 'exposures': 0, 'conversions': 0 } ])
+
+    def test_migration(self):
+        table = MagicMock(table_name = 'ExperimentStrategy')
+        migrate_to_sharded_counters(table, 'exp1', 8)
+
+        kwargs = table.update_item.call_args[1]
+        self.assertEqual(kwargs['Key'], { 'id': 'exp1' })
+        self.assertEqual(kwargs['ExpressionAttributeValues'][':shards'], 8)
+
+        with self.assertRaises(ValueError):
+            migrate_to_sharded_counters(table, 'exp1', 0)
@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import MagicMock
+from experimentation.discovery import ServiceDiscoveryCache
+
+"""
+python -m unittest experimentation/test_discovery.py
+"""
+
+def instances(*hosts):
+    return { 'Instances': [ { 'Attributes': { 'AWS_INSTANCE_IPV4': host } } for host in hosts ] }
+
+class TestServiceDiscoveryCache(unittest.TestCase):
+
+    def test_caches_and_rotates_instances(self):
+        client = MagicMock()
+        client.discover_instances.return_value = instances('10.0.0.1', '10.0.0.2')
+
+        discovery = ServiceDiscoveryCache(ttl = 60, client = client)
+        hosts = [ discovery.get_host('products') for i in range(4) ]
+
+        self.assertEqual(hosts, [ '10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.2' ])
+        self.assertEqual(client.discover_instances.call_count, 1)
+
+    def test_keeps_instances_when_discovery_fails(self):
+        client = MagicMock()
+        client.discover_instances.return_value = instances('10.0.0.1')
+
+        discovery = ServiceDiscoveryCache(ttl = 0, client = client)
+        self.assertEqual(discovery.get_host('products'), '10.0.0.1')
+
+        # Expired entry is refreshed in the background; failures keep the last good instances.
+        client.discover_instances.side_effect = Exception('Throttled')
+        entry = discovery._services['products']
+        discovery._refresh('products', entry)
+        self.assertEqual(discovery.get_hosts('products'), [ '10.0.0.1' ])
+
+        client.discover_instances.side_effect = None
+        client.discover_instances.return_value = instances()
+        discovery._refresh('products', entry)
+        self.assertEqual(discovery.get_hosts('products'), [ '10.0.0.1' ])
+
+        client.discover_instances.return_value = instances('10.0.0.3')
+        discovery._refresh('products', entry)
+        self.assertEqual(discovery.get_hosts('products'), [ '10.0.0.3' ])
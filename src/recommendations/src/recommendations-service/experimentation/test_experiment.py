@@ -5,12 +5,15 @@ import unittest
 import json
 import botocore
 import uuid
+import time
+import hashlib
 
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from experimentation.resolvers import ResolverFactory, Resolver, PersonalizeRecommendationsResolver, DefaultProductResolver
+from experimentation.concurrency import FanOut
 from experimentation.experiment import Variation
 from experimentation.experiment_manager import ExperimentManager
-from experimentation.experiment_ab import ABExperiment
+from experimentation.experiment_ab import ABExperiment, stream_variation_indexes
 from experimentation.experiment_interleaving import InterleavingExperiment
 from experimentation.experiment_mab import MultiArmedBanditExperiment
 
@@ -18,6 +21,16 @@ from experimentation.experiment_mab import MultiArmedBanditExperiment
 python -m unittest experimentation/test_experiment.py
 """
 
+class SlowResolver(Resolver):
+    """ Returns a fixed list of items after a delay """
+    def __init__(self, item_ids, delay = 0):
+        self.item_ids = item_ids
+        self.delay = delay
+
+    def get_items(self, **kwargs):
+        time.sleep(self.delay)
+        return [ { 'itemId': item_id } for item_id in self.item_ids ]
+
 class TestExperiments(unittest.TestCase):
     def test_ab_experiment(self):
         exp_config = {
@@ -105,3 +118,194 @@ class TestExperiments(unittest.TestCase):
         #print(f'Interleaved results: {results}')
 
         self.assertEqual(len(results), 5)
+
+    def test_interleaved_resolvers_run_concurrently(self):
+        exp_config = {
+            'id': uuid.uuid4().hex,
+            'feature': 'test-feature',
+            'name': 'test-interleaved-experiment',
+            'type': 'interleaving',
+            'status': 'ACTIVE',
+            'resolver_timeout': 0.5,
+            'variations': [{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            }]
+        }
+
+        experiment = InterleavingExperiment('ExperimentStrategy', **exp_config)
+        experiment.variations[0].resolver = SlowResolver([ 'a', 'b', 'c', 'd' ], delay = 0.1)
+        experiment.variations[1].resolver = SlowResolver([ 'e', 'f', 'g', 'h' ], delay = 0.1)
+        experiment.variations[2].resolver = SlowResolver([ 'x', 'y', 'z' ], delay = 2)
+
+        tracker = MagicMock()
+        with patch.object(experiment, '_increment_exposure_count') as increment:
+            start = time.perf_counter()
+            results = experiment.get_items('12', num_results = 4, tracker = tracker)
+            elapsed = time.perf_counter() - start
+
+        # Latency is bounded by the timeout rather than the sum of resolver latencies
+        self.assertLess(elapsed, 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(set(r['experiment']['variationIndex'] for r in results), { 0, 1 })
+        self.assertEqual(set(r['itemId'] for r in results), { 'a', 'b', 'e', 'f' })
+        self.assertEqual(sorted(call.args[0] for call in increment.call_args_list), [ 0, 1 ])
+
+        event = tracker.log_exposure.call_args.args[0]
+        self.assertEqual(event['attributes']['timeouts'], [ 2 ])
+        self.assertNotIn('failures', event['attributes'])
+
+    def test_interleaved_skips_resolver_with_calls_running(self):
+        exp_config = {
+            'id': uuid.uuid4().hex,
+            'feature': 'test-feature',
+            'name': 'test-interleaved-experiment',
+            'type': 'interleaving',
+            'status': 'ACTIVE',
+            'resolver_timeout': 0.1,
+            'variations': [{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            },{
+                'type': ResolverFactory.TYPE_PRODUCT,
+                'products_service_host': '10.10.10.10'
+            }]
+        }
+
+        experiment = InterleavingExperiment('ExperimentStrategy', **exp_config)
+        experiment.variations[0].resolver = SlowResolver([ 'a', 'b' ])
+        experiment.variations[1].resolver = SlowResolver([ 'e', 'f' ])
+        experiment.variations[2].resolver = SlowResolver([ 'x', 'y' ], delay = 1)
+
+        # Timed out calls of the slow resolver keep running; without a limit they would take
+        # every worker and the other resolvers would time out waiting for one
+        fan_out = FanOut(max_workers = 4)
+        tracker = MagicMock()
+        with patch('experimentation.experiment_interleaving.resolver_fan_out', fan_out), patch.object(experiment, '_increment_exposure_count'):
+            for i in range(6):
+                results = experiment.get_items('12', num_results = 4, tracker = tracker)
+                self.assertEqual(set(r['experiment']['variationIndex'] for r in results), { 0, 1 })
+
+                # Skipped calls are reported as timeouts
+                event = tracker.log_exposure.call_args.args[0]
+                self.assertEqual(event['attributes']['timeouts'], [ 2 ])
+
+        self.assertEqual(fan_out.in_flight(experiment.variations[2].resolver), 2)
+
+    def test_interleaved_team_draft_variation_indexes(self):
+        exp_config = {
+            'id': uuid.uuid4().hex,
+            'feature': 'test-feature',
+            'name': 'test-interleaved-experiment',
+            'type': 'interleaving',
+            'status': 'ACTIVE',
+            'method': InterleavingExperiment.METHOD_TEAM_DRAFT,
+            'variations': []
+        }
+
+        experiment = InterleavingExperiment('ExperimentStrategy', **exp_config)
+
+        list_of_item_lists = [ [ {'itemId':'a'}, {'itemId':'b'} ], [ {'itemId':'c'}, {'itemId':'d'} ] ]
+        results = experiment._interleave_team_draft('12', list_of_item_lists, 4, [ 1, 3 ])
+
+        self.assertEqual(len(results), 4)
+        for item in results:
+            self.assertEqual(item['experiment']['variationIndex'], 1 if item['itemId'] in ('a', 'b') else 3)
+
+    def test_ab_bulk_assignment_matches_original_bucketing(self):
+        for variation_count in [ 2, 3, 5, 7 ]:
+            exp_config = {
+                'id': uuid.uuid4().hex,
+                'feature': 'test-feature',
+                'name': f'test-ab-experiment-{variation_count}',
+                'type': 'ab',
+                'status': 'ACTIVE',
+                'variations': [ { 'type': ResolverFactory.TYPE_PRODUCT, 'products_service_host': '10.10.10.10' } ] * variation_count
+            }
+
+            experiment = ABExperiment('ExperimentStrategy', **exp_config)
+
+            user_ids = [ str(i) for i in range(5000) ] + [ uuid.uuid4().hex for i in range(1000) ] + [ 12, 345 ]
+            expected = [ int(hashlib.sha1(f'experiments.{experiment.feature}.{experiment.name}.{user_id}'.encode('ascii')).hexdigest()[:15], 16) % variation_count
+                for user_id in user_ids ]
+
+            self.assertEqual(experiment.calculate_variation_indexes(user_ids).tolist(), expected)
+            self.assertEqual([ experiment.calculate_variation_index(user_id) for user_id in user_ids ], expected)
+            # Repeat users are served from the cache with the same result
+            self.assertEqual([ experiment.calculate_variation_index(user_id) for user_id in user_ids[:100] ], expected[:100])
+
+            streamed = []
+            for chunk, indexes in stream_variation_indexes(experiment.feature, experiment.name, variation_count, iter(user_ids), chunk_size = 999):
+                self.assertLessEqual(len(chunk), 999)
+                streamed.extend(indexes.tolist())
+            self.assertEqual(streamed, expected)
+
+    def test_ab_get_items_batch(self):
+        exp_config = {
+            'id': 'exp1',
+            'feature': 'test-feature',
+            'name': 'test-ab-batch',
+            'type': 'ab',
+            'status': 'ACTIVE',
+            'variations': [ { 'type': ResolverFactory.TYPE_PRODUCT, 'products_service_host': '10.10.10.10' } ] * 3
+        }
+
+        experiment = ABExperiment('ExperimentStrategy', **exp_config)
+        for i, variation in enumerate(experiment.variations):
+            variation.resolver = SlowResolver([ f'v{i}' ])
+        tracker = MagicMock()
+
+        user_ids = [ f'user{i}' for i in range(30) ]
+        with patch('experimentation.experiment.counter_aggregator') as aggregator, \
+                patch.object(SlowResolver, 'get_items_batch', autospec = True, side_effect = Resolver.get_items_batch) as get_items_batch:
+            results, errors = experiment.get_items_batch([ { 'user_id': user_id, 'num_results': 5 } for user_id in user_ids ], tracker = tracker)
+
+        self.assertEqual(errors, {})
+        # One batch per variation
+        self.assertEqual(get_items_batch.call_count, 3)
+        for user_id, items in zip(user_ids, results):
+            variation_idx = experiment.calculate_variation_index(user_id)
+            self.assertEqual(items[0]['itemId'], f'v{variation_idx}')
+            self.assertEqual(items[0]['experiment']['variationIndex'], variation_idx)
+            self.assertEqual(items[0]['experiment']['correlationId'], f'exp1-{user_id}-{variation_idx}-1')
+
+        self.assertEqual(aggregator.increment.call_count, len(user_ids))
+        self.assertEqual(tracker.log_exposure.call_count, len(user_ids))
+
+        with self.assertRaises(Exception):
+            experiment.get_items_batch([ { 'user_id': None } ])
+
+    def test_track_conversions(self):
+        exp_config = {
+            'id': 'exp1',
+            'feature': 'test-feature',
+            'name': 'test-ab-experiment',
+            'type': 'ab',
+            'status': 'ACTIVE',
+            'variations': [ { 'type': ResolverFactory.TYPE_PRODUCT, 'products_service_host': '10.10.10.10' } ] * 2
+        }
+
+        experiment = ABExperiment('ExperimentStrategy', **exp_config)
+        tracker = MagicMock()
+
+        with patch('experimentation.experiment.counter_aggregator') as aggregator:
+            experiment.track_conversions([ ('u1', 0, 1), ('u2', 1, 2), ('u3', 0, 4) ], tracker = tracker)
+
+        aggregator.increment_many.assert_called_once_with('ExperimentStrategy', 'exp1', [ (0, 'conversions', 2, None), (1, 'conversions', 1, None) ])
+
+        events = tracker.log_outcomes.call_args.args[0]
+        self.assertEqual([ e['attributes']['correlation_id'] for e in events ], [ 'exp1-u1-0-1', 'exp1-u2-1-2', 'exp1-u3-0-4' ])
+        self.assertEqual(events[0]['event_type'], 'Experiment Outcome')
+
+        with self.assertRaises(Exception):
+            experiment.track_conversions([ ('u1', 2, 1) ])
+
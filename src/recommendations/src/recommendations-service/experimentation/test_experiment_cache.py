@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+import unittest
+
+from unittest.mock import MagicMock, patch
+from experimentation.experiment_cache import ExperimentCache
+
+"""
+python -m unittest experimentation/test_experiment_cache.py
+"""
+
+class TestExperimentCache(unittest.TestCase):
+
+    def test_revalidates_with_signature(self):
+        with patch('experimentation.experiment_cache.time.monotonic') as mocked_time:
+            mocked_time.return_value = 100
+
+            experiment = MagicMock(uses_variation_counts = False)
+            load = MagicMock(return_value = (experiment, ('exp1', 'ACTIVE', 'None')))
+            check = MagicMock(return_value = ('exp1', 'ACTIVE', 'None'))
+
+            cache = ExperimentCache(ttl = 10, max_age = 100, background = False)
+
+            self.assertIs(cache.get('feature', load, check), experiment)
+            self.assertIs(cache.get('feature', load, check), experiment)
+            self.assertEqual(load.call_count, 1)
+            check.assert_not_called()
+
+            # Unchanged signature after the TTL keeps the compiled experiment.
+            mocked_time.return_value = 111
+            self.assertIs(cache.get('feature', load, check), experiment)
+            self.assertEqual(check.call_count, 1)
+            self.assertEqual(load.call_count, 1)
+
+            # Changed signature reloads the experiment.
+            new_experiment = MagicMock(uses_variation_counts = False)
+            check.return_value = ('exp2', 'ACTIVE', 'None')
+            load.return_value = (new_experiment, ('exp2', 'ACTIVE', 'None'))
+            mocked_time.return_value = 122
+            self.assertIs(cache.get('feature', load, check), new_experiment)
+            self.assertEqual(load.call_count, 2)
+
+    def test_refreshes_counts(self):
+        with patch('experimentation.experiment_cache.time.monotonic') as mocked_time:
+            mocked_time.return_value = 100
+
+            experiment = MagicMock(uses_variation_counts = True)
+            load = MagicMock(return_value = (experiment, 'sig'))
+            check = MagicMock(return_value = 'sig')
+
+            cache = ExperimentCache(ttl = 30, max_age = 300, counts_interval = 5, background = False)
+            cache.get('feature', load, check)
+
+            mocked_time.return_value = 106
+            cache.get('feature', load, check)
+            self.assertEqual(experiment.refresh_counts.call_count, 1)
+            check.assert_not_called()
+
+    def test_caches_missing_experiment(self):
+        load = MagicMock(return_value = (None, 'NONE'))
+        cache = ExperimentCache(background = False)
+
+        self.assertIsNone(cache.get('feature', load, MagicMock()))
+        self.assertIsNone(cache.get('feature', load, MagicMock()))
+        self.assertEqual(load.call_count, 1)
+
+    def test_missing_experiments_expire(self):
+        with patch('experimentation.experiment_cache.time.monotonic') as mocked_time:
+            mocked_time.return_value = 100
+
+            load = MagicMock(return_value = (None, 'NONE'))
+            check = MagicMock(return_value = 'NONE')
+            cache = ExperimentCache(ttl = 30, negative_ttl = 60, background = False)
+            cache.get('unknown', load, check)
+
+            # A key that keeps being looked up is revalidated and kept.
+            mocked_time.return_value = 140
+            self.assertIsNone(cache.get('unknown', load, check))
+            self.assertEqual(check.call_count, 1)
+            mocked_time.return_value = 190
+            self.assertIsNone(cache.get('unknown', load, check))
+            self.assertEqual(load.call_count, 1)
+
+            # Otherwise it is dropped after negative_ttl.
+            mocked_time.return_value = 300
+            self.assertIsNone(cache.get('unknown', load, check))
+            self.assertEqual(load.call_count, 2)
+
+    def test_size_is_bounded(self):
+        load = MagicMock(return_value = (None, 'NONE'))
+        cache = ExperimentCache(max_size = 10, background = False)
+
+        for i in range(100):
+            cache.get(('id', str(i)), load, MagicMock())
+
+        self.assertEqual(cache.stats()['size'], 10)
+
+    def test_slow_load_does_not_block_other_keys(self):
+        loading = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_load():
+            loading.set()
+            release.wait()
+            return None, 'NONE'
+
+        experiment = MagicMock(uses_variation_counts = False)
+        cache = ExperimentCache(background = False)
+
+        thread = threading.Thread(target = cache.get, args = ('slow', slow_load, MagicMock()))
+        thread.start()
+        loading.wait(5)
+
+        self.assertIs(cache.get('fast', MagicMock(return_value = (experiment, 'sig')), MagicMock()), experiment)
+
+        release.set()
+        thread.join(5)
+        self.assertIsNone(cache.get('slow', MagicMock(), MagicMock()))
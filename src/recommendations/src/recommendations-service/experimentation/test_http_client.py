@@ -0,0 +1,105 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import threading
+import requests
+
+from unittest.mock import patch, MagicMock
+from experimentation.http_client import HttpClient, HostBusyError
+
+"""
+python -m unittest experimentation/test_http_client.py
+"""
+
+def make_response(status_code):
+    response = MagicMock()
+    response.status_code = status_code
+    response.ok = status_code < 400
+    return response
+
+class TestHttpClient(unittest.TestCase):
+
+    def test_timeouts(self):
+        client = HttpClient(connect_timeout = 1, read_timeout = 3)
+        with patch.object(client._session, 'request', return_value = make_response(200)) as mocked_request:
+            client.get('http://server.com/path')
+            mocked_request.assert_called_with('GET', 'http://server.com/path', timeout = (1, 3))
+
+            client.get('http://server.com/path', read_timeout = 0.5, params = { 'a': 1 })
+            mocked_request.assert_called_with('GET', 'http://server.com/path', timeout = (1, 0.5), params = { 'a': 1 })
+
+    def test_retries(self):
+        client = HttpClient(retries = 2, backoff = 0.001)
+        with patch.object(client._session, 'request', side_effect = [ requests.ConnectTimeout(), make_response(503), make_response(200) ]) as mocked_request:
+            response = client.get('http://server.com/path')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mocked_request.call_count, 3)
+
+        # Retries are exhausted so the last error is raised
+        with patch.object(client._session, 'request', side_effect = requests.ConnectionError()) as mocked_request:
+            with self.assertRaises(requests.ConnectionError):
+                client.get('http://server.com/path')
+            self.assertEqual(mocked_request.call_count, 3)
+
+        # Read timeouts are not retried
+        with patch.object(client._session, 'request', side_effect = requests.ReadTimeout()) as mocked_request:
+            with self.assertRaises(requests.ReadTimeout):
+                client.get('http://server.com/path')
+            self.assertEqual(mocked_request.call_count, 1)
+
+        # Client errors and non-idempotent requests are not retried
+        with patch.object(client._session, 'request', return_value = make_response(404)) as mocked_request:
+            self.assertEqual(client.get('http://server.com/path').status_code, 404)
+            self.assertEqual(mocked_request.call_count, 1)
+
+        with patch.object(client._session, 'request', return_value = make_response(503)) as mocked_request:
+            self.assertEqual(client.request('POST', 'http://server.com/path').status_code, 503)
+            self.assertEqual(mocked_request.call_count, 1)
+
+        metrics = client.metrics()['server.com']
+        self.assertEqual(metrics['requests'], 9)
+        self.assertEqual(metrics['retries'], 4)
+        self.assertEqual(metrics['timeouts'], 2)
+        self.assertEqual(metrics['errors'], 7)
+        self.assertIsNotNone(metrics['latencyP99Ms'])
+
+    def test_max_in_flight(self):
+        client = HttpClient(max_in_flight = 1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_request(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return make_response(200)
+
+        with patch.object(client._session, 'request', side_effect = slow_request):
+            thread = threading.Thread(target = client.get, args = ('http://slow.com/path',))
+            thread.start()
+            self.assertTrue(started.wait(5))
+
+            with self.assertRaises(HostBusyError):
+                client.get('http://slow.com/path')
+
+            release.set()
+            thread.join(5)
+
+            # Limit is per host and released once requests complete
+            self.assertEqual(client.get('http://slow.com/path').status_code, 200)
+
+        metrics = client.metrics()['slow.com']
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['inFlight'], 0)
+
+    def test_session_per_process(self):
+        client = HttpClient()
+        session = client._session
+        self.assertIs(client._session, session)
+
+        # A forked process gets its own connection pool
+        with patch('experimentation.http_client.os.getpid', return_value = -1):
+            self.assertIsNot(client._session, session)
+
+if __name__ == '__main__':
+    unittest.main()
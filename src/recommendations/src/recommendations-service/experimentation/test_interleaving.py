@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import random
+import unittest
+
+from experimentation import interleaving
+from benchmarks.bench_interleaving import legacy_balanced, legacy_team_draft, make_rankings
+
+"""
+python -m unittest experimentation/test_interleaving.py
+"""
+
+def item_ids(picks):
+    return [ (ranking_idx, item['itemId']) for ranking_idx, item in picks ]
+
+class TestInterleaving(unittest.TestCase):
+
+    def test_same_results_as_original_methods(self):
+        for method, legacy in [ (interleaving.balanced, legacy_balanced), (interleaving.team_draft, legacy_team_draft) ]:
+            for seed in range(50):
+                rng = random.Random(seed)
+                rankings = make_rankings(rng.randint(2, 6), rng.randint(1, 40), rng)
+                count = rng.randint(1, 30)
+
+                expected = legacy(rankings, count, random.Random(seed))
+                actual = method(rankings, count, random.Random(seed))
+                self.assertEqual(item_ids(actual), item_ids(expected), f'{method.__name__} seed {seed}')
+
+    def test_multileave_and_probabilistic(self):
+        for method in [ interleaving.multileave, interleaving.probabilistic ]:
+            for seed in range(20):
+                rng = random.Random(seed)
+                rankings = make_rankings(rng.randint(2, 8), rng.randint(1, 40), rng)
+                count = rng.randint(1, 30)
+
+                picks = method(rankings, count, random.Random(seed))
+                ids = [ item['itemId'] for ranking_idx, item in picks ]
+
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(len(ids), min(count, len(set(i['itemId'] for ranking in rankings for i in ranking))))
+                for ranking_idx, item in picks:
+                    self.assertIn(item, rankings[ranking_idx])
+
+                # Reproducible with the same seed
+                self.assertEqual(item_ids(method(rankings, count, random.Random(seed))), item_ids(picks))
+
+    def test_multileave_keeps_ranking_order(self):
+        rankings = make_rankings(4, 20, random.Random(1))
+        picks = interleaving.multileave(rankings, 10, random.Random(1))
+
+        # Each ranking contributes its items in ranking order
+        for ranking_idx, ranking in enumerate(rankings):
+            positions = [ ranking.index(item) for idx, item in picks if idx == ranking_idx ]
+            self.assertEqual(positions, sorted(positions))
+
+    def test_probabilistic_favors_top_ranks(self):
+        rankings = [ [ { 'itemId': str(i) } for i in range(20) ] ]
+        first = [ interleaving.probabilistic(rankings, 1, random.Random(seed))[0][1]['itemId'] for seed in range(200) ]
+        self.assertGreater(first.count('0'), first.count('1'))
+        self.assertGreater(first.count('1'), first.count('5'))
+
+if __name__ == '__main__':
+    unittest.main()
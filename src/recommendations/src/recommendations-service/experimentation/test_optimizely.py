@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from experimentation import experiment_optimizely
+from experimentation.experiment_optimizely import get_snapshot
+
+"""
+python -m unittest experimentation/test_optimizely.py
+"""
+
+def make_config(revision):
+    experiment = SimpleNamespace(id = '1234')
+    return SimpleNamespace(revision = revision, features_map = {
+        'home_product_recs': SimpleNamespace(experiments_map = { 'home_test': experiment }),
+        'product_detail_related': SimpleNamespace(experiments_map = {})
+    })
+
+class TestOptimizelySnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.sdk = MagicMock(is_valid = True)
+        self.revision = '1'
+        self.sdk.config_manager.get_config.side_effect = lambda: SimpleNamespace(revision = self.revision)
+        self.sdk.get_optimizely_config.side_effect = lambda: make_config(self.revision)
+
+        patcher = patch.object(experiment_optimizely, 'optimizely_sdk', self.sdk)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        experiment_optimizely._snapshot = None
+
+    def test_snapshot_per_revision(self):
+        snapshot = get_snapshot()
+        self.assertIs(get_snapshot(), snapshot)
+        self.assertEqual(self.sdk.get_optimizely_config.call_count, 1)
+
+        test = snapshot.get_test('home_product_recs')
+        self.assertEqual(test.name, 'home_test')
+        self.assertEqual(test.id, '1234')
+        self.assertIs(snapshot.get_test('home_product_recs'), test)
+        self.assertIsNone(snapshot.get_test('product_detail_related'))
+
+        self.revision = '2'
+        new_snapshot = get_snapshot()
+        self.assertIsNot(new_snapshot, snapshot)
+        self.assertEqual(new_snapshot.revision, '2')
+        self.assertEqual(self.sdk.get_optimizely_config.call_count, 2)
+
+    def test_resolvers_cached_by_config(self):
+        snapshot = get_snapshot()
+
+        resolver = snapshot.get_resolver('product', { 'products_service_host': '10.10.10.10', 'products_service_port': 80 })
+        self.assertIs(snapshot.get_resolver('product', { 'products_service_port': 80, 'products_service_host': '10.10.10.10' }), resolver)
+        self.assertIsNot(snapshot.get_resolver('product', { 'products_service_host': '10.10.10.11' }), resolver)
+
+    def test_get_items(self):
+        self.sdk.get_feature_variable_string.return_value = 'product'
+        self.sdk.get_feature_variable_json.return_value = { 'products_service_host': '10.10.10.10' }
+        self.sdk.get_variation.return_value = 'variation_1'
+
+        test = get_snapshot().get_test('home_product_recs')
+        with patch('experimentation.resolvers.DefaultProductResolver.get_items', side_effect = lambda **kwargs: [ { 'itemId': '1' }, { 'itemId': '2' } ]):
+            items = test.get_items('12')
+            test.get_items('13')
+
+        self.assertEqual(items[1]['experiment']['correlationId'], '1234-12-variation_1-2')
+        self.assertEqual(items[1]['experiment']['revision_number'], '1')
+        self.assertEqual(len(get_snapshot()._resolvers), 1)
+        self.assertEqual(self.sdk.get_optimizely_config.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
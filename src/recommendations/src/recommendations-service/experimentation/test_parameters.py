@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import json
+import os
+import tempfile
+
+from unittest.mock import MagicMock
+from experimentation.parameters import ParameterStore
+
+"""
+python -m unittest experimentation/test_parameters.py
+"""
+
+class TestParameterStore(unittest.TestCase):
+
+    def test_batched_load(self):
+        client = MagicMock()
+        client.get_parameters.return_value = {
+            'Parameters': [
+                { 'Name': 'campaign-arn', 'Value': 'arn:campaign' },
+                { 'Name': 'filter-arn', 'Value': 'NONE' }
+            ],
+            'InvalidParameters': [ 'stream-name' ]
+        }
+
+        store = ParameterStore(names = [ 'campaign-arn', 'filter-arn', 'stream-name' ], client = client)
+
+        self.assertEqual(store.get_values([ 'campaign-arn', 'filter-arn' ]), [ 'arn:campaign', None ])
+        self.assertIsNone(store.get_value('stream-name'))
+        self.assertEqual(store.get_value('campaign-arn'), 'arn:campaign')
+
+        # All known parameters are loaded with a single call and then served from memory.
+        self.assertEqual(client.get_parameters.call_count, 1)
+        client.get_parameters.assert_called_with(Names = [ 'campaign-arn', 'filter-arn', 'stream-name' ])
+
+    def test_offline_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_file = os.path.join(tmp_dir, 'parameters.json')
+            with open(snapshot_file, 'w') as f:
+                json.dump({ 'campaign-arn': 'arn:campaign', 'filter-arn': 'NONE' }, f)
+
+            client = MagicMock()
+            store = ParameterStore(names = [], refresh_interval = 0, snapshot_file = snapshot_file, client = client)
+
+            self.assertEqual(store.get_values([ 'campaign-arn', 'filter-arn', 'unknown' ]), [ 'arn:campaign', None, None ])
+            client.get_parameters.assert_not_called()
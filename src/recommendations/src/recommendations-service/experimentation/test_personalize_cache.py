@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import threading
+
+from unittest.mock import patch
+from experimentation.personalize_cache import PersonalizeResultCache
+
+"""
+python -m unittest experimentation/test_personalize_cache.py
+"""
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [ { 'itemId': str(self.calls) } ]
+
+class TestPersonalizeResultCache(unittest.TestCase):
+
+    def test_fresh_and_stale(self):
+        cache = PersonalizeResultCache(ttl = 10, stale_ttl = 100, refresh_workers = 1)
+        loader = Loader()
+
+        with patch('experimentation.personalize_cache.time.monotonic', return_value = 1000):
+            self.assertEqual(cache.get('key', loader, user_id = 'u1'), [ { 'itemId': '1' } ])
+            self.assertEqual(cache.get('key', loader, user_id = 'u1'), [ { 'itemId': '1' } ])
+            self.assertEqual(loader.calls, 1)
+
+        # Stale result is served while it is refreshed in the background
+        with patch('experimentation.personalize_cache.time.monotonic', return_value = 1020):
+            self.assertEqual(cache.get('key', loader, user_id = 'u1'), [ { 'itemId': '1' } ])
+            cache._refresh_pool.executor.submit(lambda: None).result(5)
+            self.assertEqual(loader.calls, 2)
+            self.assertEqual(cache.get('key', loader, user_id = 'u1'), [ { 'itemId': '2' } ])
+
+        # Expired result is reloaded by the caller
+        with patch('experimentation.personalize_cache.time.monotonic', return_value = 2000):
+            self.assertEqual(cache.get('key', loader, user_id = 'u1'), [ { 'itemId': '3' } ])
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['staleHits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['refreshes'], 1)
+
+    def test_invalidate_user(self):
+        cache = PersonalizeResultCache(ttl = 10)
+        loader = Loader()
+
+        cache.get(('recommendations', 'u1'), loader, user_id = 'u1')
+        cache.get(('ranking', 'u1'), loader, user_id = 'u1')
+        cache.get(('recommendations', 'u2'), loader, user_id = 'u2')
+        self.assertEqual(len(cache), 3)
+
+        cache.invalidate_user('u1')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(('recommendations', 'u1'), loader, user_id = 'u1'), [ { 'itemId': '4' } ])
+        self.assertEqual(cache.get(('recommendations', 'u2'), loader, user_id = 'u2'), [ { 'itemId': '3' } ])
+
+    def test_invalidate_during_refresh(self):
+        cache = PersonalizeResultCache(ttl = 10, stale_ttl = 100, refresh_workers = 1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_loader():
+            started.set()
+            release.wait(5)
+            return [ { 'itemId': 'refreshed' } ]
+
+        with patch('experimentation.personalize_cache.time.monotonic', return_value = 1000):
+            cache.get('key', lambda: [ { 'itemId': 'original' } ], user_id = 'u1')
+
+        with patch('experimentation.personalize_cache.time.monotonic', return_value = 1020):
+            self.assertEqual(cache.get('key', slow_loader, user_id = 'u1'), [ { 'itemId': 'original' } ])
+            self.assertTrue(started.wait(5))
+            cache.invalidate_user('u1')
+            release.set()
+            cache._refresh_pool.executor.submit(lambda: None).result(5)
+
+        # Refreshed result predates the invalidation so it was discarded
+        self.assertEqual(len(cache), 0)
+
+    def test_max_size(self):
+        cache = PersonalizeResultCache(max_size = 2, ttl = 10)
+        loader = Loader()
+
+        cache.get('a', loader, user_id = 'u1')
+        cache.get('b', loader, user_id = 'u2')
+        cache.get('a', loader, user_id = 'u1')
+        cache.get('c', loader, user_id = 'u3')
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # Least recently used entry was evicted
+        cache.get('b', loader, user_id = 'u2')
+        self.assertEqual(loader.calls, 4)
+
+    def test_disabled(self):
+        cache = PersonalizeResultCache(ttl = 0)
+        loader = Loader()
+
+        cache.get('key', loader)
+        cache.get('key', loader)
+        self.assertEqual(loader.calls, 2)
+        self.assertEqual(len(cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
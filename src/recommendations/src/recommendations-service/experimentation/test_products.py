@@ -0,0 +1,67 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+
+from unittest.mock import patch, MagicMock
+from experimentation.cache import LRUCache, NOT_FOUND
+from experimentation.products import ProductHydrator, product_cache_key
+
+"""
+python -m unittest experimentation/test_products.py
+"""
+
+def mock_product_response(url, timeout = None):
+    product_id = url.split('/products/id/')[1].split('?')[0]
+    response = MagicMock()
+    response.ok = product_id != '404'
+    response.status_code = 200 if response.ok else 404
+    response.reason = 'OK' if response.ok else 'Not Found'
+    response.json.return_value = { 'id': product_id, 'url': f'http://localhost/#/product/{product_id}' }
+    return response
+
+class TestProductHydrator(unittest.TestCase):
+
+    def test_hydrate_preserves_order(self):
+        hydrator = ProductHydrator(max_workers = 4, cache = LRUCache())
+        with patch.object(hydrator._session, 'get', side_effect = mock_product_response):
+            items = [ { 'itemId': str(i) } for i in range(20) ]
+            failures = hydrator.hydrate(items, '10.10.10.10', 80)
+
+            self.assertEqual(failures, [])
+            self.assertEqual([ item['product']['id'] for item in items ], [ str(i) for i in range(20) ])
+
+    def test_hydrate_reports_failures(self):
+        hydrator = ProductHydrator(max_workers = 4, cache = LRUCache())
+        with patch.object(hydrator._session, 'get', side_effect = mock_product_response):
+            items = [ { 'itemId': '1' }, { 'itemId': '404' }, { 'itemId': '3' } ]
+            failures = hydrator.hydrate(items, '10.10.10.10', 80)
+
+            self.assertEqual(len(failures), 1)
+            self.assertEqual(failures[0]['itemId'], '404')
+            self.assertTrue('product' in items[0])
+            self.assertFalse('product' in items[1])
+            self.assertTrue('product' in items[2])
+
+    def test_hydrate_reads_through_cache(self):
+        cache = LRUCache()
+        hydrator = ProductHydrator(max_workers = 4, cache = cache)
+        with patch.object(hydrator._session, 'get', side_effect = mock_product_response) as mocked_get:
+            hydrator.hydrate([ { 'itemId': '1' }, { 'itemId': '404' } ], '10.10.10.10', 80)
+            self.assertEqual(mocked_get.call_count, 2)
+            self.assertIs(cache.get(product_cache_key('404')), NOT_FOUND)
+
+            # Second pass is served entirely from the cache, including the negative entry.
+            items = [ { 'itemId': '1' }, { 'itemId': '404' } ]
+            failures = hydrator.hydrate(items, '10.10.10.10', 80)
+            self.assertEqual(mocked_get.call_count, 2)
+            self.assertEqual(items[0]['product']['id'], '1')
+            self.assertEqual(len(failures), 1)
+
+            # Separate entries are kept for fully qualified image URLs.
+            hydrator.hydrate([ { 'itemId': '1' } ], '10.10.10.10', 80, fully_qualify_image_urls = True)
+            self.assertEqual(mocked_get.call_count, 3)
+
+            # Callers get a copy of the cached product.
+            items[0]['product']['url'] = 'changed'
+            self.assertNotEqual(cache.get(product_cache_key('1'))['url'], 'changed')
@@ -5,15 +5,38 @@ import unittest
 import json
 import botocore
 import logging
+import time
 
-from unittest.mock import patch
-from experimentation.resolvers import (ResolverFactory, HttpResolver, DefaultProductResolver, PersonalizeRecommendationsResolver, 
-    SearchSimilarProductsResolver, PersonalizeRankingResolver, RankingProductsNoOpResolver)
+from unittest.mock import patch, MagicMock
+from experimentation.concurrency import fallback_fan_out, FanOut
+from experimentation.personalize_cache import PersonalizeResultCache
+from experimentation.resolvers import (Resolver, ResolverFactory, HttpResolver, DefaultProductResolver, PersonalizeRecommendationsResolver, 
+    SearchSimilarProductsResolver, PersonalizeRankingResolver, RankingProductsNoOpResolver, EnsembleResolver, FallbackChainResolver)
 
 """
 python -m unittest experimentation/test_resolvers.py
 """
 
+class StaticResolver(Resolver):
+    """ Returns a fixed list of items (with optional scores) after a delay or raises if error is set """
+    def __init__(self, **params):
+        self.item_ids = params.get('item_ids', [])
+        self.scores = params.get('scores')
+        self.delay = params.get('delay', 0)
+        self.error = params.get('error')
+
+    def get_items(self, **kwargs):
+        time.sleep(self.delay)
+        if self.error:
+            raise Exception(self.error)
+        items = [ { 'itemId': item_id } for item_id in self.item_ids[:kwargs.get('num_results', 10)] ]
+        if self.scores:
+            for item, score in zip(items, self.scores):
+                item['score'] = score
+        return items
+
+ResolverFactory.register_resolver('test-static', StaticResolver)
+
 class TestResolvers(unittest.TestCase):
 
     def test_factory(self):
@@ -38,8 +61,26 @@ class TestResolvers(unittest.TestCase):
         with self.assertRaises(ValueError):
             ResolverFactory.get('bogus')
 
+    def test_factory_pool(self):
+        ResolverFactory.clear_pool()
+
+        resolver = ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = '10.10.10.10', products_service_port = 80)
+        self.assertIs(ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_port = 80, products_service_host = '10.10.10.10'), resolver)
+        # Variation counters are not part of the resolver configuration
+        self.assertIs(ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = '10.10.10.10', products_service_port = 80, exposures = 5), resolver)
+
+        self.assertIsNot(ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = '10.10.10.11', products_service_port = 80), resolver)
+        self.assertIsNot(ResolverFactory.create(ResolverFactory.TYPE_PRODUCT, products_service_host = '10.10.10.10', products_service_port = 80), resolver)
+        self.assertEqual(ResolverFactory.pool_size(), 2)
+
+        with patch.object(ResolverFactory, 'max_pool_size', 2):
+            ResolverFactory.get(ResolverFactory.TYPE_HTTP, base_url = 'http://server.com/path')
+            self.assertEqual(ResolverFactory.pool_size(), 2)
+            # Least recently used resolver was evicted
+            self.assertIsNot(ResolverFactory.get(ResolverFactory.TYPE_PRODUCT, products_service_host = '10.10.10.10', products_service_port = 80), resolver)
+
     def test_http_resolver(self):
-        with patch('experimentation.resolvers.requests.get') as mocked_get:
+        with patch('experimentation.resolvers.http_client.get') as mocked_get:
             mocked_get.return_value.ok = True
             mocked_get.return_value.json.return_value = [{'id':'1'},{'id':'2'},{'id':'3'},{'id':'4'} ]
 
@@ -53,8 +94,45 @@ class TestResolvers(unittest.TestCase):
 
             mocked_get.assert_called_with('http://server.com/path?userId=1&numResults=10')
 
+    def test_http_resolver_batch(self):
+        with patch('experimentation.resolvers.http_client.request') as mocked_request:
+            mocked_request.side_effect = lambda method, url, json, **kwargs: MagicMock(ok = True,
+                json = MagicMock(return_value = [ [ { 'id': request['userId'] }, { 'id': 'x' } ] for request in json['requests'] ]))
+
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_HTTP, base_url = 'http://server.com/path', batch_url = 'http://server.com/batch', batch_size = 2)
+            results, errors = resolver.get_items_batch([ { 'user_id': str(i), 'num_results': 1 } for i in range(5) ])
+
+            self.assertEqual(errors, {})
+            self.assertEqual(results, [ [ { 'itemId': str(i) } ] for i in range(5) ])
+            # Chunks of batch_size requests
+            self.assertEqual(mocked_request.call_count, 3)
+            mocked_request.assert_any_call('POST', 'http://server.com/batch', json = { 'requests': [ { 'userId': '4', 'numResults': 1 } ] })
+
+    def test_get_items_batch(self):
+        resolver = StaticResolver(item_ids = [ 'a', 'b' ], delay = 0.05)
+        requests = [ { 'num_results': i % 3 } for i in range(8) ]
+
+        start = time.monotonic()
+        results, errors = resolver.get_items_batch(requests, max_concurrency = 4)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(errors, {})
+        self.assertEqual(results, [ resolver.get_items(**request) for request in requests ])
+        # Two rounds of four concurrent requests
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.35)
+
+        results, errors = StaticResolver(error = 'Unavailable').get_items_batch(requests[:2])
+        self.assertEqual(results, [ None, None ])
+        self.assertEqual(str(errors[1]), 'Unavailable')
+
+        # Resolvers that answer from memory fail requests individually
+        results, errors = ResolverFactory.get(ResolverFactory.TYPE_RANKING_NO_OP).get_items_batch([ { 'product_list': [ '1' ] }, {} ])
+        self.assertEqual(results, [ [ { 'itemId': '1' } ], None ])
+        self.assertEqual(list(errors), [ 1 ])
+
     def test_product_resolver(self):
-        with patch('experimentation.resolvers.requests.get') as mocked_get:
+        with patch('experimentation.resolvers.http_client.get') as mocked_get:
             mocked_get.return_value.ok = True
             mocked_get.return_value.json.return_value = [{'id':'1'},{'id':'2'},{'id':'3'},{'id':'4'} ]
 
@@ -63,7 +141,7 @@ class TestResolvers(unittest.TestCase):
             self.assertEqual(len(items), 4)
 
     def test_similar_resolver(self):
-        with patch('experimentation.resolvers.requests.get') as mocked_get:
+        with patch('experimentation.resolvers.http_client.get') as mocked_get:
             mocked_get.return_value.ok = True
             mocked_get.return_value.json.return_value = [{'itemId':'1'},{'itemId':'2'},{'itemId':'3'},{'itemId':'4'} ]
 
@@ -77,6 +155,137 @@ class TestResolvers(unittest.TestCase):
 
             mocked_get.assert_called_with('http://10.10.10.10:8000/similar/products?productId=100')
 
+    def test_ensemble_resolver(self):
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_ENSEMBLE, name = 'test-ensemble', timeout = 0.5, resolvers = [
+            { 'type': 'test-static', 'name': 'a', 'item_ids': [ '1', '2', '3', '4' ] },
+            { 'type': 'test-static', 'name': 'b', 'item_ids': [ '3', '5', '1' ], 'weight': 2 },
+            { 'type': 'test-static', 'name': 'slow', 'item_ids': [ '9' ], 'delay': 1, 'timeout': 0.1 },
+            { 'type': 'test-static', 'name': 'broken', 'error': 'Unavailable' }
+        ])
+        self.assertTrue(type(resolver) is EnsembleResolver)
+
+        start = time.monotonic()
+        items = resolver.get_items(user_id = '1', num_results = 4)
+        # Only waits for the slow child until its own deadline
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        # Reciprocal rank fusion: 3 = 1/63 + 2/61, 1 = 1/61 + 2/63, 5 = 2/62, 2 = 1/62
+        self.assertEqual([ item['itemId'] for item in items ], [ '3', '1', '5', '2' ])
+
+        metrics = resolver.metrics()
+        self.assertEqual(metrics['a']['contributed'], 3)
+        self.assertEqual(metrics['b']['contributed'], 3)
+        self.assertEqual(metrics['slow']['timeouts'], 1)
+        self.assertEqual(metrics['broken']['errors'], 1)
+        self.assertIsNotNone(metrics['a']['latencyP50Ms'])
+        self.assertIn('test-ensemble', EnsembleResolver.all_metrics())
+
+    def test_ensemble_resolver_weighted(self):
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_ENSEMBLE, fusion = 'weighted', resolvers = [
+            { 'type': 'test-static', 'item_ids': [ '1', '2' ], 'scores': [ 0.2, 0.1 ] },
+            { 'type': 'test-static', 'item_ids': [ '2', '3', '4', '1' ] }
+        ])
+
+        # Scores are normalized by the top score, ranks as (n - rank + 1) / n: 1 = 1 + 0.25, 2 = 0.5 + 1, 3 = 0.75, 4 = 0.5
+        items = resolver.get_items(user_id = '1')
+        self.assertEqual(items, [ { 'itemId': '2' }, { 'itemId': '1' }, { 'itemId': '3' }, { 'itemId': '4' } ])
+
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_ENSEMBLE, resolvers = [ { 'type': 'test-static', 'error': 'Unavailable' } ])
+        with self.assertRaises(Exception):
+            resolver.get_items(user_id = '1')
+
+        with self.assertRaises(ValueError):
+            ResolverFactory.create(ResolverFactory.TYPE_ENSEMBLE, fusion = 'bogus', resolvers = [ { 'type': 'test-static' } ])
+
+    def test_ensemble_resolver_skips_child_with_calls_running(self):
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_ENSEMBLE, resolvers = [
+            { 'type': 'test-static', 'name': 'slow', 'item_ids': [ '9' ], 'delay': 1, 'timeout': 0.02 },
+            { 'type': 'test-static', 'name': 'fast', 'item_ids': [ '1' ], 'timeout': 0.2 }
+        ])
+
+        # Timed out calls of the slow child keep running; without a cap they would take
+        # every worker and the fast child would time out waiting for one
+        with patch('experimentation.resolvers.ensemble_fan_out', FanOut(max_workers = 4)):
+            for i in range(6):
+                self.assertEqual(resolver.get_items(user_id = '1'), [ { 'itemId': '1' } ])
+
+        metrics = resolver.metrics()
+        self.assertEqual(metrics['slow']['timeouts'], 2)
+        self.assertEqual(metrics['slow']['skipped'], 4)
+        self.assertEqual(metrics['fast']['timeouts'], 0)
+
+    def test_fallback_resolver(self):
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, name = 'test-fallback', budget = 0.3, hedge_after = 0.05, min_samples = 3, resolvers = [
+            { 'type': 'test-static', 'name': 'primary', 'item_ids': [ '1' ] },
+            { 'type': 'test-static', 'name': 'secondary', 'item_ids': [ '2' ] }
+        ])
+        self.assertTrue(type(resolver) is FallbackChainResolver)
+
+        for i in range(3):
+            self.assertEqual(resolver.resolve(user_id = '1'), ([ { 'itemId': '1' } ], 'primary'))
+
+        metrics = resolver.metrics()
+        self.assertEqual(metrics['primary']['wins'], 3)
+        self.assertEqual(metrics['secondary']['calls'], 0)
+        # Hedge delay now follows the primary's latency
+        self.assertLess(metrics['primary']['hedgePercentileMs'], 50)
+        self.assertIn('test-fallback', FallbackChainResolver.all_metrics())
+
+    def test_fallback_resolver_hedging(self):
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, budget = 0.3, hedge_after = 0.05, resolvers = [
+            { 'type': 'test-static', 'name': 'primary', 'item_ids': [ '1' ], 'delay': 1 },
+            { 'type': 'test-static', 'name': 'secondary', 'item_ids': [ '2' ] }
+        ])
+
+        start = time.monotonic()
+        self.assertEqual(resolver.get_items(user_id = '1'), [ { 'itemId': '2' } ])
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(resolver.metrics()['secondary']['hedges'], 1)
+
+        # Failed resolvers hand over to the next one without waiting
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, budget = 0.3, hedge_after = 0.2, resolvers = [
+            { 'type': 'test-static', 'name': 'primary', 'error': 'Unavailable' },
+            { 'type': 'test-static', 'name': 'secondary', 'item_ids': [ '2' ] }
+        ])
+
+        start = time.monotonic()
+        self.assertEqual(resolver.resolve(user_id = '1'), ([ { 'itemId': '2' } ], 'secondary'))
+        self.assertLess(time.monotonic() - start, 0.15)
+
+        # Nothing answers within the budget
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, budget = 0.1, resolvers = [
+            { 'type': 'test-static', 'item_ids': [ '1' ], 'delay': 1 },
+            { 'type': 'test-static', 'item_ids': [ '2' ], 'delay': 1 }
+        ])
+
+        start = time.monotonic()
+        self.assertEqual(resolver.resolve(user_id = '1'), ([], None))
+        self.assertLess(time.monotonic() - start, 0.3)
+
+        # The last resort answers when nothing else does in time
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, budget = 0.1, resolvers = [
+            { 'type': 'test-static', 'item_ids': [ '1' ], 'delay': 1 },
+            { 'type': 'test-static', 'item_ids': [ '2' ], 'error': 'Unavailable' }
+        ], last_resort = { 'type': 'test-static', 'name': 'local', 'item_ids': [ '3' ] })
+
+        self.assertEqual(resolver.resolve(user_id = '1'), ([ { 'itemId': '3' } ], 'local'))
+        self.assertEqual(resolver.metrics()['local']['wins'], 1)
+
+    def test_fallback_resolver_skips_hedge_when_pool_busy(self):
+        resolver = ResolverFactory.create(ResolverFactory.TYPE_FALLBACK, budget = 0.3, hedge_after = 0.05, resolvers = [
+            { 'type': 'test-static', 'name': 'primary', 'item_ids': [ '1' ], 'delay': 0.1 },
+            { 'type': 'test-static', 'name': 'secondary', 'item_ids': [ '2' ] }
+        ])
+
+        # With a single worker busy with the primary, the hedge would only queue behind it
+        fallback_fan_out.executor
+        with patch.object(fallback_fan_out, 'max_workers', 1):
+            self.assertEqual(resolver.resolve(user_id = '1'), ([ { 'itemId': '1' } ], 'primary'))
+
+        metrics = resolver.metrics()
+        self.assertEqual(metrics['secondary']['hedgesSkipped'], 1)
+        self.assertEqual(metrics['secondary']['calls'], 0)
+
     def test_personalize_recommendations_resolver(self):
         orig = botocore.client.BaseClient._make_api_call
 
@@ -93,6 +302,30 @@ class TestResolvers(unittest.TestCase):
             self.assertEqual(items[0]['itemId'], '1')
             self.assertEqual(items[1]['itemId'], '2')
 
+    def test_personalize_recommendations_cache(self):
+        calls = []
+
+        def mock_make_api_call(self, operation_name, kwarg):
+            calls.append(kwarg)
+            return {'itemList': [{'itemId': '1'}, {'itemId': '2'}]}
+
+        with patch('botocore.client.BaseClient._make_api_call', new=mock_make_api_call), \
+                patch('experimentation.resolvers.personalize_cache', PersonalizeResultCache(ttl = 30)) as cache:
+            resolver = ResolverFactory.get(ResolverFactory.TYPE_PERSONALIZE_RECOMMENDATIONS, campaign_arn = 'my_campaign_arn')
+            items = resolver.get_items(user_id = '12', num_results = 20)
+            items[0]['experiment'] = {}
+
+            # Cached result is reused and is not affected by changes to returned items
+            self.assertEqual(resolver.get_items(user_id = '12', num_results = 20), [{'itemId': '1'}, {'itemId': '2'}])
+            self.assertEqual(len(calls), 1)
+
+            resolver.get_items(user_id = '12', num_results = 10)
+            self.assertEqual(len(calls), 2)
+
+            cache.invalidate_user('12')
+            resolver.get_items(user_id = '12', num_results = 20)
+            self.assertEqual(len(calls), 3)
+
     def test_personalize_ranking_resolver(self):
         orig = botocore.client.BaseClient._make_api_call
 
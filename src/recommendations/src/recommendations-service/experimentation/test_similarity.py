@@ -0,0 +1,88 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import unittest
+import tempfile
+import numpy as np
+
+from experimentation.similarity import SimilarityTable, build_vectors, top_k_similar, overlap
+from experimentation.resolvers import ResolverFactory, PrecomputedSimilarProductsResolver
+
+"""
+python -m unittest experimentation/test_similarity.py
+"""
+
+PRODUCTS = [
+    { 'id': '1', 'name': 'Black Leather Backpack', 'category': 'accessories', 'style': 'bag', 'description': 'Handmade leather backpack for the office.' },
+    { 'id': '2', 'name': 'Brown Leather Backpack', 'category': 'accessories', 'style': 'bag', 'description': 'A leather backpack for travel.' },
+    { 'id': '3', 'name': 'Leather Belt', 'category': 'accessories', 'style': 'belt', 'description': 'Classic leather belt.' },
+    { 'id': '4', 'name': 'Running Shoes', 'category': 'footwear', 'style': 'sneaker', 'description': 'Lightweight running shoes.' },
+    { 'id': '5', 'name': 'Trail Running Shoes', 'category': 'footwear', 'style': 'sneaker', 'description': 'Running shoes with extra grip.' },
+    { 'id': '6', 'name': 'Gift Card' }
+]
+
+class TestSimilarity(unittest.TestCase):
+
+    def test_vectors(self):
+        vectors = build_vectors(PRODUCTS)
+        # Sparse when SciPy is installed
+        if hasattr(vectors, 'toarray'):
+            vectors = vectors.toarray()
+        self.assertEqual(vectors.shape[0], len(PRODUCTS))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis = 1), 1.0, rtol = 1e-5)
+
+    def test_top_k(self):
+        table = SimilarityTable.build(PRODUCTS, k = 3)
+        self.assertEqual(table.k, 3)
+
+        self.assertEqual(table.similar('1', 1), [ '2' ])
+        self.assertEqual(table.similar('4', 1), [ '5' ])
+        self.assertEqual(table.similar('2'), [ '1', '3' ])
+        # Products with no terms in common are not similar
+        self.assertEqual(table.similar('6'), [])
+        self.assertEqual(table.similar('999'), [])
+
+        for product in PRODUCTS:
+            self.assertNotIn(product['id'], table.similar(product['id']))
+
+    def test_blocks(self):
+        rng = np.random.default_rng(1)
+        matrix = rng.random((50, 20)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis = 1, keepdims = True)
+
+        neighbors, scores = top_k_similar(matrix, k = 5, block_size = 7)
+
+        similarities = matrix @ matrix.T
+        np.fill_diagonal(similarities, -1)
+        expected = np.argsort(-similarities, axis = 1)[:, :5]
+        np.testing.assert_array_equal(neighbors, expected)
+        self.assertTrue(np.all(np.diff(scores, axis = 1) <= 0))
+
+    def test_save_load(self):
+        table = SimilarityTable.build(PRODUCTS, k = 3)
+        with tempfile.TemporaryDirectory() as directory:
+            table.save(directory)
+            loaded = SimilarityTable.load(directory)
+            self.assertIsInstance(loaded.neighbors, np.memmap)
+            for product in PRODUCTS:
+                self.assertEqual(loaded.similar(product['id']), table.similar(product['id']))
+
+            resolver = ResolverFactory.create(ResolverFactory.TYPE_SIMILAR_PRECOMPUTED, table_path = directory)
+            self.assertTrue(type(resolver) is PrecomputedSimilarProductsResolver)
+            self.assertEqual(resolver.get_items(product_id = '1', num_results = 2), [ { 'itemId': '2' }, { 'itemId': '3' } ])
+            with self.assertRaises(Exception):
+                resolver.get_items()
+
+            results, errors = resolver.get_items_batch([ { 'product_id': '1', 'num_results': 2 }, {}, { 'product_id': '4', 'num_results': 1 } ])
+            self.assertEqual(results, [ [ { 'itemId': '2' }, { 'itemId': '3' } ], None, [ { 'itemId': '5' } ] ])
+            self.assertEqual(list(errors), [ 1 ])
+
+    def test_overlap(self):
+        table = SimilarityTable.build(PRODUCTS, k = 3)
+        report = overlap(table, { '1': [ '2', '3' ], '4': [ '3', '5' ], '6': [] }, k = 2)
+        self.assertEqual(report['products'], 2)
+        self.assertEqual(report['meanOverlap'], 0.75)
+        self.assertEqual(report['sameFirst'], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import threading
+import unittest
+
+from unittest.mock import MagicMock
+from experimentation.tracking import BufferedKinesisTracker, PUT_RECORDS_MAX_RECORDS
+
+"""
+python -m unittest experimentation/test_tracking.py
+"""
+
+def make_event(user_id, name = 'exp1'):
+    return { 'attributes': { 'user_id': user_id, 'experiment': { 'name': name } } }
+
+def put_records_ok(StreamName, Records):
+    return { 'FailedRecordCount': 0, 'Records': [ { 'SequenceNumber': '1', 'ShardId': 'shard-0' } for r in Records ] }
+
+class TestBufferedKinesisTracker(unittest.TestCase):
+
+    def test_events_are_batched(self):
+        client = MagicMock()
+        client.put_records.side_effect = put_records_ok
+        tracker = BufferedKinesisTracker('exposures', 'outcomes', client = client)
+
+        for i in range(PUT_RECORDS_MAX_RECORDS + 10):
+            tracker.log_exposure(make_event(i))
+        tracker.log_outcome(make_event(1))
+        tracker.flush()
+
+        client.put_record.assert_not_called()
+        self.assertEqual(tracker.stats()['sent'], PUT_RECORDS_MAX_RECORDS + 11)
+
+        for call in client.put_records.call_args_list:
+            self.assertLessEqual(len(call.kwargs['Records']), PUT_RECORDS_MAX_RECORDS)
+
+        streams = [ call.kwargs['StreamName'] for call in client.put_records.call_args_list ]
+        self.assertIn('outcomes', streams)
+
+        record = client.put_records.call_args_list[0].kwargs['Records'][0]
+        self.assertEqual(record['PartitionKey'], 'exp10')
+        self.assertEqual(json.loads(record['Data']), make_event(0))
+
+    def test_only_failed_records_are_retried(self):
+        calls = []
+        def put_records(StreamName, Records):
+            calls.append([ json.loads(r['Data'])['attributes']['user_id'] for r in Records ])
+            if len(calls) == 1:
+                return { 'FailedRecordCount': 1, 'Records': [
+                    { 'SequenceNumber': '1', 'ShardId': 'shard-0' },
+                    { 'ErrorCode': 'ProvisionedThroughputExceededException', 'ErrorMessage': 'Throttled' },
+                    { 'SequenceNumber': '2', 'ShardId': 'shard-0' }
+                ]}
+            return put_records_ok(StreamName, Records)
+
+        client = MagicMock()
+        client.put_records.side_effect = put_records
+        tracker = BufferedKinesisTracker('exposures', 'outcomes', backoff = 0, client = client)
+
+        # Hold the sender until all events are queued so they go in one batch.
+        release = threading.Event()
+        tracker._next_records_original = tracker._next_records
+        tracker._next_records = lambda records_queue: release.wait() and tracker._next_records_original(records_queue)
+
+        for i in range(3):
+            tracker.log_exposure(make_event(i))
+        release.set()
+        tracker.flush()
+
+        self.assertEqual(calls, [ [ 0, 1, 2 ], [ 1 ] ])
+        self.assertEqual(tracker.stats()['sent'], 3)
+        self.assertEqual(tracker.stats()['retried'], 1)
+
+    def test_gives_up_after_max_attempts(self):
+        client = MagicMock()
+        client.put_records.side_effect = Exception('Unavailable')
+        tracker = BufferedKinesisTracker('exposures', 'outcomes', max_attempts = 3, backoff = 0, client = client)
+
+        tracker.log_exposure(make_event(1))
+        tracker.flush()
+
+        self.assertEqual(client.put_records.call_count, 3)
+        self.assertEqual(tracker.stats()['failed'], 1)
+        self.assertEqual(tracker.stats()['sent'], 0)
+
+    def test_events_dropped_when_buffer_full(self):
+        release = threading.Event()
+        def put_records(StreamName, Records):
+            release.wait()
+            return put_records_ok(StreamName, Records)
+
+        client = MagicMock()
+        client.put_records.side_effect = put_records
+        tracker = BufferedKinesisTracker('exposures', 'outcomes', max_buffer = 2, linger = 0, client = client)
+        self.addCleanup(release.set)
+
+        for i in range(10):
+            tracker.log_exposure(make_event(i))
+
+        # At most one batch in flight plus a full buffer; everything else is dropped.
+        self.assertGreaterEqual(tracker.stats()['dropped'], 6)
+        self.assertFalse(tracker.flush(timeout = 0.01))
+
+        release.set()
+        tracker.flush()
+        self.assertEqual(tracker.stats()['sent'] + tracker.stats()['dropped'], 10)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_after_fork_drops_parent_buffer(self):
+        sending = threading.Event()
+        release = threading.Event()
+        def put_records(StreamName, Records):
+            sending.set()
+            release.wait()
+            return put_records_ok(StreamName, Records)
+
+        client = MagicMock()
+        client.put_records.side_effect = put_records
+        tracker = BufferedKinesisTracker('exposures', 'outcomes', linger = 0, client = client)
+        self.addCleanup(release.set)
+
+        # Event 0 is in flight and events 1-4 are buffered when the process forks
+        tracker.log_exposure(make_event(0))
+        sending.wait(5)
+        for i in range(1, 5):
+            tracker.log_exposure(make_event(i))
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                calls_before_fork = len(client.put_records.call_args_list)
+                tracker.after_fork()
+                buffered = tracker.stats()['buffered']
+                release.set()
+                tracker.log_exposure(make_event(10))
+                flushed = tracker.flush(timeout = 5)
+                sent = [ json.loads(r['Data'])['attributes']['user_id']
+                    for call in client.put_records.call_args_list[calls_before_fork:] for r in call.kwargs['Records'] ]
+                os.write(write_fd, json.dumps({ 'buffered': buffered, 'flushed': flushed, 'sent': sent }).encode('utf-8'))
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            child = json.loads(f.read())
+        os.waitpid(pid, 0)
+
+        # The child sends only its own events; the parent's buffer is left to the parent.
+        self.assertEqual(child, { 'buffered': 0, 'flushed': True, 'sent': [ 10 ] })
+
+        release.set()
+        self.assertTrue(tracker.flush(timeout = 5))
+        self.assertEqual(tracker.stats()['sent'], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,33 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 
+import os
 import json
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
 import boto3
 
 from abc import ABC, abstractmethod
 from experimentation.utils import CompatEncoder
 
+log = logging.getLogger(__name__)
+
 kinesis = boto3.client('kinesis')
 
+# Kinesis PutRecords limits
+PUT_RECORDS_MAX_RECORDS = 500
+PUT_RECORDS_MAX_BYTES = 5 * 1024 * 1024
+RECORD_MAX_BYTES = 1024 * 1024
+
+def after_fork():
+    """ Recreates the shared Kinesis client in a forked child process (boto3 clients are not fork-safe) """
+    global kinesis
+    kinesis = boto3.client('kinesis')
+
 class Tracker(ABC):
     """ Base class for tracking detailed exposure and outcome/conversion events """
     @abstractmethod
@@ -19,6 +38,11 @@ class Tracker(ABC):
     def log_outcome(self, event):
         pass
 
+    def log_outcomes(self, events):
+        """ Logs several outcome events; trackers can override this to send them together """
+        for event in events:
+            self.log_outcome(event)
+
 class KinesisTracker(Tracker):
     """ Tracker that writes exposure and outcome events to Kinesis streams
 
@@ -53,4 +77,227 @@ class KinesisTracker(Tracker):
             Data=json.dumps(event, cls=CompatEncoder),
             PartitionKey=f'{experiment_name}{user_id}'
         )
-    
\ No newline at end of file
+
+    def log_outcomes(self, events):
+        for i in range(0, len(events), PUT_RECORDS_MAX_RECORDS):
+            records = []
+            for event in events[i:i + PUT_RECORDS_MAX_RECORDS]:
+                user_id = event['attributes']['user_id']
+                experiment_name = event['attributes']['experiment']['name']
+                records.append({
+                    'Data': json.dumps(event, cls=CompatEncoder),
+                    'PartitionKey': f'{experiment_name}{user_id}'
+                })
+
+            response = kinesis.put_records(StreamName=self.outcome_stream_name, Records=records)
+            if response.get('FailedRecordCount'):
+                log.warning(f'KinesisTracker - {response["FailedRecordCount"]} outcome events were not written to {self.outcome_stream_name}')
+
+class BufferedKinesisTracker(Tracker):
+    """ Tracker that buffers exposure and outcome events and writes them to Kinesis in batches
+
+    Events are queued in memory and sent by a background thread with put_records
+    in batches of up to 500 records / 5 MB, so tracking is no longer part of the
+    request latency. Records that Kinesis fails to ingest (e.g. due to throttling)
+    are retried with jittered exponential backoff up to max_attempts times.
+
+    When the buffer is full, events are either dropped immediately (FULL_POLICY_DROP)
+    or the caller waits up to block_timeout seconds for space (FULL_POLICY_BLOCK)
+    before the event is dropped. Counters of sent, failed and dropped events are
+    available from stats(). Buffered events are flushed when the process exits,
+    waiting at most close_timeout seconds.
+    """
+    FULL_POLICY_DROP = 'drop'
+    FULL_POLICY_BLOCK = 'block'
+
+    def __init__(self, exposure_stream_name, outcome_stream_name, max_buffer = 10000, full_policy = FULL_POLICY_DROP,
+            block_timeout = 0.1, linger = 0.05, max_attempts = 5, backoff = 0.1, close_timeout = 10, client = None):
+        self.exposure_stream_name = exposure_stream_name
+        self.outcome_stream_name = outcome_stream_name
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.close_timeout = close_timeout
+        self._client = client if client is not None else kinesis
+        self._own_client = client is None
+
+        self._queue = queue.Queue(maxsize = max_buffer)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # Updated from request threads and the sender thread; see _count
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+
+        atexit.register(self.close)
+
+    def log_exposure(self, event):
+        self._enqueue(self.exposure_stream_name, event)
+
+    def log_outcome(self, event):
+        self._enqueue(self.outcome_stream_name, event)
+
+    def stats(self):
+        """ Returns a dictionary of tracker counters """
+        with self._stats_lock:
+            return {
+                'buffered': self._queue.qsize(),
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'retried': self.retried
+            }
+
+    def flush(self, timeout = None):
+        """ Blocks until all buffered events have been sent (or failed) or timeout seconds pass
+
+        Returns True if the buffer was flushed.
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return self._queue.unfinished_tasks == 0
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        """ Flushes buffered events; called automatically at process exit """
+        if not self.flush(self.close_timeout):
+            log.error(f'BufferedKinesisTracker - unable to flush {self._queue.unfinished_tasks} events before exit')
+
+    def after_fork(self):
+        """ Resets process-specific state in a forked child process
+
+        Events buffered by the parent are dropped from the child's copy of the
+        buffer since the parent sends them. The boto3 client is recreated.
+        """
+        self._queue = queue.Queue(maxsize = self._queue.maxsize)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.sent = self.failed = self.dropped = self.retried = 0
+        if self._own_client:
+            self._client = boto3.client('kinesis')
+
+    def _enqueue(self, stream_name, event):
+        user_id = event['attributes']['user_id']
+        experiment_name = event['attributes']['experiment']['name']
+
+        data = json.dumps(event, cls=CompatEncoder).encode('utf-8')
+        partition_key = f'{experiment_name}{user_id}'
+
+        if len(data) + len(partition_key) > RECORD_MAX_BYTES:
+            log.error(f'BufferedKinesisTracker - dropping event of {len(data)} bytes which exceeds the Kinesis record limit')
+            self._count('dropped')
+            return
+
+        self._ensure_sender()
+
+        try:
+            if self.full_policy == BufferedKinesisTracker.FULL_POLICY_BLOCK:
+                self._queue.put((stream_name, data, partition_key), timeout = self.block_timeout)
+            else:
+                self._queue.put_nowait((stream_name, data, partition_key))
+        except queue.Full:
+            self._count('dropped')
+            log.debug('BufferedKinesisTracker - buffer is full, dropping event')
+
+    def _count(self, name, count = 1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def _ensure_sender(self):
+        # Threads do not survive a fork so the sender is (re)started lazily in each process.
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    # The sender keeps to the queue it was started with (see after_fork)
+                    self._thread = threading.Thread(target = self._run, args = (self._queue,), name = 'kinesis-tracker', daemon = True)
+                    self._thread.start()
+
+    def _run(self, records_queue):
+        while True:
+            records = self._next_records(records_queue)
+            try:
+                for stream_name, batch in self._batches(records):
+                    self._send(stream_name, batch)
+            except Exception:
+                log.exception('BufferedKinesisTracker - unexpected error sending events')
+            finally:
+                for i in range(len(records)):
+                    records_queue.task_done()
+
+    def _next_records(self, records_queue):
+        """ Waits for the next record and then collects more for up to linger seconds """
+        records = [ records_queue.get() ]
+        deadline = time.monotonic() + self.linger
+
+        while len(records) < PUT_RECORDS_MAX_RECORDS:
+            try:
+                timeout = deadline - time.monotonic()
+                records.append(records_queue.get(timeout = timeout) if timeout > 0 else records_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return records
+
+    def _batches(self, records):
+        """ Groups records by stream into batches within the PutRecords limits """
+        by_stream = {}
+        for stream_name, data, partition_key in records:
+            by_stream.setdefault(stream_name, []).append((data, partition_key))
+
+        for stream_name, stream_records in by_stream.items():
+            batch = []
+            batch_bytes = 0
+            for data, partition_key in stream_records:
+                record_bytes = len(data) + len(partition_key)
+                if batch and (len(batch) >= PUT_RECORDS_MAX_RECORDS or batch_bytes + record_bytes > PUT_RECORDS_MAX_BYTES):
+                    yield stream_name, batch
+                    batch = []
+                    batch_bytes = 0
+                batch.append((data, partition_key))
+                batch_bytes += record_bytes
+            if batch:
+                yield stream_name, batch
+
+    def _send(self, stream_name, batch):
+        """ Sends a batch with put_records, retrying only the records that failed """
+        attempt = 0
+        while batch:
+            try:
+                response = self._client.put_records(
+                    StreamName=stream_name,
+                    Records=[ { 'Data': data, 'PartitionKey': partition_key } for data, partition_key in batch ]
+                )
+                failed = [ record for record, result in zip(batch, response['Records']) if result.get('ErrorCode') ]
+            except Exception as e:
+                log.warning(f'BufferedKinesisTracker - error calling put_records for {stream_name}: {e}')
+                failed = batch
+
+            self._count('sent', len(batch) - len(failed))
+            attempt += 1
+
+            if failed and attempt >= self.max_attempts:
+                log.error(f'BufferedKinesisTracker - giving up on {len(failed)} events for {stream_name} after {attempt} attempts')
+                self._count('failed', len(failed))
+                break
+
+            if failed:
+                self._count('retried', len(failed))
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+            batch = failed
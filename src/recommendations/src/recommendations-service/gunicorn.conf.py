@@ -0,0 +1,50 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Gunicorn configuration for the Recommendations service
+
+gunicorn --config gunicorn.conf.py wsgi:app
+
+Settings can be overridden with the environment variables below (or gunicorn's
+own GUNICORN_CMD_ARGS). Send HUP to the master to gracefully replace all workers
+and TERM for a graceful shutdown; workers finish in-flight requests within
+graceful_timeout. Pending experiment counts and tracking events are flushed
+when a worker exits.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 80)}"
+
+# Requests mostly wait on Personalize, DynamoDB and the Products service so each
+# worker process serves several requests at once on threads.
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Import and warm up the app (wsgi.py) once in the master before forking workers.
+# Thread pools and HTTP connections are recreated lazily in each worker and AWS
+# clients are recreated by post_fork below. Note that HUP does not reload the
+# application code of a preloaded app; restart the service (or disable preloading)
+# to deploy new code.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in [ 'true', 't', '1' ]
+
+# Recycle workers after a number of requests to bound memory growth. Jitter keeps
+# workers from restarting at the same time.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+def post_fork(server, worker):
+    # boto3 clients and background refresh state created while warming up in the
+    # master must not be shared with workers (see app.after_fork).
+    if server.cfg.preload_app:
+        from app import after_fork
+        after_fork()
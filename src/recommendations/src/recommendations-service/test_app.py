@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import app
+
+"""
+python -m unittest test_app.py
+"""
+
+def hydrate(items, *args):
+    for item in items:
+        item['product'] = { 'id': item['itemId'], 'url': f'http://shop/{item["itemId"]}' }
+    return []
+
+class TestRecommendationsBatch(unittest.TestCase):
+
+    def post_batch(self, results, errors = {}):
+        resolver = MagicMock()
+        resolver.get_items_batch.return_value = (results, errors)
+
+        with patch('app.get_products_service', return_value = ('products', 80)), \
+                patch('app.get_parameter_values', return_value = [ None, None ]), \
+                patch('app.ResolverFactory.get', return_value = resolver), \
+                patch('app.product_hydrator.hydrate', side_effect = hydrate):
+            response = app.app.test_client().post('/recommendations/batch', json = { 'users': [ str(i) for i in range(len(results)) ] })
+            self.assertEqual(response.status_code, 200)
+            return [ json.loads(line) for line in response.get_data(as_text = True).splitlines() ]
+
+    def test_line_per_user(self):
+        lines = self.post_batch([ [ { 'itemId': '1' } ], None, [ { 'itemId': '2' } ] ], errors = { 1: Exception('Unavailable') })
+
+        self.assertEqual([ line['userID'] for line in lines ], [ '0', '1', '2' ])
+        self.assertEqual(lines[0]['items'], [ { 'product': { 'id': '1', 'url': 'http://shop/1' } } ])
+        self.assertEqual(lines[1]['status'], 'error')
+        self.assertEqual(lines[2]['status'], 'ok')
+
+    def test_resolver_returning_none(self):
+        lines = self.post_batch([ None, [ { 'itemId': '1' } ] ])
+
+        self.assertEqual(lines[0], { 'userID': '0', 'status': 'ok', 'items': [] })
+        self.assertEqual(lines[1]['status'], 'ok')
+
+class TestRecipeCache(unittest.TestCase):
+
+    def setUp(self):
+        app.invalidate_recipes()
+        self.addCleanup(app.invalidate_recipes)
+
+    def mock_personalize(self, recipes):
+        """ Returns a mocked Personalize client that serves the recipes of campaigns in recipes """
+        personalize = MagicMock()
+        personalize.describe_campaign.side_effect = lambda campaignArn: { 'campaign': { 'solutionVersionArn': f'{campaignArn}/solution' } } if campaignArn in recipes else {}
+        personalize.describe_solution_version.side_effect = lambda solutionVersionArn: { 'solutionVersion': { 'recipeArn': recipes[solutionVersionArn[:-len('/solution')]] } }
+        return patch('app.personalize', personalize)
+
+    def test_recipe_cached(self):
+        with self.mock_personalize({ 'campaign-a': 'recipe-a' }) as personalize:
+            self.assertEqual(app.get_recipe('campaign-a'), 'recipe-a')
+            self.assertEqual(app.get_recipe('campaign-a'), 'recipe-a')
+
+            personalize.describe_campaign.assert_called_once_with(campaignArn = 'campaign-a')
+            personalize.describe_solution_version.assert_called_once_with(solutionVersionArn = 'campaign-a/solution')
+
+    def test_missing_recipe_cached_until_negative_ttl(self):
+        with self.mock_personalize({}) as personalize, patch('experimentation.cache.time.monotonic', return_value = 1000):
+            self.assertIsNone(app.get_recipe('campaign-a'))
+            self.assertIsNone(app.get_recipe('campaign-a'))
+            self.assertEqual(personalize.describe_campaign.call_count, 1)
+
+        with self.mock_personalize({ 'campaign-a': 'recipe-a' }) as personalize, \
+                patch('experimentation.cache.time.monotonic', return_value = 1000 + app.recipe_cache.negative_ttl):
+            self.assertEqual(app.get_recipe('campaign-a'), 'recipe-a')
+            self.assertEqual(personalize.describe_campaign.call_count, 1)
+
+    def test_invalidate(self):
+        client = app.app.test_client()
+        with self.mock_personalize({ 'campaign-a': 'recipe-a', 'campaign-b': 'recipe-b' }) as personalize:
+            app.get_recipe('campaign-a')
+            app.get_recipe('campaign-b')
+
+            # A single campaign
+            self.assertEqual(client.post('/recipes/invalidate', json = { 'campaignArn': 'campaign-a' }).status_code, 200)
+            app.get_recipe('campaign-a')
+            app.get_recipe('campaign-b')
+            self.assertEqual([ call.kwargs['campaignArn'] for call in personalize.describe_campaign.call_args_list ], [ 'campaign-a', 'campaign-b', 'campaign-a' ])
+
+            # All campaigns
+            self.assertEqual(client.post('/recipes/invalidate').status_code, 200)
+            app.get_recipe('campaign-a')
+            app.get_recipe('campaign-b')
+            self.assertEqual(personalize.describe_campaign.call_count, 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+""" Production WSGI entry point for the Recommendations service
+
+gunicorn --config gunicorn.conf.py wsgi:app
+
+The app's shared state is warmed up on import so that, with preload_app (see
+gunicorn.conf.py), it is loaded once in the master process and inherited by
+every worker.
+"""
+
+import logging
+
+from app import app, warm_up
+
+logging.basicConfig(level = logging.INFO)
+
+warm_up()